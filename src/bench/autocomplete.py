@@ -0,0 +1,142 @@
+"""
+Jukebox autocomplete through JukeboxIndex against the original linear scan, at 100k files and up.
+
+Builds a jukebox folder of empty .json files spread over subfolders, then times one autocomplete
+lookup per query for a mix of queries the way users type them:
+- empty: the first keystroke, listing folders and top-level files
+- prefix: the start of a file name
+- word: a word from the middle of a name
+- fuzzy: a misspelt word, which only the trigram index can match
+- miss: text no name contains
+
+The baseline does what the original autocomplete did: a startswith scan over every file, falling back
+to a substring scan of every folder and file. The target is well under a millisecond per lookup so
+autocomplete keeps up with typing. Everything runs in a temporary directory.
+
+Usage (from src/):
+    python -m bench.autocomplete                       # 100k files
+    python -m bench.autocomplete --files 10000 100000 250000 --json autocomplete.json
+"""
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from bench.common import percentiles, write_report, note
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+from core.jukebox_index import JukeboxIndex, MAX_RESULTS
+
+WORDS = (
+    "night", "drive", "summer", "echo", "river", "neon", "ghost", "velvet", "storm", "paper",
+    "golden", "shadow", "ocean", "fire", "glass", "dream", "city", "lights", "heart", "wild",
+)
+TAGS = ("", " (remix)", " (live)", " (acoustic)", " (extended mix)")
+
+def make_names(count: int, folders: int, rng: random.Random) -> list[str]:
+    names = set()
+    while len(names) < count:
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 4)))
+        name = f"{title} {len(names)}{rng.choice(TAGS)}.json"
+        folder = rng.randrange(folders + 1)
+        # Folder 0 stands for the top level
+        names.add(name if folder == 0 else f"folder {folder:03d}/{name}")
+    return sorted(names)
+
+def write_tree(root: str, names: list[str]):
+    for name in names:
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "w").close()
+
+def make_queries(names: list[str], count: int, rng: random.Random) -> dict[str, list[str]]:
+    def word():
+        return rng.choice(WORDS)
+    def typo(w):
+        i = rng.randrange(len(w))
+        return w[:i] + w[i + 1:]
+    basenames = [n.rsplit('/', 1)[-1] for n in names]
+    return {
+        'empty': [""] * count,
+        'prefix': [rng.choice(basenames)[:rng.randint(3, 10)] for _ in range(count)],
+        'word': [word()[:rng.randint(3, 6)] for _ in range(count)],
+        'fuzzy': [f"{typo(word())} {typo(word())}" for _ in range(count)],
+        'miss': [f"zq{rng.randrange(10**6)}x" for _ in range(count)],
+    }
+
+def linear_search(audiofiles: list[str], audiofolders: list[str], query: str) -> list[tuple[str, str]]:
+    """The original autocomplete_jukebox, returning (name, value) pairs instead of Choices."""
+    query = query.lower()
+    result = []
+    search_contains = True
+    if query:
+        for i in audiofiles:
+            if i.lower().startswith(query):
+                result.append((i[:-5], i))
+                search_contains = False
+    if search_contains:
+        for i in audiofolders:
+            if query in i.lower():
+                result.append((i + '/', i))
+        for i in audiofiles:
+            if '/' not in i and query in i.lower():
+                result.append((i[:-5], i))
+    return result[:MAX_RESULTS]
+
+def time_queries(search, queries: list[str]) -> tuple[dict, float]:
+    latencies, hits = [], 0
+    for query in queries:
+        start = time.perf_counter()
+        results = search(query)
+        latencies.append(time.perf_counter() - start)
+        hits += bool(results)
+    return percentiles(latencies), round(hits / max(1, len(queries)), 3)
+
+def run_size(count: int, folders: int, ops: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    names = make_names(count, folders, rng)
+    queries = make_queries(names, ops, rng)
+
+    workdir = tempfile.mkdtemp(prefix="bot-autocomplete-bench-")
+    try:
+        write_tree(workdir, names)
+        start = time.perf_counter()
+        index = JukeboxIndex(workdir)
+        build_ms = round((time.perf_counter() - start) * 1000, 1)
+
+        audiofiles, audiofolders = names, sorted({n.rsplit('/', 1)[0] for n in names if '/' in n})
+        result = {'files': count, 'folders': len(audiofolders), 'ops': ops, 'index_build_ms': build_ms}
+        for kind, search in (('linear', lambda q: linear_search(audiofiles, audiofolders, q)), ('index', index.search)):
+            result[kind] = {}
+            for name, batch in queries.items():
+                latency, hit_rate = time_queries(search, batch)
+                result[kind][name] = {'ms': latency, 'hit_rate': hit_rate}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="JukeboxIndex against a linear scan for autocomplete")
+    parser.add_argument("--files", type=int, nargs="+", default=[100000], help="jukebox sizes")
+    parser.add_argument("--folders", type=int, default=200, help="subfolders the files are spread over")
+    parser.add_argument("--ops", type=int, default=200, help="lookups timed per kind of query")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for count in args.files:
+        result = run_size(count, args.folders, args.ops, args.seed)
+        results.append(result)
+        note(f"{count:>7} files  index built in {result['index_build_ms']}ms")
+        for kind in ('linear', 'index'):
+            line = "  ".join(
+                f"{name} p50 {r['ms']['p50']}ms p99 {r['ms']['p99']}ms" for name, r in result[kind].items()
+            )
+            note(f"{count:>7} files {kind:<6}  {line}")
+    write_report(results, args.json)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""
+Several bot processes hammering one shared audio cache.
+
+Starts N worker processes on the same data directory. Each one runs the real DownloaderHandler
+and TrackStore with the stub yt-dlp backend from tests.fakes, resolves random tracks from a
+working set larger than the cache budget, and keeps a few of them pinned in a queue. Afterwards
+the parent checks the invariants the shared cache is meant to keep:
+
+- no track is downloaded by two processes at the same time (cross-process single flight)
+- no file pinned by a live process is evicted by another, including in the moment between a
+  cache hit or download and the track being queued
+- every file read from the cache is complete
+- data/music and the TOC agree once every process has exited
+
+Usage (from src/):
+    python -m bench.cache_stress                          # 4 processes, 200 lookups each
+    python -m bench.cache_stress --procs 8 --ops 500 --json stress.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+from bench.loadtest import SRC_ROOT, quiet_defaults
+from bench.common import write_ogg_opus, git_commit
+from tests.fakes import StubYoutubeDL, LoadClient, link
+
+DOWNLOAD_LOG = "downloads.log"
+
+# --- Worker ------------------------------------------------------------------------------
+
+class LoggedYoutubeDL(StubYoutubeDL):
+    """Stub backend that appends each download's time span to a log shared by all workers."""
+    def process_ie_result(self, info: dict, download: bool = True) -> dict:
+        started = time.time()
+        result = super().process_ie_result(info, download)
+        line = json.dumps({'id': info['id'], 'pid': os.getpid(), 'start': started, 'end': time.time()})
+        with open(DOWNLOAD_LOG, "a") as f:
+            f.write(line + "\n")
+        return result
+
+async def worker(args) -> dict:
+    from core import downloader as downloader_module
+    from core import track_store
+    from core.player import PlayerHandler
+    from core.downloader import DownloaderHandler
+    from core.executor import DownloadExecutor
+    from core.guild_queue import GuildQueue
+
+    media_size = os.path.getsize("media.opus")
+    downloader_module.AUDIO_CACHE_BYTES = args.capacity * media_size
+    # Short enough that looked up tracks which were never queued become evictable within the run
+    track_store.PIN_LEASE = args.lease_ms / 1000
+    LoggedYoutubeDL.media_path = os.path.abspath("media.opus")
+    LoggedYoutubeDL.extract_delay = args.extract_ms / 1000
+    LoggedYoutubeDL.download_delay = args.download_ms / 1000
+
+    client = LoadClient(asyncio.get_running_loop())
+    player = PlayerHandler(client)
+    downloader = DownloaderHandler(client, player, executor=DownloadExecutor(args.workers), ydl_class=LoggedYoutubeDL)
+    rng = random.Random(args.seed * 1000 + args.index)
+    ids = [f"shared{i:05d}" for i in range(args.working_set)]
+    queue = player.queues[args.index] = GuildQueue()
+
+    stats = {'pid': os.getpid(), 'lookups': 0, 'errors': 0, 'incomplete_reads': 0,
+             'evicted_before_queued': 0, 'pin_violations': 0, 'reads': 0}
+    for _ in range(args.ops):
+        video_id = rng.choice(ids)
+        try:
+            metadata = await downloader.resolve_track("YouTube", video_id, link(video_id))
+        except Exception as e:
+            stats['errors'] += 1
+            print(f"worker {args.index}: {e!r}", file=sys.stderr)
+            continue
+        stats['lookups'] += 1
+
+        if rng.random() < args.pin_rate:
+            # Queue the track, dropping the oldest pin once the queue is full
+            if len(queue) >= args.pins:
+                queue.remove(0)
+            queue.append(dict(metadata))
+            if not os.path.exists(metadata['file']):
+                # The hit or download pinned it, so nobody may have evicted it since
+                stats['evicted_before_queued'] += 1
+                print(f"worker {args.index}: {metadata['file']} was evicted before it was queued", file=sys.stderr)
+                queue.remove(len(queue) - 1)
+            await asyncio.to_thread(downloader.share_pins)
+
+        for entry in queue.snapshot():
+            if not os.path.exists(entry['file']):
+                stats['pin_violations'] += 1
+                print(f"worker {args.index}: pinned {entry['file']} was evicted", file=sys.stderr)
+
+        try:
+            with open(metadata['file'], "rb") as f:
+                size = len(f.read())
+            stats['reads'] += 1
+            if size != media_size:
+                stats['incomplete_reads'] += 1
+        except FileNotFoundError:
+            pass # Evicted since it was resolved, and not pinned
+
+    stats['cache'] = downloader.toc.stats()
+    downloader.executor.shutdown()
+    player.prefetch_pool.shutdown(wait=False, cancel_futures=True)
+    downloader.toc.close()
+    return stats
+
+# --- Parent ------------------------------------------------------------------------------
+
+def overlapping_downloads(path: str) -> tuple[int, int]:
+    """(downloads, pairs of downloads of the same track by different processes that overlapped in time)."""
+    by_id = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                entry = json.loads(line)
+                by_id.setdefault(entry['id'], []).append(entry)
+    except FileNotFoundError:
+        return 0, 0
+    overlaps = 0
+    for spans in by_id.values():
+        spans.sort(key=lambda s: s['start'])
+        for a, b in zip(spans, spans[1:]):
+            if b['start'] < a['end'] and a['pid'] != b['pid']:
+                overlaps += 1
+    return sum(len(s) for s in by_id.values()), overlaps
+
+def check_consistency() -> dict:
+    from core.track_store import TrackStore
+    from core.reconciler import disk_files
+    toc = TrackStore()
+    on_disk = disk_files()
+    known = set(toc.by_file)
+    result = {
+        'files': len(on_disk),
+        'entries': len(known),
+        'orphans': len(on_disk - known),
+        'missing': len(known - on_disk),
+        'leftover_pins': toc.db.execute("SELECT COUNT(*) FROM pins").fetchone()[0],
+    }
+    toc.close()
+    return result
+
+def run(args) -> dict:
+    root = tempfile.mkdtemp(prefix="bot-cache-stress-")
+    start_dir = os.getcwd()
+    try:
+        os.chdir(root)
+        for folder in ("data/music", "data/jukebox", "data/playlists"):
+            os.makedirs(folder, exist_ok=True)
+        write_ogg_opus("media.opus", args.track_seconds)
+
+        started = time.perf_counter()
+        procs = []
+        for index in range(args.procs):
+            cmd = [sys.executable, "-m", "bench.cache_stress", "--worker", str(index), "--root", root]
+            cmd += sys.argv[1:]
+            procs.append(subprocess.Popen(cmd, cwd=SRC_ROOT, stdout=subprocess.DEVNULL))
+        workers = []
+        for index, proc in enumerate(procs):
+            proc.wait()
+            try:
+                with open(f"worker-{index}.json") as f:
+                    workers.append(json.load(f))
+            except (OSError, ValueError):
+                workers.append({'exit_code': proc.returncode, 'errors': 1})
+        elapsed = time.perf_counter() - started
+
+        downloads, overlaps = overlapping_downloads(DOWNLOAD_LOG)
+        consistency = check_consistency()
+        violations = (
+            overlaps + consistency['orphans'] + consistency['missing'] + consistency['leftover_pins']
+            + sum(
+                w.get('pin_violations', 0) + w.get('evicted_before_queued', 0) + w.get('incomplete_reads', 0)
+                + w.get('errors', 0)
+                for w in workers
+            )
+        )
+        return {
+            'commit': git_commit(),
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'procs': args.procs,
+            'ops_per_proc': args.ops,
+            'working_set': args.working_set,
+            'capacity': args.capacity,
+            'seconds': round(elapsed, 2),
+            'lookups_per_s': round(sum(w.get('lookups', 0) for w in workers) / elapsed, 1),
+            'downloads': downloads,
+            'concurrent_duplicate_downloads': overlaps,
+            'consistency': consistency,
+            'violations': violations,
+            'workers': workers,
+        }
+    finally:
+        os.chdir(start_dir)
+        shutil.rmtree(root, ignore_errors=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Several processes sharing one audio cache")
+    parser.add_argument("--procs", type=int, default=4, help="worker processes")
+    parser.add_argument("--ops", type=int, default=200, help="track lookups per process")
+    parser.add_argument("--working-set", type=int, default=60, help="distinct tracks requested")
+    parser.add_argument("--capacity", type=int, default=20, help="cache budget, in tracks")
+    parser.add_argument("--pins", type=int, default=5, help="tracks each process keeps queued")
+    parser.add_argument("--pin-rate", type=float, default=0.3, help="chance a looked up track gets queued")
+    parser.add_argument("--workers", type=int, default=2, help="download executor slots per process")
+    parser.add_argument("--lease-ms", type=float, default=50.0, help="how long a cache hit or download stays pinned unqueued")
+    parser.add_argument("--track-seconds", type=float, default=2.0)
+    parser.add_argument("--extract-ms", type=float, default=5.0)
+    parser.add_argument("--download-ms", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file instead of stdout")
+    parser.add_argument("--worker", type=int, dest="index", help=argparse.SUPPRESS)
+    parser.add_argument("--root", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    quiet_defaults()
+    if args.index is not None:
+        # Worker process: work in the shared directory
+        os.chdir(args.root)
+        stats = asyncio.run(worker(args))
+        # Not stdout: colorama's reset codes end up mixed into it
+        with open(f"worker-{args.index}.json", "w") as f:
+            json.dump(stats, f)
+        return
+
+    report = run(args)
+    print(
+        f"{report['procs']} procs x {report['ops_per_proc']} lookups in {report['seconds']}s, "
+        f"{report['downloads']} downloads, {report['concurrent_duplicate_downloads']} concurrent duplicates, "
+        f"violations {report['violations']}",
+        file=sys.stderr
+    )
+    output = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    sys.exit(1 if report['violations'] else 0)
+
+if __name__ == "__main__":
+    main()
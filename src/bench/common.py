@@ -0,0 +1,113 @@
+"""Helpers shared by the benchmarks in this folder."""
+import os
+import sys
+import json
+import time
+import struct
+import platform
+import subprocess
+
+SRC_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FRAME_SECONDS = 0.02
+# 20 ms fullband CELT stereo frame, code 0 (one frame per packet)
+OPUS_TOC = 0xFC
+PACKET_BYTES = 160
+PACKETS_PER_PAGE = 50
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SRC_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def per_call_us(fn, calls: list[tuple]) -> float:
+    """Mean microseconds per fn(*args) over calls."""
+    start = time.perf_counter()
+    for args in calls:
+        fn(*args)
+    return round((time.perf_counter() - start) / max(1, len(calls)) * 1e6, 3)
+
+def percentiles(values: list[float], scale: float = 1000.0) -> dict:
+    """p50/p95/p99/max of values (seconds), in milliseconds by default."""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * scale, 3)
+    return {'count': len(ordered), 'p50': pick(0.5), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(ordered[-1] * scale, 3)}
+
+def write_report(results, path: str = None, **extra):
+    """Wrap results with the commit and platform and print them as JSON, or write them to path."""
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        **extra,
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if path:
+        with open(path, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+def note(line: str):
+    """Human readable summary, on stderr so stdout stays valid JSON."""
+    print(line, file=sys.stderr)
+
+# --- Synthetic media ---------------------------------------------------------------------
+
+def _crc_table():
+    table = []
+    for i in range(256):
+        crc = i << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+CRC_TABLE = _crc_table()
+
+def _ogg_crc(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ CRC_TABLE[((crc >> 24) & 0xFF) ^ byte]
+    return crc
+
+def _ogg_page(packets: list[bytes], header_type: int, granule: int, seq: int) -> bytes:
+    table = bytearray()
+    for packet in packets:
+        table += b"\xff" * (len(packet) // 255) + bytes([len(packet) % 255])
+    header = struct.pack("<4sBBqIIIB", b"OggS", 0, header_type, granule, 0x10AD7E57, seq, 0, len(table))
+    page = bytearray(header + table + b"".join(packets))
+    struct.pack_into("<I", page, 22, _ogg_crc(page))
+    return bytes(page)
+
+def write_ogg_opus(path: str, seconds: float, comments: list[str] = ()):
+    """
+    Write a valid Ogg Opus file of silent-ish 20 ms frames that OggOpusSource can pass through,
+    with comments ("KEY=value") in its OpusTags header.
+    """
+    pre_skip = 312
+    head = b"OpusHead" + struct.pack("<BBHIhB", 1, 2, pre_skip, 48000, 0, 0)
+    vendor = b"loadtest"
+    tags = b"OpusTags" + struct.pack("<I", len(vendor)) + vendor + struct.pack("<I", len(comments))
+    for comment in comments:
+        tags += struct.pack("<I", len(comment.encode())) + comment.encode()
+    pages = [_ogg_page([head], 0x02, 0, 0), _ogg_page([tags], 0x00, 0, 1)]
+
+    total = max(1, int(seconds / FRAME_SECONDS))
+    packet = bytes([OPUS_TOC]) + bytes(PACKET_BYTES - 1)
+    granule = pre_skip
+    for start in range(0, total, PACKETS_PER_PAGE):
+        count = min(PACKETS_PER_PAGE, total - start)
+        granule += count * 960
+        last = start + count >= total
+        pages.append(_ogg_page([packet] * count, 0x04 if last else 0x00, granule, len(pages)))
+    with open(path, "wb") as f:
+        f.write(b"".join(pages))
@@ -0,0 +1,393 @@
+"""
+Offline load test for the player, downloader and slash commands.
+
+Runs the real PlayerHandler, DownloaderHandler and MusicCommands against fake guilds, voice
+clients and interactions, with a stub yt-dlp backend that "downloads" a generated Ogg Opus
+file. Nothing talks to Discord or YouTube. Each scenario runs in its own temporary data
+directory and reports throughput, command latency percentiles, event loop lag, RSS, ffmpeg
+process counts and playback underruns as JSON, so runs can be compared across commits.
+
+Usage (from src/):
+    python -m bench.loadtest                      # all scenarios with default sizes
+    python -m bench.loadtest play_storm skip_storm --guilds 50 --json results.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import discord
+from discord import app_commands
+from core import ingest
+from core import downloader as downloader_module
+from core.log_config import logger
+from core.player import PlayerHandler
+from core.downloader import DownloaderHandler
+from core.executor import DownloadExecutor, MAX_CONCURRENT_DOWNLOADS
+from commands.music import MusicCommands
+from bench.common import git_commit, write_ogg_opus, percentiles
+from tests.fakes import HAS_FFMPEG, StubYoutubeDL, FakeGuild, FakeInteraction, LoadClient, link
+
+SRC_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def quiet_defaults():
+    """Keep the console quiet and skip loudness analysis unless the environment asks for them."""
+    logger.setLevel(os.getenv("LOG_LEVEL", "WARNING").upper())
+    ingest.NORMALISE_AUDIO = os.getenv("NORMALISE_AUDIO", "0").lower() in ("1", "true", "t")
+
+# --- Measurement -------------------------------------------------------------------------
+
+def rss_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        return None
+
+class Harness:
+    """
+    One bot instance (player, downloader, commands) over fake guilds, in a fresh data directory.
+    It runs in workdir, by default a folder named after it under args.work_root.
+    """
+    def __init__(self, name: str, args, workdir: str = None):
+        self.name = name
+        self.args = args
+        self.speed = args.speed
+        self.workdir = workdir or os.path.join(args.work_root, name)
+        self.gaps: list[float] = []
+        self.lags: list[float] = []
+        self.first_response: list[float] = []
+        self.completion: list[float] = []
+        self.tracks_started = 0
+        self.underruns = 0
+        self.status_edits = 0
+        self.commands = 0
+        self.errors = 0
+        self.peak_rss = 0
+        self.peak_ffmpeg = {'playback': 0, 'ingest': 0}
+        self._stop = threading.Event()
+
+    async def __aenter__(self):
+        for folder in ("data/music", "data/jukebox", "data/playlists", "data/cache"):
+            os.makedirs(os.path.join(self.workdir, folder), exist_ok=True)
+        self.start_dir = os.getcwd()
+        os.chdir(self.workdir)
+
+        self.media_path = os.path.join(self.workdir, "media.opus")
+        write_ogg_opus(self.media_path, self.args.track_seconds)
+        StubYoutubeDL.media_path = self.media_path
+        StubYoutubeDL.duration = self.args.track_seconds
+        StubYoutubeDL.extract_delay = self.args.extract_ms / 1000
+        StubYoutubeDL.download_delay = self.args.download_ms / 1000
+        StubYoutubeDL.extractions = StubYoutubeDL.downloads = 0
+
+        loop = asyncio.get_running_loop()
+        self.client = LoadClient(loop)
+        self.tree = app_commands.CommandTree(discord.Client(intents=discord.Intents.none()))
+        self.tree_guild = discord.Object(id=1)
+        self.player = PlayerHandler(self.client)
+        self.downloader = DownloaderHandler(
+            self.client, self.player, executor=DownloadExecutor(self.args.workers), ydl_class=StubYoutubeDL
+        )
+        self.music = MusicCommands(self.tree, [self.tree_guild], self.downloader)
+        self.guilds = [FakeGuild(self, 1000 + i) for i in range(self.args.guilds)]
+        self.client.guilds.extend(self.guilds)
+
+        self.rss_start = rss_bytes()
+        self.started = time.perf_counter()
+        self._lag_task = loop.create_task(self._sample_lag())
+        self._sampler = threading.Thread(target=self._sample_resources, name="loadtest-sampler", daemon=True)
+        self._sampler.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        self.finished = time.perf_counter()
+        for guild in self.guilds:
+            self.player.queues.pop(guild.id, None)
+            if guild.voice_client is not None:
+                conn = guild.voice_client
+                await conn.disconnect()
+                if conn._thread is not None:
+                    await asyncio.to_thread(conn._thread.join, 5)
+        self._stop.set()
+        self._lag_task.cancel()
+        pending = list(self.downloader.pending_tasks.values())
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for task in list(self.player.status.workers.values()):
+            task.cancel()
+        # Jobs already running still write under data/, so wait for them before leaving the directory
+        for pool in (self.downloader.executor.pool, self.player.prefetch_pool, self.music.playlists.pool):
+            await asyncio.to_thread(pool.shutdown, wait=True, cancel_futures=True)
+        self.downloader.toc.close()
+        os.chdir(self.start_dir)
+        return False
+
+    async def _sample_lag(self):
+        interval = 0.05
+        while True:
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            self.lags.append(max(0.0, time.perf_counter() - expected))
+
+    def _sample_resources(self):
+        while not self._stop.wait(0.1):
+            rss = rss_bytes()
+            if rss:
+                self.peak_rss = max(self.peak_rss, rss)
+            for kind, count in self.player.ffmpeg_processes().items():
+                self.peak_ffmpeg[kind] = max(self.peak_ffmpeg[kind], count)
+
+    def interaction(self, guild: FakeGuild) -> FakeInteraction:
+        return FakeInteraction(guild, random.randrange(1, 1 << 30))
+
+    async def invoke(self, command_name: str, guild: FakeGuild, /, **kwargs):
+        """Run a slash command callback and record time to first response and to completion."""
+        command = self.tree.get_command(command_name, guild=self.tree_guild)
+        interaction = self.interaction(guild)
+        self.commands += 1
+        start = time.perf_counter()
+        try:
+            await command.callback(interaction, **kwargs)
+        except Exception as e:
+            self.errors += 1
+            print(f"[{self.name}] /{command_name} failed: {e!r}", file=sys.stderr)
+        end = time.perf_counter()
+        self.completion.append(end - start)
+        self.first_response.append((interaction.responded_at or end) - start)
+
+    async def settle(self, timeout: float = 120.0):
+        """Wait for downloads, lookahead tasks and coalesced status edits to finish."""
+        deadline = time.perf_counter() + timeout
+        executor = self.downloader.executor
+        while time.perf_counter() < deadline:
+            busy = (
+                self.downloader.inflight or executor.active
+                or any(not t.done() for t in self.downloader.pending_tasks.values())
+                or self.player.status.workers
+            )
+            if not busy:
+                return
+            await asyncio.sleep(0.05)
+        print(f"[{self.name}] still busy after {timeout}s", file=sys.stderr)
+
+    async def play_for(self, seconds: float):
+        await asyncio.sleep(seconds / self.speed)
+
+    def result(self, **extra) -> dict:
+        duration = self.finished - self.started
+        return {
+            'scenario': self.name,
+            'params': {
+                'guilds': self.args.guilds, 'speed': self.speed, 'workers': self.args.workers,
+                'track_seconds': self.args.track_seconds, 'extract_ms': self.args.extract_ms,
+                'download_ms': self.args.download_ms, 'ffmpeg': HAS_FFMPEG,
+            },
+            'duration_s': round(duration, 3),
+            'commands': self.commands,
+            'errors': self.errors,
+            'throughput_cmd_s': round(self.commands / duration, 2) if duration else None,
+            'latency_ms': {
+                'first_response': percentiles(self.first_response),
+                'complete': percentiles(self.completion),
+            },
+            'loop_lag_ms': percentiles(self.lags),
+            'rss_mb': {
+                'start': round((self.rss_start or 0) / 1048576, 1),
+                'peak': round(self.peak_rss / 1048576, 1),
+            },
+            'ffmpeg_peak': self.peak_ffmpeg,
+            'playback': {
+                'tracks_started': self.tracks_started,
+                'underruns': self.underruns,
+                'gap_ms': percentiles(self.gaps),
+            },
+            'status_edits': self.status_edits,
+            'extractions': StubYoutubeDL.extractions,
+            'downloads': StubYoutubeDL.downloads,
+            'cache': self.downloader.toc.stats(),
+            **extra,
+        }
+
+# --- Scenarios ---------------------------------------------------------------------------
+
+async def play_storm(args) -> dict:
+    """Every guild fires /play repeatedly at once, with some links shared between guilds."""
+    async with Harness("play_storm", args) as h:
+        shared = [f"shared{i:05d}" for i in range(max(1, args.per_guild // 2))]
+
+        async def guild_storm(g, guild):
+            for i in range(args.per_guild):
+                video_id = random.choice(shared) if random.random() < args.shared else f"g{g:03d}t{i:06d}"
+                await h.invoke("play", guild, link=link(video_id))
+                await asyncio.sleep(args.stagger_ms / 1000)
+
+        await asyncio.gather(*(guild_storm(g, guild) for g, guild in enumerate(h.guilds)))
+        await h.settle()
+        await h.play_for(2)
+    return h.result(per_guild=args.per_guild, shared_fraction=args.shared)
+
+async def skip_storm(args) -> dict:
+    """Guilds with long cached queues skip as fast as commands arrive."""
+    async with Harness("skip_storm", args) as h:
+        ids = [f"skip{i:07d}" for i in range(args.per_guild)]
+        # Warm the cache so the storm measures queue and playback work, not downloads
+        for video_id in ids:
+            await h.downloader.fetch_track("YouTube", video_id, link(video_id))
+
+        for guild in h.guilds:
+            await h.invoke("play", guild, link=link(ids[0]))
+            for video_id in ids[1:]:
+                await h.invoke("add", guild, link=link(video_id))
+        await h.settle()
+        queued = h.commands
+
+        async def storm(guild):
+            for _ in range(args.per_guild - 1):
+                await h.invoke("skip", guild, n_skips=1)
+                await asyncio.sleep(args.stagger_ms / 1000)
+
+        await asyncio.gather(*(storm(guild) for guild in h.guilds))
+        await h.settle()
+    return h.result(per_guild=args.per_guild, skip_commands=h.commands - queued)
+
+def fill_playlist(folder: str, media_path: str, count: int):
+    os.makedirs(folder, exist_ok=True)
+    with open(media_path, "rb") as f:
+        media = f.read()
+    for i in range(count):
+        with open(os.path.join(folder, f"track {i:05d}.opus"), "wb") as f:
+            f.write(media)
+
+async def big_playlist(args) -> dict:
+    """A playlist folder with thousands of tracks: cold manifest build, then every guild queues it."""
+    async with Harness("big_playlist", args) as h:
+        folder = os.path.join("data/playlists", "big")
+        # Off the loop, so the setup doesn't show up as loop lag in the results
+        await asyncio.to_thread(fill_playlist, folder, h.media_path, args.playlist_tracks)
+
+        build_start = time.perf_counter()
+        await h.music.playlists.load("big")
+        build_s = time.perf_counter() - build_start
+
+        for guild in h.guilds:
+            await h.invoke("playlist", guild, name="big")
+        for guild in h.guilds:
+            await h.invoke("nextup", guild)
+            await h.invoke("shuffle", guild)
+            await h.invoke("skip", guild, n_skips=args.playlist_tracks // 2)
+        await h.play_for(2)
+        await h.settle()
+    return h.result(playlist_tracks=args.playlist_tracks, manifest_build_s=round(build_s, 3))
+
+async def cache_thrash(args) -> dict:
+    """A working set several times larger than the audio cache, so files keep getting evicted."""
+    async with Harness("cache_thrash", args) as h:
+        track_bytes = os.path.getsize(h.media_path)
+        capacity = max(1, args.working_set // 4)
+        original_budget = downloader_module.AUDIO_CACHE_BYTES
+        downloader_module.AUDIO_CACHE_BYTES = capacity * track_bytes
+        try:
+            ids = [f"thrash{i:05d}" for i in range(args.working_set)]
+
+            async def churn(guild):
+                for _ in range(args.per_guild):
+                    await h.invoke("add", guild, link=link(random.choice(ids)))
+                    await asyncio.sleep(args.stagger_ms / 1000)
+
+            for guild in h.guilds:
+                await h.invoke("play", guild, link=link(ids[0]))
+            await asyncio.gather(*(churn(guild) for guild in h.guilds))
+            await h.settle()
+            await h.play_for(2)
+        finally:
+            downloader_module.AUDIO_CACHE_BYTES = original_budget
+    return h.result(working_set=args.working_set, cache_capacity_tracks=capacity)
+
+SCENARIOS = {
+    'play_storm': play_storm,
+    'skip_storm': skip_storm,
+    'big_playlist': big_playlist,
+    'cache_thrash': cache_thrash,
+}
+
+def summary_line(result: dict) -> str:
+    latency = result['latency_ms']['first_response']
+    lag = result['loop_lag_ms']
+    playback = result['playback']
+    return (
+        f"{result['scenario']:<13} {result['commands']:>6} cmds {result['throughput_cmd_s']:>8} cmd/s  "
+        f"p99 {latency.get('p99', 0):>8}ms  lag p99 {lag.get('p99', 0):>7}ms  "
+        f"tracks {playback['tracks_started']:>5}  underruns {playback['underruns']:>4}  "
+        f"rss {result['rss_mb']['peak']}MiB  errors {result['errors']}"
+    )
+
+async def run(args) -> dict:
+    results = []
+    for name in args.scenarios:
+        random.seed(args.seed)
+        result = await SCENARIOS[name](args)
+        results.append(result)
+        print(summary_line(result), file=sys.stderr)
+    return {
+        'commit': git_commit(),
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test for the music bot")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--guilds", type=int, default=10, help="simulated guilds")
+    parser.add_argument("--per-guild", type=int, default=20, help="commands per guild in each storm")
+    parser.add_argument("--shared", type=float, default=0.2, help="fraction of /play links shared between guilds")
+    parser.add_argument("--playlist-tracks", type=int, default=10000)
+    parser.add_argument("--working-set", type=int, default=40, help="distinct links in cache_thrash")
+    parser.add_argument("--workers", type=int, default=MAX_CONCURRENT_DOWNLOADS, help="download executor slots")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="playback speed-up factor (above 1, underruns include scheduler jitter)")
+    parser.add_argument("--track-seconds", type=float, default=5.0)
+    parser.add_argument("--extract-ms", type=float, default=50.0, help="simulated metadata extraction time")
+    parser.add_argument("--download-ms", type=float, default=200.0, help="simulated download time")
+    parser.add_argument("--stagger-ms", type=float, default=10.0, help="delay between one guild's commands")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file instead of stdout")
+    args = parser.parse_args(argv)
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    quiet_defaults()
+    args.work_root = tempfile.mkdtemp(prefix="bot-loadtest-")
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(args.work_root, ignore_errors=True)
+    output = json.dumps(report, indent=2)
+    if args.json:
+        with open(args.json, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
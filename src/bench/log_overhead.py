@@ -0,0 +1,129 @@
+"""
+Cost of a log call on the calling thread, through the queue listener against synchronous handlers.
+
+Times one logger call the way the player and downloader make them, on the thread that makes it
+(the event loop or discord.py's audio thread), for each logging pipeline:
+- sync: the original setup, a console handler and a file handler formatting and writing on the
+  calling thread, with the ColorFormatter that rewrote record.levelname on every call
+- queued: the current setup, LazyQueueHandler putting the record on a queue for the listener thread
+
+and for each kind of call:
+- eager / lazy: an enabled INFO call with an f-string message, or with %-style arguments
+- gated eager / gated lazy: a DEBUG call below the logger's level
+
+Both pipelines write to files in a temporary directory; the console stream goes to os.devnull,
+so a real terminal would only make the sync numbers worse.
+
+Usage (from src/):
+    python -m bench.log_overhead
+    python -m bench.log_overhead --calls 50000 --json logs.json
+"""
+import os
+import time
+import queue
+import shutil
+import logging
+import logging.handlers
+import argparse
+import tempfile
+from bench.common import per_call_us, write_report, note
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+from colorama import Fore
+from core.log_config import ColorFormatter, LazyQueueHandler
+
+FORMAT = "[%(levelname)s] :: %(message)s"
+
+class LegacyColorFormatter(logging.Formatter):
+    """The original ColorFormatter, which coloured the level name by rewriting the record."""
+    COLORS = ColorFormatter.COLORS
+    ANSI_RESET = ColorFormatter.ANSI_RESET
+
+    def format(self, record):
+        suffix = self.ANSI_RESET + "\n"
+        if getattr(record, "no_level", False):
+            return record.getMessage().rstrip() + suffix
+        level_color = self.COLORS.get(record.levelno, Fore.WHITE)
+        record.levelname = level_color + record.levelname + self.ANSI_RESET
+        return super().format(record).rstrip() + suffix
+
+def make_handlers(workdir: str, name: str, formatter: logging.Formatter, devnull) -> list[logging.Handler]:
+    console = logging.StreamHandler(devnull)
+    console.setFormatter(formatter)
+    file = logging.FileHandler(os.path.join(workdir, f"{name}.log"), encoding="utf-8")
+    file.setFormatter(formatter)
+    return [console, file]
+
+def sync_logger(workdir: str, devnull) -> tuple[logging.Logger, None]:
+    logger = logging.getLogger("bench.sync")
+    for handler in make_handlers(workdir, "sync", LegacyColorFormatter(FORMAT), devnull):
+        logger.addHandler(handler)
+    return logger, None
+
+def queued_logger(workdir: str, devnull) -> tuple[logging.Logger, logging.handlers.QueueListener]:
+    logger = logging.getLogger("bench.queued")
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, *make_handlers(workdir, "queued", ColorFormatter(FORMAT), devnull))
+    listener.start()
+    logger.addHandler(LazyQueueHandler(records))
+    return logger, listener
+
+def calls(logger: logging.Logger) -> dict:
+    metadata = {'title': "Some Artist - Some Track (Official Audio)", 'file': "data/music/YouTube/dQw4w9WgXcQ.opus"}
+    pos, invoker = 3, "user-123456"
+    return {
+        'eager': lambda: logger.info(f"Track queued: {metadata['title']} (pos={pos}) by {invoker}"),
+        'lazy': lambda: logger.info("Track queued: %s (pos=%d) by %s", metadata['title'], pos, invoker),
+        'gated_eager': lambda: logger.debug(f"Playing next track: {metadata['title']} ({metadata['file']})"),
+        'gated_lazy': lambda: logger.debug("Playing next track: %s (%s)", metadata['title'], metadata['file']),
+    }
+
+def drain(listener):
+    if listener is not None:
+        while not listener.queue.empty():
+            time.sleep(0.001)
+
+def run_pipeline(build, workdir: str, count: int, devnull) -> dict:
+    logger, listener = build(workdir, devnull)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    result = {}
+    try:
+        for name, call in calls(logger).items():
+            # Warm up, then time with the listener idle so runs don't measure each other's backlog
+            per_call_us(call, [()] * 100)
+            drain(listener)
+            result[name] = per_call_us(call, [()] * count)
+            drain(listener)
+    finally:
+        if listener is not None:
+            listener.stop()
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+    return result
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Per-call logging overhead on the calling thread")
+    parser.add_argument("--calls", type=int, default=20000, help="log calls timed per case")
+    parser.add_argument("--json", help="write results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="bot-log-bench-")
+    results = {}
+    try:
+        with open(os.devnull, "w") as devnull:
+            for name, build in (('sync', sync_logger), ('queued', queued_logger)):
+                results[name] = run_pipeline(build, workdir, args.calls, devnull)
+                r = results[name]
+                note(
+                    f"{name:<6}  eager {r['eager']:>7}us  lazy {r['lazy']:>7}us  "
+                    f"gated eager {r['gated_eager']:>7}us  gated lazy {r['gated_lazy']:>7}us"
+                )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    write_report(results, args.json, calls=args.calls)
+
+if __name__ == "__main__":
+    main()
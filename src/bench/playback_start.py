@@ -0,0 +1,110 @@
+"""
+Track starts through the in-process Ogg passthrough against one ffmpeg process per track.
+
+Starts one source per simulated guild at the same time, the way a burst of /play commands or
+tracks ending together would, and reports for each kind of source:
+- start latency: from building the source to its first Opus packet
+- processes: ffmpeg processes running once every source has started
+- CPU: user + system seconds of this process and its children to read every source to the end
+
+The ffmpeg side builds discord.FFmpegOpusAudio(path) like playback did before the passthrough,
+and is skipped when ffmpeg is not installed. By default the audio is a generated Ogg Opus file;
+pass --media to use a real track instead.
+
+Usage (from src/):
+    python -m bench.playback_start                     # 1, 10 and 50 guilds
+    python -m bench.playback_start --guilds 100 --media song.opus --json start.json
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from bench.common import write_ogg_opus, percentiles, write_report, note
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+import discord
+from core.ogg import OggOpusSource
+
+HAS_FFMPEG = shutil.which("ffmpeg") is not None
+KINDS = {
+    'ogg': OggOpusSource,
+    'ffmpeg': discord.FFmpegOpusAudio,
+}
+
+def cpu_seconds() -> float:
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+def start_one(kind: str, path: str) -> tuple[discord.AudioSource, float]:
+    started = time.perf_counter()
+    source = KINDS[kind](path)
+    source.read()
+    return source, time.perf_counter() - started
+
+def running_processes(sources: list) -> int:
+    count = 0
+    for source in sources:
+        process = getattr(source, '_process', None)
+        if process is not None and process.poll() is None:
+            count += 1
+    return count
+
+def run_kind(kind: str, path: str, guilds: int) -> dict:
+    cpu_start = cpu_seconds()
+    with ThreadPoolExecutor(max_workers=guilds) as pool:
+        started = list(pool.map(lambda _: start_one(kind, path), range(guilds)))
+    sources = [source for source, _ in started]
+    processes = running_processes(sources)
+
+    packets = 0
+    for source in sources:
+        while source.read():
+            packets += 1
+        # Reaps the ffmpeg process, so its CPU time is counted below
+        source.cleanup()
+    return {
+        'start_ms': percentiles([latency for _, latency in started]),
+        'processes': processes,
+        'cpu_s': round(cpu_seconds() - cpu_start, 3),
+        'packets': packets + guilds,
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ogg passthrough against ffmpeg for track starts")
+    parser.add_argument("--guilds", type=int, nargs="+", default=[1, 10, 50], help="tracks started at once")
+    parser.add_argument("--track-seconds", type=float, default=30.0, help="length of the generated track")
+    parser.add_argument("--media", help="an existing .opus file to play instead of a generated one")
+    parser.add_argument("--json", help="write results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="bot-playback-bench-")
+    try:
+        path = os.path.join(workdir, "track.opus")
+        if args.media:
+            shutil.copyfile(args.media, path)
+        else:
+            write_ogg_opus(path, args.track_seconds)
+
+        kinds = list(KINDS) if HAS_FFMPEG else ['ogg']
+        if not HAS_FFMPEG:
+            note("ffmpeg not found, only the passthrough is measured")
+        results = []
+        for guilds in args.guilds:
+            result = {'guilds': guilds}
+            for kind in kinds:
+                result[kind] = run_kind(kind, path, guilds)
+                r = result[kind]
+                note(
+                    f"{guilds:>4} guilds {kind:<6}  start p50 {r['start_ms']['p50']:>9}ms  "
+                    f"p95 {r['start_ms']['p95']:>9}ms  processes {r['processes']:>4}  cpu {r['cpu_s']:>7}s"
+                )
+            results.append(result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    write_report(results, args.json, ffmpeg=HAS_FFMPEG, media=args.media or f"generated {args.track_seconds}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+GuildQueue's lazy shuffle against the original full-copy shuffle, at queue sizes of 1k tracks and up.
+
+For each size, with shuffle on, times:
+- toggle: switching shuffle on for a queue that is already filled
+- add: queueing a playlist, the path that reshuffled the whole queue before
+- advance: moving on to the next track when the current one ends
+
+The baseline does what the original code did: the queue is a plain list, a playlist is appended
+and the queue deduplicated, then everything after the current track is deduplicated again, copied
+and shuffled with random.shuffle, and advancing pops index 0. GuildQueue draws the next track only
+when advancing, so adding and toggling never touch the rest of the queue.
+
+Usage (from src/):
+    python -m bench.shuffle_cost                       # 1k, 10k and 100k tracks
+    python -m bench.shuffle_cost --tracks 10000 --playlist 200 --json shuffle.json
+"""
+import os
+import time
+import random
+import argparse
+from bench.common import write_report, note
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+from core.guild_queue import GuildQueue
+
+def make_tracks(start: int, count: int) -> list[dict]:
+    return [{'file': f"data/music/YouTube/v{i:010d}.opus", 'title': f"Track {i}"} for i in range(start, start + count)]
+
+def deduplicate_queue(queue):
+    seen = set()
+    deduped = []
+    for track in queue:
+        if track['file'] not in seen:
+            seen.add(track['file'])
+            deduped.append(track)
+    return deduped
+
+class ListQueue:
+    """The original per-guild queue: a dict holding a list and its flags."""
+    def __init__(self, tracks: list[dict]):
+        self.state = {'queue': list(tracks), 'loop': False, 'shuffle': False}
+
+    def toggle(self):
+        self.state['shuffle'] ^= True
+
+    def add_playlist(self, items: list[dict]):
+        queue = self.state['queue']
+        queue.extend(items)
+        queue[:] = deduplicate_queue(queue)
+        if self.state['shuffle'] and len(queue) > 1:
+            first = queue[0]
+            rest = deduplicate_queue(queue[1:])
+            random.shuffle(rest)
+            self.state['queue'] = [first] + rest
+
+    def advance(self):
+        self.state['queue'].pop(0)
+
+    def restore(self, tracks: list[dict]):
+        self.state['queue'] = list(tracks)
+
+class LazyQueue:
+    def __init__(self, tracks: list[dict]):
+        self.queue = GuildQueue(tracks)
+
+    def toggle(self):
+        self.queue.shuffle = not self.queue.shuffle
+
+    def add_playlist(self, items: list[dict]):
+        self.queue.extend(items, unique=True)
+
+    def advance(self):
+        self.queue.advance()
+
+    def restore(self, tracks: list[dict]):
+        self.queue = GuildQueue(tracks, shuffle=self.queue.shuffle)
+
+def timed(fn, *args) -> float:
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+def mean_us(samples: list[float]) -> float:
+    return round(sum(samples) / max(1, len(samples)) * 1e6, 3)
+
+def bench_kind(kind, tracks: list[dict], playlists: list[list[dict]], advances: int) -> dict:
+    queue = kind(tracks)
+    toggle = timed(queue.toggle)
+
+    # Each playlist is added to the same starting queue, so the size under test stays fixed
+    adds = []
+    for items in playlists:
+        adds.append(timed(queue.add_playlist, items))
+        queue.restore(tracks)
+
+    return {
+        'toggle_us': mean_us([toggle]),
+        'add_us': mean_us(adds),
+        'advance_us': mean_us([timed(queue.advance) for _ in range(advances)]),
+    }
+
+def run_size(count: int, playlist: int, ops: int, seed: int) -> dict:
+    random.seed(seed)
+    tracks = make_tracks(0, count)
+    playlists = [make_tracks(count + i * playlist, playlist) for i in range(ops)]
+    advances = min(ops, count - 1)
+    return {
+        'tracks': count,
+        'playlist': playlist,
+        'ops': ops,
+        'full_copy': bench_kind(ListQueue, tracks, playlists, advances),
+        'lazy': bench_kind(LazyQueue, tracks, playlists, advances),
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Lazy GuildQueue shuffle against the full-copy shuffle")
+    parser.add_argument("--tracks", type=int, nargs="+", default=[1000, 10000, 100000], help="queue sizes")
+    parser.add_argument("--playlist", type=int, default=50, help="tracks per playlist added")
+    parser.add_argument("--ops", type=int, default=100, help="playlists added and tracks advanced per size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for count in args.tracks:
+        result = run_size(count, args.playlist, args.ops, args.seed)
+        results.append(result)
+        for name in ('full_copy', 'lazy'):
+            r = result[name]
+            note(
+                f"{count:>7} tracks {name:<9}  toggle {r['toggle_us']:>10}us  add {r['add_us']:>12}us  "
+                f"advance {r['advance_us']:>10}us"
+            )
+    write_report(results, args.json)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Time to first audio when streaming from the remote URL against downloading the track first.
+
+Serves a generated Ogg Opus track from a local http.server that adds a first byte delay and caps
+each connection's throughput, like a CDN would, then times for each mode:
+- download: fetch the whole file, then build the source from the cached copy the way a cache
+  hit plays it, up to its first Opus packet
+- stream: what /play does with STREAMING_PLAYBACK, building the ffmpeg source on the URL while
+  the background download fetches the same file, up to the first packet ffmpeg produces
+
+Streaming starts sooner but the track is fetched twice, once by ffmpeg and once by the download
+that replaces it, so the server's byte count per track is reported next to the latencies.
+The stream side needs ffmpeg and is skipped when it is not installed.
+
+Usage (from src/):
+    python -m bench.stream_start
+    python -m bench.stream_start --track-seconds 240 --first-byte-ms 300 --kbps 2000 --json stream.json
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from bench.common import write_ogg_opus, percentiles, write_report, note
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+from core.player import PlayerHandler
+
+HAS_FFMPEG = shutil.which("ffmpeg") is not None
+CHUNK_BYTES = 16384
+
+class TrackServer(ThreadingHTTPServer):
+    """Serves one file to every GET, counting the bytes actually sent."""
+    daemon_threads = True
+
+    def __init__(self, path: str, first_byte_ms: float, kbps: float):
+        super().__init__(("127.0.0.1", 0), ThrottledHandler)
+        with open(path, "rb") as f:
+            self.body = f.read()
+        self.first_byte = first_byte_ms / 1000
+        self.bytes_per_second = kbps * 1000 / 8
+        self.lock = threading.Lock()
+        self.bytes_sent = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/track.opus"
+
+class ThrottledHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.first_byte)
+        self.send_response(200)
+        self.send_header("Content-Type", "audio/ogg")
+        self.send_header("Content-Length", str(len(server.body)))
+        self.end_headers()
+        for offset in range(0, len(server.body), CHUNK_BYTES):
+            chunk = server.body[offset:offset + CHUNK_BYTES]
+            try:
+                self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            with server.lock:
+                server.bytes_sent += len(chunk)
+            time.sleep(len(chunk) / server.bytes_per_second)
+
+    def log_message(self, format, *args):
+        pass
+
+def download(url: str, path: str):
+    with urllib.request.urlopen(url) as response, open(path, "wb") as f:
+        shutil.copyfileobj(response, f)
+
+def download_then_play(player: PlayerHandler, server: TrackServer, workdir: str) -> tuple[float, float]:
+    """Seconds to the first packet and to the end of the download."""
+    path = os.path.join(workdir, "download.opus")
+    started = time.perf_counter()
+    download(server.url, path)
+    downloaded = time.perf_counter() - started
+    source = player.create_source({'file': path})
+    source.read()
+    first_packet = time.perf_counter() - started
+    source.cleanup()
+    os.remove(path)
+    return first_packet, downloaded
+
+def stream_and_download(player: PlayerHandler, server: TrackServer, workdir: str) -> tuple[float, float]:
+    path = os.path.join(workdir, "stream.opus")
+    started = time.perf_counter()
+    # The background download /play starts next to the stream
+    fetch = threading.Thread(target=download, args=(server.url, path))
+    fetch.start()
+    source = player.create_source({'file': path, 'stream_url': server.url, 'http_headers': {}})
+    source.read()
+    first_packet = time.perf_counter() - started
+    fetch.join()
+    downloaded = time.perf_counter() - started
+    # The track keeps streaming after the download lands, so ffmpeg fetches all of it
+    while source.read():
+        pass
+    source.cleanup()
+    os.remove(path)
+    return first_packet, downloaded
+
+MODES = {
+    'download': download_then_play,
+    'stream': stream_and_download,
+}
+
+def run_mode(mode: str, player: PlayerHandler, server: TrackServer, workdir: str, runs: int) -> dict:
+    first_packets, downloads = [], []
+    with server.lock:
+        server.bytes_sent = 0
+    for _ in range(runs):
+        first_packet, downloaded = MODES[mode](player, server, workdir)
+        first_packets.append(first_packet)
+        downloads.append(downloaded)
+    # ffmpeg may still be sending its last chunk when the source is cleaned up
+    time.sleep(0.1)
+    with server.lock:
+        sent = server.bytes_sent
+    return {
+        'first_packet_ms': percentiles(first_packets),
+        'download_ms': percentiles(downloads),
+        'bytes_per_track': sent // runs,
+        'fetches_per_track': round(sent / runs / len(server.body), 2),
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="First packet latency of streaming against download-then-play")
+    parser.add_argument("--runs", type=int, default=5, help="tracks started per mode")
+    parser.add_argument("--track-seconds", type=float, default=180.0, help="length of the generated track")
+    parser.add_argument("--first-byte-ms", type=float, default=150.0, help="delay before the server answers")
+    parser.add_argument("--kbps", type=float, default=4000.0, help="throughput cap per connection")
+    parser.add_argument("--json", help="write results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="bot-stream-bench-")
+    server = None
+    track_bytes = None
+    try:
+        path = os.path.join(workdir, "track.opus")
+        write_ogg_opus(path, args.track_seconds)
+        server = TrackServer(path, args.first_byte_ms, args.kbps)
+        track_bytes = len(server.body)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        player = PlayerHandler(None)
+
+        modes = list(MODES) if HAS_FFMPEG else ['download']
+        if not HAS_FFMPEG:
+            note("ffmpeg not found, only download-then-play is measured")
+        results = {}
+        for mode in modes:
+            results[mode] = run_mode(mode, player, server, workdir, args.runs)
+            r = results[mode]
+            note(
+                f"{mode:<8}  first packet p50 {r['first_packet_ms']['p50']:>9}ms  "
+                f"download p50 {r['download_ms']['p50']:>9}ms  fetched {r['fetches_per_track']}x per track"
+            )
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    write_report(
+        results, args.json, ffmpeg=HAS_FFMPEG, track_bytes=track_bytes,
+        track_seconds=args.track_seconds, first_byte_ms=args.first_byte_ms, kbps=args.kbps,
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+TrackStore against the old list-based toc.json at catalogue sizes of 10k entries and up.
+
+For each size, times the operations the downloader performs on the TOC:
+- cache hit: lookup by file path, refresh the timestamp, persist
+- lookup by (service, id)
+- insert of a new download
+- eviction of the least recently used tracks
+- opening an existing catalogue, and migrating a toc.json into a new store
+
+The list baseline does what the original code did: a linear scan for every lookup, and the whole
+toc.json rewritten with json.dump on every hit and insert. Everything runs in a temporary directory.
+
+Usage (from src/):
+    python -m bench.toc_scaling                        # 10k and 50k entries
+    python -m bench.toc_scaling --entries 10000 100000 --ops 500 --json toc.json
+"""
+import os
+import json
+import random
+import shutil
+import argparse
+import tempfile
+from bench.common import per_call_us, write_report, note
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+from core.track_store import TrackStore
+
+TRACK_BYTES = 4_000_000
+
+def make_records(count: int) -> list[dict]:
+    return [
+        {
+            'title': f"Track {i}",
+            'id': f"v{i:010d}",
+            'file': f"data/music/YouTube/v{i:010d}.opus",
+            'service': "YouTube",
+            'duration': 180 + i % 120,
+            'timestamp': 1_700_000_000 + i,
+            'size': TRACK_BYTES,
+        }
+        for i in range(count)
+    ]
+
+class ListToc:
+    """The original TOC: a list of dicts, rewritten in full to data/toc.json on every change."""
+    def __init__(self, records: list[dict], path: str = "data/toc.json"):
+        self.toc = [dict(r) for r in records]
+        self.path = path
+        self.save()
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump(self.toc, f)
+
+    def find(self, file: str) -> dict | None:
+        for item in self.toc:
+            if item['file'] == file:
+                return item
+        return None
+
+    def find_by_id(self, service: str, track_id: str) -> dict | None:
+        for item in self.toc:
+            if item['service'] == service and item['id'] == track_id:
+                return item
+        return None
+
+    def hit(self, file: str, timestamp: int):
+        for item in self.toc:
+            if item['file'] == file:
+                item['timestamp'] = timestamp
+                self.save()
+                return item
+        return None
+
+    def insert(self, record: dict):
+        self.toc.append(record)
+        self.save()
+
+    def evict(self, keep: int):
+        self.toc.sort(key=lambda x: x['timestamp'], reverse=True)
+        del self.toc[keep:]
+        self.save()
+
+def bench_list(records: list[dict], probes: list[dict], extra: list[dict]) -> dict:
+    toc = ListToc(records)
+    now = records[-1]['timestamp'] + 1
+    return {
+        'lookup_file_us': per_call_us(toc.find, [(p['file'],) for p in probes]),
+        'lookup_id_us': per_call_us(toc.find_by_id, [(p['service'], p['id']) for p in probes]),
+        'hit_us': per_call_us(toc.hit, [(p['file'], now + i) for i, p in enumerate(probes)]),
+        'insert_us': per_call_us(toc.insert, [(r,) for r in extra]),
+        'evict_us': per_call_us(toc.evict, [(len(records) - len(extra),)]),
+    }
+
+def bench_store(records: list[dict], probes: list[dict], extra: list[dict]) -> dict:
+    store = TrackStore()
+    with store.transaction():
+        for record in records:
+            store._write(record)
+    store.close()
+
+    result = {'open_us': per_call_us(lambda: TrackStore().close(), [()])}
+    store = TrackStore()
+    now = records[-1]['timestamp'] + 1
+    result.update({
+        'lookup_file_us': per_call_us(store.get, [(p['file'],) for p in probes]),
+        'lookup_id_us': per_call_us(store.get_by_id, [(p['service'], p['id']) for p in probes]),
+        'hit_us': per_call_us(store.touch, [(p['file'], now + i) for i, p in enumerate(probes)]),
+        'insert_us': per_call_us(store.add, [(dict(r),) for r in extra]),
+        # Evicting as many tracks as were just inserted
+        'evict_us': per_call_us(store.evict, [((len(records) - len(extra)) * TRACK_BYTES,)]),
+    })
+    store.close()
+    return result
+
+def bench_migrate(records: list[dict]) -> float:
+    os.remove("data/toc.db")
+    with open("data/toc.json", "w") as f:
+        json.dump(records, f)
+    return per_call_us(lambda: TrackStore().close(), [()])
+
+def run_size(count: int, ops: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    records = make_records(count + ops)
+    records, extra = records[:count], records[count:]
+    probes = [rng.choice(records) for _ in range(ops)]
+
+    workdir = tempfile.mkdtemp(prefix="bot-toc-bench-")
+    start_dir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        os.makedirs("data")
+        legacy = bench_list(records, probes, extra)
+        os.remove("data/toc.json")
+        store = bench_store(records, probes, extra)
+        store['migrate_us'] = bench_migrate(records)
+    finally:
+        os.chdir(start_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {'entries': count, 'ops': ops, 'list': legacy, 'store': store}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="TrackStore against the list-based toc.json")
+    parser.add_argument("--entries", type=int, nargs="+", default=[10000, 50000], help="catalogue sizes")
+    parser.add_argument("--ops", type=int, default=200, help="lookups, hits and inserts timed per size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file instead of stdout")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = []
+    for count in args.entries:
+        result = run_size(count, args.ops, args.seed)
+        results.append(result)
+        for name in ('list', 'store'):
+            r = result[name]
+            note(
+                f"{count:>7} entries {name:<5}  lookup {r['lookup_file_us']:>10}us  hit {r['hit_us']:>10}us  "
+                f"insert {r['insert_us']:>10}us  evict {r['evict_us']:>12}us"
+            )
+    write_report(results, args.json)
+
+if __name__ == "__main__":
+    main()
@@ -7,49 +7,14 @@ if TYPE_CHECKING:
     from core.downloader import DownloaderHandler
 
 import os
-import json
-import random
+import time
 import discord
 from discord import app_commands
-from core import utils
-
-# Load the Table of Contents (TOC) for previously downloaded music
-with open("data/toc.json", "r") as f:
-    toc = list(f.read())
-    if isinstance(toc, str):  # If JSON is malformed or empty, fall back to an empty list
-        toc = []
-    else:
-        toc = list(json.load(open("data/toc.json")))
-
-# Load and index audio files and directories from jukebox folder
-audiofiles = []
-audiofolders = []
-for dirpath, dirnames, filenames in os.walk("data/jukebox"):
-    audiofolders += dirnames
-    folder = dirpath.replace('\\','/')[13:]
-    for f in filenames:
-        audiofiles.append(f"{folder}/{f}".strip('/')) # Trim off the base path
-
-# Sort the jukebox file list for consistent ordering
-audiofiles.sort()
-
-# Load available playlist folders
-playlistfolders = []
-for item in os.listdir("data/playlists"):
-    path = os.path.join("data/playlists", item)
-    if os.path.isdir(path):
-        playlistfolders.append(item)
-
-playlistfolders.sort()
-
-def deduplicate_queue(queue):
-    seen = set()
-    deduped = []
-    for track in queue:
-        if track['file'] not in seen:
-            seen.add(track['file'])
-            deduped.append(track)
-    return deduped
+from core import utils, ingest, metrics, watchdog
+from core.executor import Priority
+from core.guild_queue import GuildQueue
+from core.jukebox_index import JukeboxIndex
+from core.playlists import PlaylistLibrary
 
 # Register all application commands to the command tree
 class MusicCommands():
@@ -58,6 +23,9 @@ class MusicCommands():
         self.guilds = guilds
         self.downloader = downloader
         self.player = downloader.player
+        self.jukebox = JukeboxIndex()
+        self.playlists = PlaylistLibrary()
+        self.playlists.refresh_all()
         self.register_commands()
 
     def register_commands(self):
@@ -93,7 +61,11 @@ class MusicCommands():
         async def stop(interaction: discord.Interaction):
             vc_conn = interaction.guild.voice_client
             if vc_conn:
-                await vc_conn.channel.edit(status=None)
+                await self.player.status.set_now(vc_conn.channel, None)
+                self.player.status.forget(vc_conn.channel.id)
+                # Dropped first so the track ending doesn't advance the queue, and it isn't resumed on restart
+                self.player.queues.pop(interaction.guild.id, None)
+                self.player.discard_prefetched(interaction.guild.id)
                 await vc_conn.disconnect()
                 await interaction.response.send_message("Disconnected", ephemeral=True)
             else:
@@ -102,40 +74,36 @@ class MusicCommands():
         @tree.command(name="skip", description="Skip one or more tracks", guilds=guilds)
         @app_commands.describe(n_skips="Number of tracks to skip (0 to skip all)")
         async def skip(interaction: discord.Interaction, n_skips: int = 1):
-            try:
-                queue = self.player.queues[interaction.guild.id]['queue']
-            except KeyError:
+            queue = self.player.queues.get(interaction.guild.id)
+            vc_conn = interaction.guild.voice_client
+            if queue is None or vc_conn is None:
                 await interaction.response.send_message("No active playback", ephemeral=True)
                 return
 
-            if n_skips <= 0 or n_skips >= len(queue):
-                skipped = len(queue)
-                self.player.queues[interaction.guild.id]['queue'] = []
-                interaction.guild.voice_client.stop()
+            skip_all = n_skips <= 0 or n_skips >= len(queue)
+            skipped = self.player.skip(vc_conn, n_skips)
+            if skipped is None:
+                await interaction.response.send_message("No active playback", ephemeral=True)
+            elif skip_all:
                 await interaction.response.send_message(f"Skipped all {skipped} tracks.", ephemeral=True)
-                return
-
-            for _ in range(n_skips - 1):
-                queue.pop(0)
-            interaction.guild.voice_client.stop()
-            await interaction.response.send_message(f"Skipped {n_skips} track(s)", ephemeral=True)
+            else:
+                await interaction.response.send_message(f"Skipped {n_skips} track(s)", ephemeral=True)
 
         @tree.command(name="nextup", description="Show upcoming tracks in the queue", guilds=guilds)
         async def nextup(interaction: discord.Interaction):
-            try:
-                info = self.player.queues[interaction.guild.id]
-            except KeyError:
+            queue = self.player.queues.get(interaction.guild.id)
+            if queue is None:
                 await interaction.response.send_message("No queue active.", ephemeral=True)
                 return
 
             embed = discord.Embed(
-                title="Queue",
+                title="Queue (shuffled, next track is picked at random)" if queue.shuffle else "Queue",
                 color=discord.Color.blurple()
             )
 
-            for i, song in enumerate(info["queue"]):
+            for i, song in enumerate(queue.snapshot()[:25]):
                 if i == 0:
-                    label = "LOOPING" if info["loop"] else "NOW PLAYING"
+                    label = "LOOPING" if queue.loop else "NOW PLAYING"
                     embed.add_field(name=f"{label}", value=song['title'], inline=False)
                 else:
                     embed.add_field(name=f"{i}.", value=song['title'], inline=False)
@@ -143,22 +111,60 @@ class MusicCommands():
             await interaction.response.send_message(embed=embed, ephemeral=True)
 
         @tree.command(name="loop", description="Toggle loop mode", guilds=guilds)
-        async def loop(interaction: discord.Interaction):
-            try:
-                looping = self.player.queues[interaction.guild.id]['loop']
-                self.player.queues[interaction.guild.id]['loop'] = not looping
-                await interaction.response.send_message(f"Looping is now {'on' if not looping else 'off'}.", ephemeral=True)
-            except KeyError:
+        @app_commands.describe(start="Loop the current track from this position instead of the beginning (e.g. 1:30)")
+        async def loop(interaction: discord.Interaction, start: str = None):
+            queue = self.player.queues.get(interaction.guild.id)
+            if queue is None:
                 await interaction.response.send_message("No active queue.", ephemeral=True)
+                return
+            if start is not None:
+                seconds = utils.parse_duration(start)
+                duration = (queue.current or {}).get('duration')
+                if seconds is None or (duration and seconds >= duration):
+                    await interaction.response.send_message("Invalid loop start.", ephemeral=True)
+                    return
+                queue.loop = True
+                queue.loop_start = seconds
+            else:
+                queue.loop = not queue.loop
+                queue.loop_start = 0.0
+            self.player.schedule_prefetch(interaction.guild.voice_client)
+            if queue.loop and queue.loop_start:
+                await interaction.response.send_message(f"Looping from {utils.format_duration(queue.loop_start)}.", ephemeral=True)
+            else:
+                await interaction.response.send_message(f"Looping is now {'on' if queue.loop else 'off'}.", ephemeral=True)
+
+        @tree.command(name="seek", description="Jump to a position in the current track", guilds=guilds)
+        @app_commands.describe(position="Time to jump to, e.g. 90 or 1:30")
+        async def seek(interaction: discord.Interaction, position: str):
+            vc_conn = interaction.guild.voice_client
+            queue = self.player.queues.get(interaction.guild.id)
+            if vc_conn is None or not queue:
+                await interaction.response.send_message("Nothing is playing.", ephemeral=True)
+                return
+            seconds = utils.parse_duration(position)
+            duration = queue.current.get('duration')
+            if seconds is None or (duration and seconds >= duration):
+                await interaction.response.send_message("Invalid position.", ephemeral=True)
+                return
+            entry = self.player.seek(vc_conn, seconds)
+            if entry is None:
+                await interaction.response.send_message("This track can't be seeked yet.", ephemeral=True)
+                return
+            await interaction.response.send_message(f"Jumped to {utils.format_duration(seconds)} in {entry['title']}.", ephemeral=True)
 
         @tree.command(name="shuffle", description="Toggle shuffle mode", guilds=guilds)
         async def shuffle(interaction: discord.Interaction):
-            try:
-                self.player.queues[interaction.guild.id]['shuffle'] ^= True
-                status = "enabled" if self.player.queues[interaction.guild.id]['shuffle'] else "disabled"
-                await interaction.response.send_message(f"Shuffle is now {status}.", ephemeral=True)
-            except KeyError:
+            queue = self.player.queues.get(interaction.guild.id)
+            if queue is None:
                 await interaction.response.send_message("No active queue.", ephemeral=True)
+                return
+            queue.shuffle = not queue.shuffle
+            # The next track may change, so prefetch and look ahead at whatever is drawn now
+            self.player.schedule_prefetch(interaction.guild.voice_client)
+            self.player.queue_changed(interaction.guild.id)
+            status = "enabled" if queue.shuffle else "disabled"
+            await interaction.response.send_message(f"Shuffle is now {status}.", ephemeral=True)
 
         @tree.command(name="jukebox", description="Play a local jukebox file", guilds=guilds)
         @app_commands.describe(file="The name of the file")
@@ -181,24 +187,8 @@ class MusicCommands():
 
         @jukebox.autocomplete("file")
         async def autocomplete_jukebox(interaction: discord.Interaction, query: str) -> list[app_commands.Choice[str]]:
-            query = query.lower()
-            result = []
-            search_contains = True
-            if query:
-                for i in audiofiles:
-                    if i.lower().startswith(query):
-                        result.append(app_commands.Choice(name=i[:-5],value=i))
-                        search_contains = False
-            if search_contains:
-                for i in audiofolders:
-                    if query in i.lower():
-                        result.append(app_commands.Choice(name=i+'/', value=i))
-                for i in audiofiles:
-                    if '/' not in i and query in i.lower():
-                        result.append(app_commands.Choice(name=i[:-5], value=i))
-
-            return result[:25] if len(result) > 25 else result
-        
+            return [app_commands.Choice(name=name, value=value) for name, value in self.jukebox.search(query)]
+
         @tree.command(name="createjb", description="Add a jukebox entry", guilds=guilds)
         @app_commands.describe(link="The video or audio link", filename="The filename to save as (with .opus extension)")
         async def createjb(interaction: discord.Interaction, link: str, filename: str):
@@ -228,21 +218,26 @@ class MusicCommands():
                 }],
             }
 
+            def download():
+                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                    return ydl.extract_info(link, download=True)
+
             await interaction.response.defer(ephemeral=True)
             try:
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(link, download=True)
+                info = await self.downloader.executor.run(download, priority=Priority.JUKEBOX, guild_id=interaction.guild.id)
             except Exception as e:
                 await interaction.followup.send(f"Download failed: {e}", ephemeral=True)
                 return
+            levels = await self.downloader.executor.run(ingest.ingest, jukebox_path, priority=Priority.JUKEBOX, guild_id=interaction.guild.id)
 
-            # Add to jukebox index (optional: you can skip this if not needed)
+            self.jukebox.add(jukebox_path)
             metadata = {
                 'title': filename,
                 'file': jukebox_path.replace("\\", "/"),
                 'service': 'Jukebox',
                 'duration': info.get('duration', 0),
-                'timestamp': round(time.time())
+                'timestamp': round(time.time()),
+                **levels
             }
             # Optionally, you could update a jukebox TOC here
 
@@ -262,10 +257,23 @@ class MusicCommands():
 
             service, match = self.downloader.match_service_and_id(link)
             if service and match:
-                await self.downloader.download_and_play(interaction, vc_conn, match, service, link, toc, play_now=False)
+                await self.downloader.download_and_play(interaction, vc_conn, match, service, link, play_now=False)
             else:
                 await interaction.response.send_message("Invalid URL or unsupported service.", ephemeral=True)
 
+        @tree.command(name="addbatch", description="Add several URLs or a whole YouTube/SoundCloud playlist to the queue", guilds=guilds)
+        @app_commands.describe(links="Links separated by spaces or commas, or a playlist link")
+        async def addbatch(interaction: discord.Interaction, links: str):
+            vc_conn = await self.player.connect_and_prepare(interaction)
+            if not vc_conn:
+                return
+
+            link_list = [l for l in links.replace(',', ' ').split() if l]
+            if not link_list:
+                await interaction.response.send_message("No links given.", ephemeral=True)
+                return
+            await self.downloader.batch_add(interaction, vc_conn, link_list)
+
         @tree.command(name="play", description="Play a YouTube or SoundCloud URL", guilds=guilds)
         @app_commands.describe(link="The video or audio link")
         async def play(interaction: discord.Interaction, link: str):
@@ -275,7 +283,7 @@ class MusicCommands():
 
             service, match = self.downloader.match_service_and_id(link)
             if service and match:
-                await self.downloader.download_and_play(interaction, vc_conn, match, service, link, toc, play_now=True)
+                await self.downloader.download_and_play(interaction, vc_conn, match, service, link, play_now=True)
             else:
                 await interaction.response.send_message("Invalid URL or unsupported service.", ephemeral=True)
 
@@ -287,68 +295,130 @@ class MusicCommands():
             if not vc_conn:
                 return
 
-            folder_path = os.path.join("data/playlists", name)
-            if not os.path.isdir(folder_path):
+            if name not in self.playlists.folders():
                 await interaction.response.send_message("Playlist not found.", ephemeral=True)
                 return
 
-            files = [
-                f for f in os.listdir(folder_path)
-                if os.path.isfile(os.path.join(folder_path, f)) and f.endswith(".opus")
-            ]
-            if not files:
-                await interaction.response.send_message("Playlist is empty.", ephemeral=True)
+            manifest = self.playlists.cached(name)
+            if manifest is None:
+                # Folder changed since the manifest was built, rescan it off the event loop
+                await interaction.response.defer(ephemeral=True)
+                manifest = await self.playlists.load(name)
+            send = interaction.followup.send if interaction.response.is_done() else interaction.response.send_message
+
+            if not manifest['tracks']:
+                await send("Playlist is empty.", ephemeral=True)
                 return
 
             playlist_items = []
-            for file in sorted(files):
-                full_path = os.path.join(folder_path, file)
+            for track in manifest['tracks']:
                 playlist_items.append({
-                    'title': file[:-5],
-                    'id': file[:-5],
-                    'file': full_path.replace("\\", "/"),
+                    'title': track['title'],
+                    'id': track['title'],
+                    'file': track['file'],
                     'service': "Playlist",
-                    'duration': 0,
+                    'duration': track['duration'],
                     'timestamp': 0
                 })
+            playtime = utils.format_duration(manifest['total_duration'])
 
-            try:
-                queue = self.player.queues[interaction.guild.id]['queue']
-                queue.extend(playlist_items)
-                queue[:] = deduplicate_queue(queue)
-
-                if self.player.queues[interaction.guild.id].get("shuffle") and len(queue) > 1:
-                    first = queue[0]
-                    rest = deduplicate_queue(queue[1:])
-                    random.shuffle(rest)
-                    self.player.queues[interaction.guild.id]['queue'] = [first] + rest
-
-                await interaction.response.send_message(f"Queued {len(playlist_items)} tracks from playlist `{name}`.", ephemeral=True)
-            except KeyError:
-                deduped = deduplicate_queue(playlist_items)
-                self.player.queues[interaction.guild.id] = {
-                    'queue': deduped,
-                    'loop': False,
-                    'shuffle': False
-                }
-                vc_conn.play(
-                    discord.FFmpegOpusAudio(deduped[0]['file']),
-                    after=lambda err=None, conn=vc_conn: self.player.after_track(err, conn)
-                )
+            queue = self.player.queues.get(interaction.guild.id)
+            if queue is not None:
+                queue.extend(playlist_items, unique=True)
+                self.player.schedule_prefetch(vc_conn)
+
+                await send(f"Queued {len(playlist_items)} tracks from playlist `{name}` ({playtime}).", ephemeral=True)
+            else:
+                queue = GuildQueue()
+                queue.extend(playlist_items, unique=True)
+                deduped = queue.snapshot()
+                self.player.queues[interaction.guild.id] = queue
+                self.player.play_source(vc_conn, self.player.create_source(deduped[0]))
+                self.player.schedule_prefetch(vc_conn)
                 embed = utils.create_embed(
                     title="Now Playing",
-                    description=deduped[0]['title'],
+                    description=f"Playlist `{name}`: {len(deduped)} tracks, {playtime}",
                     color=0x1DB954,
                     song_name=deduped[0]['title'],
                     queue_list=[s['title'] for s in deduped[1:]],
                     song_queuer=interaction.user
                 )
-                await interaction.response.send_message(embed=embed, ephemeral=True)
+                await send(embed=embed, ephemeral=True)
 
         @playlist.autocomplete("name")
         async def autocomplete_playlist(interaction: discord.Interaction, query: str):
             q = query.lower()
-            return [
-                app_commands.Choice(name=f, value=f)
-                for f in playlistfolders if q in f.lower()
-            ][:25]
+            choices = []
+            for f in self.playlists.folders():
+                if q not in f.lower():
+                    continue
+                manifest = self.playlists.cached(f)
+                label = f"{f} ({len(manifest['tracks'])} tracks, {utils.format_duration(manifest['total_duration'])})" if manifest else f
+                choices.append(app_commands.Choice(name=label, value=f))
+                if len(choices) >= 25:
+                    break
+            return choices
+
+        @tree.command(name="stats", description="Show bot performance statistics", guilds=guilds)
+        async def stats(interaction: discord.Interaction):
+            await interaction.response.send_message(embed=self.stats_embed(interaction.guild.id), ephemeral=True)
+
+        # Time every command registered above
+        instrumented = set()
+        for guild in guilds:
+            for command in tree.walk_commands(guild=guild):
+                if isinstance(command, app_commands.Command) and id(command) not in instrumented:
+                    metrics.instrument_command(command)
+                    instrumented.add(id(command))
+
+    def stats_embed(self, guild_id: int) -> discord.Embed:
+        def ms(seconds):
+            return f"{seconds * 1000:.0f}ms"
+
+        embed = discord.Embed(title="Bot Stats", color=0x1DB954)
+
+        queues = list(self.player.queues.values())
+        playback = [
+            f"Voice connections: {len(self.downloader.client.voice_clients)}",
+            f"Queued tracks: {sum(len(q) for q in queues)} in {len(queues)} guilds",
+        ]
+        ffmpeg = self.player.ffmpeg_processes()
+        playback.append(f"ffmpeg processes: {ffmpeg['playback']} playback, {ffmpeg['ingest']} ingest")
+        if guild_id in self.player.last_gap_ms:
+            playback.append(f"Last track gap here: {self.player.last_gap_ms[guild_id]:.1f}ms")
+        gap = metrics.track_gap.summary()
+        if gap:
+            playback.append(f"Track gap p50/p95: {ms(gap['p50'])} / {ms(gap['p95'])}")
+        lag = watchdog.loop_lag.summary()
+        if lag:
+            playback.append(f"Event loop lag p50/p95: {ms(lag['p50'])} / {ms(lag['p95'])}")
+        embed.add_field(name="Playback", value="\n".join(playback), inline=False)
+
+        cache = self.downloader.toc.stats()
+        embed.add_field(name="Cache", value=(
+            f"{cache['entries']} files, {cache['bytes'] / 1048576:.1f} MiB\n"
+            f"Hit rate {cache['hit_rate']:.0%} ({cache['hits']} hits, {cache['misses']} misses)\n"
+            f"Downloads saved: {cache['bytes_saved'] / 1048576:.1f} MiB"
+        ), inline=False)
+
+        downloads = []
+        for stage in ("extract", "download", "transcode"):
+            summary = metrics.download_stage.summary(stage)
+            if summary:
+                downloads.append(f"{stage}: {summary['count']} runs, mean {ms(summary['mean'])}, p95 {ms(summary['p95'])}")
+        queue_stats = self.downloader.executor.queue_stats()
+        downloads.append(f"Jobs waiting for a slot: {sum(s['waiting'] for s in queue_stats.values())}")
+        for name, s in queue_stats.items():
+            if s['jobs']:
+                downloads.append(f"{name} wait: {s['jobs']} jobs, mean {ms(s['avg_wait'])}, max {ms(s['max_wait'])}")
+        embed.add_field(name="Downloads", value="\n".join(downloads), inline=False)
+
+        commands = []
+        for (name,), _ in sorted(metrics.command_latency.series.items(), key=lambda item: -item[1][2])[:10]:
+            summary = metrics.command_latency.summary(name)
+            commands.append(f"/{name}: {summary['count']} calls, p50 {ms(summary['p50'])}, p95 {ms(summary['p95'])}")
+        embed.add_field(name="Commands", value="\n".join(commands) or "No commands yet", inline=False)
+
+        uptime = utils.format_duration(time.time() - metrics.registry.started_at)
+        embed.set_footer(text=f"Uptime {uptime}")
+        return embed
@@ -7,14 +7,37 @@ if TYPE_CHECKING:
 import os
 import re
 import time
+import shutil
 import asyncio
+import tempfile
 import yt_dlp
-import json
 import discord
-from core import utils
+from core import utils, ingest, metrics, ogg_index
+from core.executor import DownloadExecutor, Job, Priority
+from core.track_store import TrackStore
+from core.metadata_cache import MetadataCache
+from core.reconciler import STAGING_DIR
+from core.file_lock import FileLock
 from core.log_config import logger, log_failed
 
-MAX_AUDIO_FILES = 50
+# Disk budget for cached music in data/music, least recently used tracks are evicted past this
+AUDIO_CACHE_BYTES = int(float(os.getenv("AUDIO_CACHE_MB", "1024")) * 1024 * 1024)
+# How many upcoming queue entries are downloaded ahead of time, and how many bytes that may take
+LOOKAHEAD_DEPTH = int(os.getenv("LOOKAHEAD_DEPTH", "3"))
+LOOKAHEAD_BYTES = int(float(os.getenv("LOOKAHEAD_MB", "100")) * 1024 * 1024)
+# Rough size of a cached track per second of audio, used when yt-dlp gives no file size
+BYTES_PER_SECOND = 16000
+# Upper bound on tracks accepted by one /addbatch
+MAX_BATCH_TRACKS = int(os.getenv("MAX_BATCH_TRACKS", "100"))
+# Minimum seconds between edits of a batch progress message
+PROGRESS_EDIT_INTERVAL = 2.0
+# Per-track lock files, so only one process sharing data/music downloads a given track
+LOCK_DIR = "data/locks"
+# Seconds between publishing this process's pins and picking up other processes' cache changes
+CACHE_HEARTBEAT_INTERVAL = 10
+PLAYLIST_MATCH_STRING = r"""(?:.*youtube\.com\/(?:playlist\?|watch\?.*&)list=[\w-]+)|(?:.*soundcloud\.com\/[\w-]+\/sets\/[\w-]+)"""
+# Start playing from the remote stream while the cached copy is still downloading
+STREAMING_PLAYBACK = os.getenv("STREAMING_PLAYBACK", "1").lower() in ("1", "true", "t")
 YOUTUBE_MATCH_STRING = r"""(?:.*youtube\.com\/(?:[^\/]+\/.+\/|(?:v|e(?:mbed)?)\/|.*[?&]v=)|.*youtu\.be\/)([^"&?\/\s]{11})"""
 SOUNDCLOUD_MATCH_STRING = r"""(?:https?:\/\/)?(?:(?:www\.)|(?:m\.))?soundcloud\.com\/([\w-]{1,23})(?:\/)([\w-]{1,23})(?:\/.*)*"""
 
@@ -23,9 +46,43 @@ class VideoDownloadError(PlayerError): pass
 class VideoTooLargeError(VideoDownloadError): pass
 
 class DownloaderHandler:
-    def __init__(self, client: discord.Client, player: PlayerHandler):
+    def __init__(self, client: discord.Client, player: PlayerHandler, executor: DownloadExecutor = None, toc: TrackStore = None, ydl_class=yt_dlp.YoutubeDL):
         self.client = client
         self.player = player
+        self.ydl_class = ydl_class
+        self.metadata = MetadataCache()
+        self.toc = toc or TrackStore()
+        self.executor = executor or DownloadExecutor()
+        # Downloads currently running, keyed by (service, id) so concurrent requests share one job
+        self.inflight: dict[tuple[str, str], asyncio.Future] = {}
+        # The executor job of each in-flight download, raised to the most urgent class among its waiters
+        self.inflight_jobs: dict[tuple[str, str], Job] = {}
+        # Metadata extractions currently running, shared the same way
+        self.extracting: dict[tuple[str, str], asyncio.Task] = {}
+        # Background downloads of pending queue entries, keyed by file path
+        self.pending_tasks: dict[str, asyncio.Task] = {}
+        # The executor job behind each pending task, so it can be promoted once its entry is up next
+        self.pending_jobs: dict[str, Job] = {}
+        self.heartbeat_task = None
+        player.downloader = self
+
+    def start(self):
+        """Start sharing this process's pins with other processes using the same cache."""
+        if self.heartbeat_task is None:
+            self.heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat())
+
+    async def _heartbeat(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.share_pins)
+            except Exception as e:
+                log_failed(f"Could not update cache pins: {e}")
+            await asyncio.sleep(CACHE_HEARTBEAT_INTERVAL)
+
+    def share_pins(self):
+        """Publish the files queued in this process and apply other processes' cache changes (blocking)."""
+        self.toc.heartbeat(self.player.pin_counts())
+        self.toc.sync()
 
     @classmethod
     def match_service_and_id(cls, url: str):
@@ -34,7 +91,7 @@ class DownloaderHandler:
             url, flags=re.IGNORECASE
         )
         if youtube_match:
-            logger.debug(f"YouTube URL matched: {url}")
+            logger.debug("YouTube URL matched: %s", url)
             return "YouTube", youtube_match
 
         soundcloud_match = re.match(
@@ -42,36 +99,395 @@ class DownloaderHandler:
             url, flags=re.IGNORECASE
         )
         if soundcloud_match:
-            logger.debug(f"SoundCloud URL matched: {url}")
+            logger.debug("SoundCloud URL matched: %s", url)
             return "SoundCloud", soundcloud_match
 
-        logger.warning(f"No supported service matched for URL: {url}")
+        logger.warning("No supported service matched for URL: %s", url)
         return None, None
 
-    async def download_and_play(self, interaction: discord.Interaction, conn: discord.VoiceClient, match: re.Match, service: str, link: str, toc: list, play_now: bool = False):
+    async def download_and_play(self, interaction: discord.Interaction, conn: discord.VoiceClient, match: re.Match, service: str, link: str, play_now: bool = False):
         filename = '.'.join(match.groups())
         full_path = f"data/music/{service}/{filename}.opus"
-        logger.info(f"Requested download: {link} -> {full_path}")
+        priority = Priority.PLAY if play_now else Priority.ADD
+        logger.info("Requested download: %s -> %s", link, full_path)
 
         # Check if file already exists in TOC
-        for i, item in enumerate(toc):
-            if item['file'] == full_path:
-                logger.debug(f"File found in TOC: {full_path}, refreshing timestamp.")
-                toc[i]['timestamp'] = round(time.time())
-                with open("data/toc.json", 'w') as f:
-                    json.dump(toc, f)
-
-                if play_now:
-                    conn.stop()
-                    embed = self.player.add_to_queue(metadata=item, conn=conn, invoker=interaction.user.name, pos=1, skip=True)
-                else:
-                    embed = self.player.add_to_queue(metadata=item, conn=conn, invoker=interaction.user.name)
-                return embed
+        item = await self.cached_track(full_path)
+        if item:
+            embed = self.queue_track(item, conn, interaction, play_now)
+            await interaction.response.send_message(embed=embed, ephemeral=True)
+            return embed
 
+        self.toc.record_miss()
+        requested_at = time.perf_counter()
         await interaction.response.defer(ephemeral=True)
 
+        if not play_now and self.player.queues.get(conn.guild.id):
+            # Something is already playing, queue the link now and let the lookahead download it
+            await self.queue_pending(interaction, conn, service, filename, link)
+            return
+
+        if STREAMING_PLAYBACK and (service, filename) not in self.inflight:
+            await self.stream_and_download(interaction, conn, service, filename, link, play_now, requested_at, priority)
+            return
+
+        try:
+            metadata = await self.fetch_track(service, filename, link, priority, interaction.guild.id)
+        except Exception as e:
+            await self.report_failure(interaction, link, e)
+            return
+
+        embed = self.queue_track(metadata, conn, interaction, play_now)
+        logger.debug("Time to first audio: %.0fms (after download)", (time.perf_counter() - requested_at) * 1000)
+        await interaction.followup.send(embed=embed, ephemeral=True)
+        self.player.status.update(conn.channel, self.player.status.track_status(metadata))
+        logger.info("Playback started: %s (%s)", metadata['title'], service)
+
+    async def queue_pending(self, interaction: discord.Interaction, conn: discord.VoiceClient, service: str, filename: str, link: str):
+        try:
+            info = await self.resolve_info(service, filename, link, Priority.ADD, interaction.guild.id)
+        except Exception as e:
+            await self.report_failure(interaction, link, e)
+            return
+
+        entry = {
+            'title': info['title'],
+            'id': info['id'],
+            'file': f"data/music/{service}/{filename}.opus",
+            'service': service,
+            'duration': info.get('duration'),
+            'timestamp': round(time.time()),
+            'link': link,
+            'pending': True,
+            'size_estimate': info.get('filesize') or info.get('filesize_approx') or (info.get('duration') or 0) * BYTES_PER_SECOND,
+        }
+        embed = self.player.add_to_queue(metadata=entry, conn=conn, invoker=interaction.user.name)
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
+    def ensure_lookahead(self, guild_id: int):
+        """Start downloading the next few pending entries of a guild's queue, within the lookahead byte budget."""
+        queue = self.player.queues.get(guild_id)
+        if not queue:
+            return
+        # Draws the next track in shuffle mode, so it is the one fetched
+        queue.peek_next()
+        entries = queue[:LOOKAHEAD_DEPTH + 1]
+        if queue.shuffle:
+            # Past the drawn track the stored order isn't the play order, so only that one is fetched
+            entries = entries[:2]
+        budget = LOOKAHEAD_BYTES
+        for pos, entry in enumerate(entries):
+            if not entry.get('pending'):
+                continue
+            budget -= entry.get('size_estimate', 0)
+            # The track about to play is always fetched, the rest only while there's budget left
+            if pos > 1 and budget < 0:
+                break
+            self.start_pending(entry, Priority.ADD if pos <= 1 else Priority.PREFETCH, guild_id)
+
+    def start_pending(self, entry: dict, priority: Priority, guild_id: int) -> asyncio.Task:
+        task = self.pending_tasks.get(entry['file'])
+        if task is None:
+            job = Job(priority, guild_id)
+            task = asyncio.ensure_future(self._complete_pending(entry, job))
+            self.pending_tasks[entry['file']] = task
+            self.pending_jobs[entry['file']] = job
+            task.add_done_callback(lambda t, file=entry['file']: self._pending_done(file, t))
+        else:
+            # Already downloading, e.g. from the lookahead, possibly in a less urgent class
+            self.promote(entry, priority)
+        # The same link can be queued more than once, each entry is marked ready separately
+        task.add_done_callback(lambda t: self._mark_ready(entry, t))
+        return task
+
+    def promote(self, entry: dict, priority: Priority):
+        """Move a pending entry's download to a more urgent class, e.g. once it is the track to play."""
+        # The pending task may itself be waiting on a download someone else started
+        for job in (self.pending_jobs.get(entry['file']), self.inflight_jobs.get(TrackStore.key_for(entry))):
+            if job is not None:
+                self.executor.promote(job, priority)
+
+    def _pending_done(self, file: str, task: asyncio.Task):
+        self.pending_tasks.pop(file, None)
+        self.pending_jobs.pop(file, None)
+        if not task.cancelled() and task.exception():
+            log_failed(f"Lookahead download failed for {file}: {task.exception()}")
+
+    @staticmethod
+    def _mark_ready(entry: dict, task: asyncio.Task):
+        if not entry.get('pending') or task.cancelled() or task.exception():
+            return
+        entry.update(task.result())
+        entry.pop('pending', None)
+        entry.pop('size_estimate', None)
+
+    async def _complete_pending(self, entry: dict, job: Job) -> dict:
+        service, filename = TrackStore.key_for(entry)
+        downloaded = await asyncio.to_thread(self.toc.touch, entry['file'], round(time.time()), pin=True)
+        if downloaded is None:
+            downloaded = await self.fetch_track(service, filename, entry['link'], job=job)
+        logger.debug("Queued track ready: %s", entry['title'])
+        return downloaded
+
+    async def wait_ready(self, entry: dict, guild_id: int):
+        """
+        Wait until a queue entry's file is on disk, downloading it now if the lookahead hasn't yet.
+        A lookahead download already under way is promoted to the PLAY class.
+        """
+        if not entry.get('pending'):
+            return
+        task = self.start_pending(entry, Priority.PLAY, guild_id)
+        await asyncio.shield(task)
+        self._mark_ready(entry, task)
+
+    async def cached_track(self, full_path: str) -> dict | None:
+        # Off the event loop, since it can wait on another process's write lock. The hit is pinned
+        # in the same write, so no other process evicts it before it shows up in a queue
+        item = await asyncio.to_thread(self.toc.touch, full_path, round(time.time()), pin=True)
+        if item:
+            self.toc.record_hit(item)
+            logger.debug("File found in TOC: %s, refreshed timestamp.", full_path)
+        return item
+
+    async def resolve_track(self, service: str, filename: str, link: str, priority: Priority = Priority.ADD, guild_id: int = None) -> dict:
+        """Metadata for a track, from the TOC when cached or by downloading it."""
+        item = await self.cached_track(f"data/music/{service}/{filename}.opus")
+        if item:
+            return item
+        self.toc.record_miss()
+        return await self.fetch_track(service, filename, link, priority, guild_id)
+
+    def expand_playlist(self, link: str) -> list[str]:
+        """List the entry URLs of a YouTube or SoundCloud playlist with flat extraction (blocking)."""
+        with self.ydl_class({'extract_flat': 'in_playlist', 'quiet': True}) as ydl:
+            info = ydl.extract_info(link, download=False)
+        entries = info.get('entries') or []
+        return [e.get('webpage_url') or e.get('url') for e in entries if e and (e.get('webpage_url') or e.get('url'))]
+
+    async def batch_add(self, interaction: discord.Interaction, conn: discord.VoiceClient, links: list[str]):
+        """
+        Queue several links and/or whole playlists. Downloads run in parallel through the executor,
+        and each track is queued in order as soon as it and every track before it are ready.
+        """
+        await interaction.response.defer(ephemeral=True)
+
+        urls = []
+        for link in links:
+            if re.match(PLAYLIST_MATCH_STRING, link, flags=re.IGNORECASE):
+                try:
+                    urls += await self.executor.run(self.expand_playlist, link, guild_id=interaction.guild.id)
+                except Exception as e:
+                    log_failed(f"Failed to list playlist {link}: {e}")
+            else:
+                urls.append(link)
+        urls = urls[:MAX_BATCH_TRACKS]
+        if not urls:
+            await interaction.followup.send("No playable links found.", ephemeral=True)
+            return
+
+        progress = {'queued': 0, 'failed': 0, 'total': len(urls), 'current': None}
+        message = await interaction.followup.send(embed=self.batch_embed(progress), ephemeral=True, wait=True)
+        changed = asyncio.Event()
+
+        async def update_progress():
+            # Coalesce progress changes into at most one edit per interval
+            while True:
+                await changed.wait()
+                changed.clear()
+                try:
+                    await message.edit(embed=self.batch_embed(progress))
+                except discord.HTTPException as e:
+                    logger.debug("Progress edit failed: %s", e)
+                if progress['queued'] + progress['failed'] >= progress['total']:
+                    return
+                await asyncio.sleep(PROGRESS_EDIT_INTERVAL)
+
+        updater = asyncio.create_task(update_progress())
+
+        tasks = []
+        for url in urls:
+            service, match = self.match_service_and_id(url)
+            if service and match:
+                tasks.append(asyncio.ensure_future(self.resolve_track(service, '.'.join(match.groups()), url, Priority.ADD, interaction.guild.id)))
+            else:
+                tasks.append(None)
+
+        for url, task in zip(urls, tasks):
+            try:
+                if task is None:
+                    raise VideoDownloadError("unsupported URL")
+                metadata = await task
+            except Exception as e:
+                log_failed(f"Batch item failed: {url}: {e}")
+                progress['failed'] += 1
+            else:
+                self.player.add_to_queue(metadata=metadata, conn=conn, invoker=interaction.user.name)
+                progress['queued'] += 1
+                progress['current'] = metadata['title']
+            changed.set()
+
+        await updater
+        logger.info("Batch add finished: %d queued, %d failed", progress['queued'], progress['failed'])
+
+    @staticmethod
+    def batch_embed(progress: dict) -> discord.Embed:
+        done = progress['queued'] + progress['failed']
+        embed = utils.create_embed(
+            title="Batch added" if done >= progress['total'] else f"Adding tracks ({done}/{progress['total']})",
+            description=f"Last queued: {progress['current']}" if progress['current'] else "Downloading...",
+            color=0x1DB954,
+            queue_list=[]
+        )
+        embed.add_field(name="Queued", value=str(progress['queued']))
+        embed.add_field(name="Failed", value=str(progress['failed']))
+        return embed
+
+    async def stream_and_download(self, interaction: discord.Interaction, conn: discord.VoiceClient, service: str, filename: str, link: str, play_now: bool, requested_at: float, priority: Priority):
+        """
+        Queue the track straight away using its remote stream URL, then download the cached copy
+        in the background. Once the file lands the queue entry switches over to it.
+        """
+        try:
+            info = await self.resolve_info(service, filename, link, priority, interaction.guild.id)
+        except Exception as e:
+            await self.report_failure(interaction, link, e)
+            return
+
+        metadata = {
+            'title': info['title'],
+            'id': info['id'],
+            'file': f"data/music/{service}/{filename}.opus",
+            'service': service,
+            'duration': info.get('duration'),
+            'timestamp': round(time.time()),
+            'stream_url': info.get('url'),
+            'http_headers': info.get('http_headers', {}),
+            # Lets a restart re-download the track if it never finished caching
+            'link': link,
+        }
+        if not metadata['stream_url']:
+            # Merged formats have no single URL to stream from, wait for the download instead
+            metadata.pop('stream_url')
+
+        download = asyncio.ensure_future(self.fetch_track(service, filename, link, priority, interaction.guild.id))
+        if 'stream_url' in metadata:
+            embed = self.queue_track(metadata, conn, interaction, play_now)
+            metrics.streamed_tracks.inc()
+            logger.debug("Time to first audio: %.0fms (streaming)", (time.perf_counter() - requested_at) * 1000)
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            self.player.status.update(conn.channel, self.player.status.track_status(metadata))
+            logger.info("Streaming playback started: %s (%s)", metadata['title'], service)
+
+        try:
+            downloaded = await download
+        except Exception as e:
+            if 'stream_url' in metadata:
+                log_failed(f"Background download failed, track will keep streaming: {e}")
+            else:
+                await self.report_failure(interaction, link, e)
+            return
+
+        if 'stream_url' not in metadata:
+            embed = self.queue_track(downloaded, conn, interaction, play_now)
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            self.player.status.update(conn.channel, self.player.status.track_status(downloaded))
+            return
+
+        # ffmpeg streams the whole track even once the copy lands, so every streamed track is fetched twice
+        metrics.stream_refetch_bytes.inc(amount=downloaded.get('size', 0))
+        # Point the queued entry at the cached file for loops and replays
+        metadata.update(downloaded)
+        metadata.pop('stream_url', None)
+        metadata.pop('http_headers', None)
+        logger.debug("Streamed track cached: %s", metadata['file'])
+
+    def queue_track(self, metadata: dict, conn: discord.VoiceClient, interaction: discord.Interaction, play_now: bool) -> discord.Embed:
+        if play_now:
+            return self.player.add_to_queue(metadata=metadata, conn=conn, invoker=interaction.user.name, pos=1, skip=True)
+        return self.player.add_to_queue(metadata=metadata, conn=conn, invoker=interaction.user.name)
+
+    async def report_failure(self, interaction: discord.Interaction, link: str, error: Exception):
+        if isinstance(error, VideoTooLargeError):
+            await interaction.followup.send(str(error), ephemeral=True)
+            log_failed(f"Video too long: {link}")
+        else:
+            await interaction.followup.send(f"Download failed: {error}", ephemeral=True)
+            log_failed(f"Failed to download: {error}")
+
+    async def resolve_info(self, service: str, filename: str, link: str, priority: Priority = Priority.ADD, guild_id: int = None) -> dict:
+        """
+        Resolve a link's metadata on the executor.
+        Concurrent calls for the same (service, id) wait on the first extraction instead of starting their own.
+        """
+        key = (service, filename)
+        task = self.extracting.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.executor.run(self.extract_info, key, link, priority=priority, guild_id=guild_id))
+            self.extracting[key] = task
+            task.add_done_callback(lambda t: self.extracting.pop(key) if self.extracting.get(key) is t else None)
+        else:
+            logger.debug("Metadata for %s:%s already being resolved, waiting on it", service, filename)
+        return dict(await asyncio.shield(task))
+
+    async def fetch_track(self, service: str, filename: str, link: str, priority: Priority = Priority.ADD, guild_id: int = None, job: Job = None) -> dict:
+        """
+        Download a track and record it in the TOC, returning its metadata.
+        Concurrent calls for the same (service, id) wait on the first download instead of starting their own.
+        Pass a Job instead of priority and guild_id to be able to promote the download later.
+        """
+        key = (service, filename)
+        if job is None:
+            job = Job(priority, guild_id)
+        pending = self.inflight.get(key)
+        if pending:
+            logger.debug("Download already in progress for %s:%s, waiting on it", service, filename)
+            self.executor.promote(self.inflight_jobs[key], job.priority)
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        self.inflight_jobs[key] = job
+        try:
+            metadata = await self._download_track(service, filename, link, job)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception() # Mark as retrieved in case nobody else was waiting
+            raise
+        else:
+            future.set_result(metadata)
+            return metadata
+        finally:
+            self.inflight.pop(key, None)
+            self.inflight_jobs.pop(key, None)
+
+    async def _download_track(self, service: str, filename: str, link: str, job: Job) -> dict:
+        # Downloaded and normalised in a private staging directory, then renamed into data/music,
+        # so a crash never leaves a partial file where the cache expects a complete one
+        # Other bot processes sharing data/music wait here rather than downloading the same track
+        lock = FileLock(os.path.join(LOCK_DIR, f"{service}-{filename}.lock"))
+        await lock.acquire()
+        try:
+            full_path = f"data/music/{service}/{filename}.opus"
+            existing = await asyncio.to_thread(self.toc.touch, full_path, round(time.time()), pin=True)
+            if existing is not None and os.path.exists(full_path):
+                logger.debug("%s was downloaded by another process", full_path)
+                return existing
+
+            os.makedirs(STAGING_DIR, exist_ok=True)
+            stage = tempfile.mkdtemp(prefix=f"{service}-{filename}-", dir=STAGING_DIR)
+            try:
+                return await self._download_staged(service, filename, link, job, stage)
+            finally:
+                shutil.rmtree(stage, ignore_errors=True)
+        finally:
+            lock.release()
+
+    async def _download_staged(self, service: str, filename: str, link: str, job: Job, stage: str) -> dict:
         ydl_opts = {
-            'outtmpl': f'data/music/{service}/{filename}.%(ext)s',
+            'outtmpl': f'{stage}/{filename}.%(ext)s',
             'format': 'bestaudio/best',
             'noplaylist': True,
             'max-filesize': "25M",
@@ -82,56 +498,91 @@ class DownloaderHandler:
             }],
         }
 
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            try:
-                info = ydl.extract_info(link, download=False)
-                duration = info.get('duration', 0)
-                if duration >= 900:
-                    raise VideoTooLargeError("Video too long (must be below 15 minutes)")
-            except VideoTooLargeError as e:
-                await interaction.followup.send(str(e), ephemeral=True)
-                log_failed(f"Video too long: {link}")
-                return
-            except Exception as e:
-                await interaction.followup.send(f"Download failed: {e}", ephemeral=True)
-                log_failed(f"Failed to extract info: {e}")
-                return
-
-            logger.info(f"Downloading: {info['title']} ({duration}s)")
-            ydl.download(link)
+        info = await self.executor.run(self.extract_and_download, (service, filename), link, ydl_opts, job=job)
 
         metadata = {
             'title': info['title'],
             'id': info['id'],
-            'file': full_path,
+            'file': f"data/music/{service}/{filename}.opus",
             'service': service,
             'duration': info['duration'],
             'timestamp': round(time.time())
         }
-        toc.append(metadata)
-
-        # Enforce TOC size limit
-        if len(toc) > MAX_AUDIO_FILES:
-            logger.debug(f"TOC size exceeded, removing old files...")
-            toc.sort(key=lambda x: x['timestamp'], reverse=True)
-            while len(toc) > MAX_AUDIO_FILES:
-                old = toc.pop()
-                try:
-                    os.remove(old['file'])
-                    logger.info(f"Deleted old audio file: {old['file']}")
-                except Exception as e:
-                    log_failed(f"Error deleting {old['file']}: {e}")
+        await self.executor.run(self.publish, f"{stage}/{filename}.opus", metadata, job=job)
+        logger.debug("TOC updated.")
+        await asyncio.to_thread(self.enforce_cache_budget)
 
-        with open("data/toc.json", 'w') as f:
-            json.dump(toc, f)
-            logger.debug("TOC updated.")
+        return metadata
 
-        if play_now:
-            conn.stop()
-            embed = self.player.add_to_queue(metadata=metadata, conn=conn, invoker=interaction.user.name, pos=1, skip=True)
+    def publish(self, staged: str, metadata: dict):
+        """Normalise a staged download, move it into the cache with its TOC record and index it (blocking)."""
+        metadata.update(ingest.normalise(staged))
+        metadata['size'] = os.path.getsize(staged)
+        # Pinned as it lands, so it survives until it is queued
+        self.toc.publish(staged, metadata, pin=True)
+        ogg_index.build(metadata['file'])
+
+    def enforce_cache_budget(self):
+        # Tracks queued in any guild stay on disk even if they are the oldest. Pins are published
+        # first so other processes evicting at the same time see them too
+        self.toc.heartbeat(self.player.pin_counts())
+        removed = self.toc.evict(AUDIO_CACHE_BYTES, pinned=self.player.pinned_files())
+        for old in removed:
+            try:
+                os.remove(old['file'])
+                ogg_index.remove(old['file'])
+                logger.info("Deleted old audio file: %s (%s bytes)", old['file'], old['size'])
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                log_failed(f"Error deleting {old['file']}: {e}")
+
+        stats = self.toc.stats()
+        logger.debug(
+            "Cache: %d files, %.1f/%.0f MiB, hit rate %.0f%%, %.1f MiB saved",
+            stats['entries'], stats['bytes'] / 1048576, AUDIO_CACHE_BYTES / 1048576,
+            stats['hit_rate'] * 100, stats['bytes_saved'] / 1048576
+        )
+
+    def extract_and_download(self, key: tuple[str, str], link: str, ydl_opts: dict) -> dict:
+        """
+        Blocking yt-dlp work, meant to be run on the DownloadExecutor pool.
+        The page is resolved once and the same info dict is handed to the download stage.
+        """
+        with self.ydl_class(ydl_opts) as ydl:
+            cached = self.metadata.get(key) is not None
+            info = self.extract_info(key, link, ydl)
+
+            logger.info("Downloading: %s (%ss)", info['title'], info.get('duration'))
+            try:
+                with metrics.download_stage.time("download"):
+                    ydl.process_ie_result(info, download=True)
+            except yt_dlp.utils.DownloadError:
+                if not cached:
+                    raise
+                # Stream URLs in cached info may have expired, resolve the page again
+                logger.debug("Cached metadata for %s:%s is stale, re-extracting", *key)
+                self.metadata.discard(key)
+                with metrics.download_stage.time("download"):
+                    info = ydl.extract_info(link, download=True)
+                self.metadata.put(key, ydl.sanitize_info(info))
+        return info
+
+    def extract_info(self, key: tuple[str, str], link: str, ydl=None) -> dict:
+        """Resolve a link's metadata (blocking), using the metadata cache and enforcing the length limit."""
+        cached = self.metadata.get(key)
+        if cached:
+            logger.debug("Using cached metadata for %s:%s", *key)
+            info = dict(cached)
+        elif ydl is None:
+            with self.ydl_class({'format': 'bestaudio/best', 'noplaylist': True}) as ydl:
+                return self.extract_info(key, link, ydl)
         else:
-            embed = self.player.add_to_queue(metadata=metadata, conn=conn, invoker=interaction.user.name)
+            with metrics.download_stage.time("extract"):
+                info = ydl.extract_info(link, download=False)
+            self.metadata.put(key, ydl.sanitize_info(info))
 
-        await interaction.followup.send(embed=embed, ephemeral=True)
-        await conn.channel.edit(status=f"🎶 {service}: {metadata['title']}")
-        logger.info(f"Playback started: {metadata['title']} ({service})")
+        duration = info.get('duration') or 0
+        if duration >= 900:
+            raise VideoTooLargeError("Video too long (must be below 15 minutes)")
+        return info
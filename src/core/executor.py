@@ -0,0 +1,160 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+from enum import IntEnum
+from concurrent.futures import ThreadPoolExecutor
+from core.log_config import logger
+
+# Maximum number of yt-dlp jobs allowed to run at the same time
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "2"))
+
+class Priority(IntEnum):
+    """Download classes, most urgent first."""
+    PLAY = 0      # /play, someone is waiting for audio right now
+    ADD = 1       # /add and /addbatch
+    JUKEBOX = 2   # /createjb
+    PREFETCH = 3  # speculative downloads of upcoming queue entries
+
+class Job:
+    """
+    A download's place in the executor queue, shared by every run made for it.
+    DownloadExecutor.promote() moves it to a more urgent class, including a run already waiting.
+    """
+    def __init__(self, priority: Priority = Priority.ADD, guild_id: int = None):
+        self.priority = priority
+        self.guild_id = guild_id
+        # Heap entry of the run waiting for a slot, if any. Older entries for the job are stale
+        self.waiting: tuple | None = None
+
+class DownloadExecutor:
+    """
+    Runs blocking yt-dlp work on a thread pool so the gateway loop keeps serving
+    heartbeats and other interactions while tracks are downloading.
+
+    Jobs wait in a priority queue: a more urgent class always goes first, and within a class
+    guilds take turns (each guild's jobs get increasing tickets from a per-class virtual clock),
+    so one guild's long batch cannot starve the others. Speculative jobs never take the last
+    free slot, keeping it available for interactive requests.
+    """
+    def __init__(self, max_workers: int = MAX_CONCURRENT_DOWNLOADS):
+        self.max_workers = max(1, max_workers)
+        self.pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="download")
+        self.active = 0
+        self.active_speculative = 0
+        self._waiting = []
+        self._seq = itertools.count()
+        self._vclock = {p: 0 for p in Priority}
+        self._guild_tickets: dict[tuple[Priority, int], int] = {}
+        self.wait_stats = {p: {'jobs': 0, 'total_wait': 0.0, 'max_wait': 0.0} for p in Priority}
+
+    @property
+    def speculative_limit(self) -> int:
+        return max(1, self.max_workers - 1)
+
+    def _dispatch(self):
+        while self._waiting and self.active < self.max_workers:
+            entry = self._waiting[0]
+            priority, ticket, _, future, job = entry
+            if future.done() or job.waiting is not entry:
+                # Waiter was cancelled before it got a slot, or the job was promoted and re-queued
+                heapq.heappop(self._waiting)
+                continue
+            if priority == Priority.PREFETCH and self.active_speculative >= self.speculative_limit:
+                return
+            heapq.heappop(self._waiting)
+            self._vclock[priority] = max(self._vclock[priority], ticket)
+            self.active += 1
+            if priority == Priority.PREFETCH:
+                self.active_speculative += 1
+            job.waiting = None
+            future.set_result(priority)
+
+    def _release(self, priority: Priority):
+        self.active -= 1
+        if priority == Priority.PREFETCH:
+            self.active_speculative -= 1
+        self._dispatch()
+
+    def _push(self, job: Job, future: asyncio.Future):
+        key = (job.priority, job.guild_id)
+        ticket = max(self._guild_tickets.get(key, 0), self._vclock[job.priority]) + 1
+        self._guild_tickets[key] = ticket
+        job.waiting = (job.priority, ticket, next(self._seq), future, job)
+        heapq.heappush(self._waiting, job.waiting)
+
+    async def _acquire(self, job: Job) -> Priority:
+        """Wait for a slot and return the class it was granted under."""
+        future = asyncio.get_running_loop().create_future()
+        queued_at = time.perf_counter()
+        self._push(job, future)
+        self._dispatch()
+        try:
+            priority = await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._release(future.result())
+            raise
+
+        waited = time.perf_counter() - queued_at
+        stats = self.wait_stats[priority]
+        stats['jobs'] += 1
+        stats['total_wait'] += waited
+        stats['max_wait'] = max(stats['max_wait'], waited)
+        if waited > 0.5:
+            logger.debug("%s download waited %.1fs for a slot", priority.name, waited)
+        return priority
+
+    def promote(self, job: Job, priority: Priority):
+        """
+        Move a job to a more urgent class. A run still waiting is pushed again with the new key
+        and its old heap entry is dropped when it reaches the top. Later runs use the new class.
+        """
+        if priority >= job.priority:
+            return
+        logger.debug("Download job promoted from %s to %s", job.priority.name, priority.name)
+        job.priority = priority
+        entry = job.waiting
+        if entry is not None and not entry[3].done():
+            self._push(job, entry[3])
+            self._dispatch()
+
+    async def run(self, func, *args, priority: Priority = Priority.ADD, guild_id: int = None, job: Job = None):
+        """
+        Run func(*args) on the pool once a slot is free for its class and await the result.
+        Pass a Job to share one queue position between several runs and be able to promote it.
+        """
+        if job is None:
+            job = Job(priority, guild_id)
+        priority = await self._acquire(job)
+        logger.debug("Download job started (%d/%d active, %s)", self.active, self.max_workers, priority.name)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.pool, func, *args)
+        finally:
+            self._release(priority)
+
+    def submit(self, func, *args, priority: Priority = Priority.ADD, guild_id: int = None) -> asyncio.Task:
+        """Schedule func on the pool and return an awaitable task without waiting for it."""
+        return asyncio.get_running_loop().create_task(self.run(func, *args, priority=priority, guild_id=guild_id))
+
+    def queue_stats(self) -> dict:
+        """Jobs waiting and average/max wait per class, in seconds."""
+        waiting = {p: 0 for p in Priority}
+        for entry in self._waiting:
+            priority, _, _, future, job = entry
+            if not future.done() and job.waiting is entry:
+                waiting[priority] += 1
+        return {
+            p.name.lower(): {
+                'waiting': waiting[p],
+                'jobs': s['jobs'],
+                'avg_wait': s['total_wait'] / s['jobs'] if s['jobs'] else 0.0,
+                'max_wait': s['max_wait'],
+            }
+            for p, s in self.wait_stats.items()
+        }
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -9,7 +9,6 @@ def verify_file_integrity():
         "data/music",
         "data/jukebox",
         "data/playlists",
-        "data/toc.json",
         "logs/output.log",
         "logs/discordoutput.log",
         ".env"
@@ -18,13 +17,6 @@ def verify_file_integrity():
     for file in required_files:
         path = Path(file)
 
-        # Handle toc.json with default content if missing
-        if file == "data/toc.json" and not path.exists():
-            with open(file, 'w') as f:
-                f.write('[]')
-            logger.warning(f"File '{file}' was missing. Created with default content.")
-            continue
-
         if not path.exists():
             log_failed(f"Missing required file or directory: '{file}'")
             logger.info("Prompting user to create missing file/directory...")
@@ -34,11 +26,11 @@ def verify_file_integrity():
             if response == 'y':
                 if '.' not in path.name:
                     path.mkdir(parents=True, exist_ok=True)
-                    logger.info(f"Directory '{file}' created.")
+                    logger.info("Directory '%s' created.", file)
                 else:
                     with open(file, 'w') as f:
                         f.write("")
-                    logger.info(f"File '{file}' created.")
+                    logger.info("File '%s' created.", file)
             else:
                 log_failed(f"User declined to create '{file}'. Exiting integrity check.")
                 return False
@@ -0,0 +1,74 @@
+import os
+import asyncio
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+class FileLock:
+    """
+    Exclusive advisory lock on a file, shared between processes. The OS drops it if the
+    holding process dies, so a crashed download never blocks the others.
+
+    The holder deletes the file on release, so lock files don't pile up. Someone who opened
+    the file just before that ends up locking a deleted file, so after locking it checks the
+    path still points at the same file and starts over if not.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = None
+
+    def try_acquire(self) -> bool:
+        while True:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            except OSError:
+                os.close(fd)
+                return False
+            if self._is_current(fd):
+                self.fd = fd
+                return True
+            # Locked a file the previous holder had already deleted
+            os.close(fd)
+
+    def _is_current(self, fd: int) -> bool:
+        if not fcntl:
+            # Windows can't delete an open file, so it is never replaced
+            return True
+        try:
+            on_disk = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        held = os.fstat(fd)
+        return (on_disk.st_dev, on_disk.st_ino) == (held.st_dev, held.st_ino)
+
+    async def acquire(self, poll: float = 0.05, max_poll: float = 1.0):
+        """Wait for the lock without tying up a thread, backing off while another process holds it."""
+        while not self.try_acquire():
+            await asyncio.sleep(poll)
+            poll = min(poll * 2, max_poll)
+
+    def release(self):
+        if self.fd is None:
+            return
+        try:
+            if fcntl:
+                # Deleted while still held: anyone who opened it before now sees that once they lock it
+                try:
+                    os.remove(self.path)
+                except FileNotFoundError:
+                    pass
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self.fd)
+            self.fd = None
@@ -0,0 +1,206 @@
+import random
+import threading
+from collections import Counter
+
+# Dead slots at the front of the list are dropped once there are this many
+COMPACT_THRESHOLD = 64
+
+class GuildQueue:
+    """
+    Per-guild track queue. Index 0 is the track currently playing.
+
+    Tracks live in a list with a moving head index, so advancing is O(1) and
+    positional access stays O(1). All methods take a lock because after_track
+    runs on discord.py's audio thread while commands mutate from the event loop.
+
+    Shuffle is a playback order rather than a reordering: each time the queue
+    advances, the next track is drawn at random from the remaining ones and swapped
+    into position 1 (an incremental Fisher-Yates shuffle), so toggling it and adding
+    tracks never touches the rest of the queue.
+    """
+    def __init__(self, tracks=(), loop: bool = False, shuffle: bool = False):
+        self.lock = threading.RLock()
+        self._items = list(tracks)
+        self._head = 0
+        self._members = Counter(track['file'] for track in self._items)
+        self.loop = loop
+        self.shuffle = shuffle
+        # Where each repeat starts when looping the current track, in seconds
+        self.loop_start = 0.0
+        # Set by skip() so the next advance moves on even in loop mode
+        self._skip_pending = False
+        # Whether position 1 has already been picked as the next track in shuffle mode
+        self._drawn = False
+        # Bumped on every change to the track list, so snapshots can tell when it needs rewriting
+        self.version = 0
+
+    def __len__(self):
+        return len(self._items) - self._head
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def __getitem__(self, index):
+        with self.lock:
+            if isinstance(index, slice):
+                # Resolve the slice against the live part so the dead prefix is never copied
+                start, stop, step = index.indices(len(self))
+                if step == 1:
+                    return self._items[self._head + start:self._head + stop]
+                return [self._items[self._head + i] for i in range(start, stop, step)]
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError("queue index out of range")
+            return self._items[self._head + index]
+
+    def __contains__(self, file: str):
+        return self._members.get(file, 0) > 0
+
+    def snapshot(self) -> list[dict]:
+        with self.lock:
+            return self._items[self._head:]
+
+    def files(self) -> set[str]:
+        with self.lock:
+            return set(self._members)
+
+    def file_counts(self) -> Counter:
+        """How many entries refer to each file."""
+        with self.lock:
+            return Counter(self._members)
+
+    @property
+    def current(self) -> dict | None:
+        with self.lock:
+            return self._items[self._head] if self else None
+
+    @property
+    def skip_pending(self) -> bool:
+        """Whether skip() was called and the queue hasn't advanced since."""
+        return self._skip_pending
+
+    def peek_next(self) -> dict | None:
+        """The entry that will play after the current one."""
+        with self.lock:
+            if self.loop and not self._skip_pending:
+                return self.current
+            self._draw()
+            return self[1] if len(self) > 1 else None
+
+    def _draw(self):
+        """In shuffle mode, pick the next track at random and swap it into position 1."""
+        if not self.shuffle or self._drawn:
+            return
+        if len(self) > 2:
+            pick = self._head + random.randrange(1, len(self))
+            nxt = self._head + 1
+            self._items[nxt], self._items[pick] = self._items[pick], self._items[nxt]
+            self.version += 1
+        self._drawn = True
+
+    def _add_member(self, track: dict):
+        self._members[track['file']] += 1
+        self.version += 1
+
+    def _drop_member(self, track: dict):
+        file = track['file']
+        self.version += 1
+        self._members[file] -= 1
+        if self._members[file] <= 0:
+            del self._members[file]
+
+    def append(self, track: dict):
+        with self.lock:
+            self._items.append(track)
+            self._add_member(track)
+
+    def insert(self, pos: int, track: dict):
+        with self.lock:
+            pos = max(0, min(pos, len(self)))
+            self._items.insert(self._head + pos, track)
+            self._add_member(track)
+            if pos == 1:
+                # Explicitly placed next, e.g. /play, so shuffle must not replace it
+                self._drawn = True
+            elif pos == 0:
+                self._drawn = False
+
+    def extend(self, tracks, unique: bool = False) -> int:
+        """Append tracks, optionally skipping files already in the queue. Returns how many were added."""
+        added = 0
+        with self.lock:
+            for track in tracks:
+                if unique and track['file'] in self:
+                    continue
+                self._items.append(track)
+                self._add_member(track)
+                added += 1
+        return added
+
+    def remove(self, pos: int) -> dict:
+        with self.lock:
+            track = self[pos]
+            if pos < 0:
+                pos += len(self)
+            del self._items[self._head + pos]
+            self._drop_member(track)
+            if pos <= 1:
+                self._drawn = False
+            return track
+
+    def move(self, src: int, dst: int):
+        with self.lock:
+            track = self.remove(src)
+            self._items.insert(self._head + max(0, min(dst, len(self))), track)
+            self._add_member(track)
+
+    def clear(self):
+        with self.lock:
+            self._items = []
+            self._head = 0
+            self._members.clear()
+            self.version += 1
+            self._skip_pending = False
+            self._drawn = False
+
+    def skip(self, n: int = 1) -> int:
+        """
+        Drop the n-1 tracks after the current one and make the next advance leave the
+        current track even when looping. Returns how many tracks will be skipped in total.
+        """
+        with self.lock:
+            n = max(1, min(n, len(self)))
+            for _ in range(n - 1):
+                if len(self) < 2:
+                    break
+                self._draw()
+                self.remove(1)
+            self._skip_pending = True
+            return n
+
+    def advance(self) -> dict | None:
+        """Move past the current track (unless looping) and return the new current track."""
+        with self.lock:
+            if not self:
+                # A skip of tracks that were removed meanwhile must not carry over to new ones
+                self._skip_pending = False
+                return None
+            if not self.loop or self._skip_pending:
+                self._draw()
+                self._drop_member(self._items[self._head])
+                self._items[self._head] = None
+                self._head += 1
+                self._drawn = False
+                self.loop_start = 0.0
+                self._compact()
+            self._skip_pending = False
+            return self.current
+
+    def _compact(self):
+        if self._head >= COMPACT_THRESHOLD and self._head * 2 >= len(self._items):
+            del self._items[:self._head]
+            self._head = 0
@@ -0,0 +1,140 @@
+import os
+import sys
+import json
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from core import metrics, ogg_index
+from core.ogg import iter_packets, OggError
+from core.log_config import logger, log_ok, log_failed
+
+# EBU R128 integrated loudness every track is brought to
+TARGET_LUFS = float(os.getenv("TARGET_LUFS", "-16"))
+# Gain is capped so the true peak stays below this after normalising
+MAX_TRUE_PEAK = -1.0
+MAX_GAIN = 20.0
+NORMALISE_AUDIO = os.getenv("NORMALISE_AUDIO", "1").lower() in ("1", "true", "t")
+# Vorbis comment written into normalised files so they are never processed twice
+NORMALISED_TAG = b"BOT_NORMALISED="
+
+class IngestError(Exception): pass
+
+_running = 0
+_running_lock = threading.Lock()
+
+def running_encodes() -> int:
+    """Ingest runs (each one spawns ffmpeg twice, one after the other) currently in progress."""
+    return _running
+
+def _run_ffmpeg(args: list[str]) -> subprocess.CompletedProcess:
+    metrics.ffmpeg_spawned.inc("ingest")
+    return subprocess.run(["ffmpeg", *args], capture_output=True, text=True)
+
+def measure_loudness(path: str) -> dict:
+    """Run ffmpeg's loudnorm analysis pass and return its measurements (input_i, input_tp, ...)."""
+    result = _run_ffmpeg(
+        ["-hide_banner", "-nostats", "-i", path,
+         "-af", f"loudnorm=I={TARGET_LUFS}:TP={MAX_TRUE_PEAK}:print_format=json",
+         "-f", "null", "-"]
+    )
+    stderr = result.stderr
+    start = stderr.rfind("{")
+    if result.returncode != 0 or start < 0:
+        raise IngestError(f"Loudness analysis failed for {path}: {stderr.strip()[-200:]}")
+    return json.loads(stderr[start:stderr.rfind("}") + 1])
+
+def is_normalised(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            packets = iter_packets(f.read(65536))
+            next(packets)
+            return NORMALISED_TAG in next(packets)
+    except (OSError, OggError, StopIteration, ValueError):
+        return False
+
+def normalise_file(path: str) -> dict:
+    """
+    Measure a track's loudness once and re-encode it with the gain baked in, as 48 kHz Opus
+    in 20 ms frames so playback can pass the packets straight to Discord.
+    Returns the fields to store with the track's metadata.
+    """
+    levels = measure_loudness(path)
+    loudness = float(levels['input_i'])
+    peak = float(levels['input_tp'])
+    if loudness == float("-inf"):
+        gain = 0.0 # Silence, nothing to normalise
+    else:
+        gain = min(TARGET_LUFS - loudness, MAX_TRUE_PEAK - peak, MAX_GAIN)
+    gain = round(gain, 2)
+
+    tmp_path = path + ".ingest.opus"
+    result = _run_ffmpeg(
+        ["-hide_banner", "-nostats", "-y", "-i", path,
+         "-af", f"volume={gain}dB", "-map_metadata", "0",
+         "-c:a", "libopus", "-b:a", "128k", "-ar", "48000", "-ac", "2",
+         "-frame_duration", "20", "-application", "audio",
+         "-metadata", f"{NORMALISED_TAG.decode()[:-1]}={gain}",
+         tmp_path]
+    )
+    if result.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise IngestError(f"Re-encode failed for {path}: {result.stderr.strip()[-200:]}")
+    os.replace(tmp_path, path)
+
+    logger.debug("Normalised %s: %s LUFS, gain %sdB", path, loudness, gain)
+    return {'loudness': loudness, 'gain': gain, 'size': os.path.getsize(path)}
+
+def ingest(path: str) -> dict:
+    """
+    Ingest stage run after yt-dlp's FFmpegExtractAudio: normalise the file, then write its page
+    index for seeking. Failures leave the file untouched.
+    """
+    levels = normalise(path)
+    ogg_index.build(path)
+    return levels
+
+def normalise(path: str) -> dict:
+    if not NORMALISE_AUDIO or is_normalised(path):
+        return {}
+    global _running
+    with _running_lock:
+        _running += 1
+    try:
+        with metrics.download_stage.time("transcode"):
+            return normalise_file(path)
+    except (IngestError, OSError, ValueError, KeyError) as e:
+        log_failed(f"Could not normalise {path}: {e}")
+        return {}
+    finally:
+        with _running_lock:
+            _running -= 1
+
+def backfill(paths: list[str], workers: int = os.cpu_count() or 2) -> dict[str, dict]:
+    """Normalise existing files in parallel, skipping ones that were already processed, and index them all."""
+    opus = [p for p in paths if p.endswith(".opus")]
+    pending = [p for p in opus if not is_normalised(p)]
+    logger.info("Normalising %d of %d files with %d workers", len(pending), len(paths), workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = dict(zip(pending, pool.map(ingest, pending)))
+        # Already normalised files only need their index checked
+        list(pool.map(ogg_index.load, [p for p in opus if p not in results]))
+    return results
+
+if __name__ == "__main__":
+    # Usage (from src/): python -m core.ingest data/music data/jukebox data/playlists
+    from core.track_store import TrackStore
+
+    paths = []
+    for root in sys.argv[1:] or ["data/music", "data/jukebox", "data/playlists"]:
+        for dirpath, _, filenames in os.walk(root):
+            paths += [os.path.join(dirpath, f).replace("\\", "/") for f in filenames]
+
+    results = backfill(paths)
+    toc = TrackStore()
+    for path, fields in results.items():
+        record = toc.get(path)
+        if record and fields:
+            record.update(fields)
+            toc.add(record)
+    log_ok(f"Normalised {sum(1 for f in results.values() if f)} files")
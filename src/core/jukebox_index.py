@@ -0,0 +1,190 @@
+import os
+import re
+import time
+import threading
+from bisect import bisect_left, insort
+from core.log_config import logger
+
+# Minimum seconds between mtime checks of the jukebox folders
+RESCAN_INTERVAL = 5
+MAX_RESULTS = 25
+# Fuzzy search only scores this many candidates, taken from the rarest trigrams of the query
+FUZZY_CANDIDATES = 256
+
+TOKEN_SPLIT = re.compile(r"[^a-z0-9]+")
+
+def trigrams(text: str) -> set[str]:
+    text = f"  {text} "
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class _Snapshot:
+    """Set of lookup structures, swapped in whole after a rescan and updated in place by add()."""
+    def __init__(self, files: list[str], folders: list[str]):
+        self.files = sorted(files, key=str.lower)
+        self.folders = sorted(folders, key=str.lower)
+        self.by_name = sorted((f.lower(), f) for f in self.files)
+        self.top_level = [f for f in self.files if '/' not in f]
+
+        self.tokens = []
+        self.grams: dict[str, set[str]] = {}
+        for f in self.files:
+            self._index_terms(f, self.tokens.append)
+        self.tokens.sort()
+
+    def _index_terms(self, f: str, add_token):
+        name = f.lower()
+        for token in set(TOKEN_SPLIT.split(name)):
+            if token:
+                add_token((token, f))
+        for gram in trigrams(name):
+            self.grams.setdefault(gram, set()).add(f)
+
+    def __contains__(self, f: str):
+        i = bisect_left(self.by_name, (f.lower(), f))
+        return i < len(self.by_name) and self.by_name[i][1] == f
+
+    def insert(self, f: str):
+        insort(self.files, f, key=str.lower)
+        insort(self.by_name, (f.lower(), f))
+        if '/' not in f:
+            insort(self.top_level, f, key=str.lower)
+        else:
+            parts = f.split('/')[:-1]
+            for i in range(len(parts)):
+                folder = '/'.join(parts[:i + 1])
+                if folder not in self.folders:
+                    insort(self.folders, folder, key=str.lower)
+        self._index_terms(f, lambda token: insort(self.tokens, token))
+
+class JukeboxIndex:
+    """
+    Searchable index of the files in data/jukebox for autocomplete.
+    Prefix matches use bisect over sorted names and word tokens, fuzzy matches use a trigram index.
+    The index is rebuilt in the background when a folder's mtime changes.
+    """
+    def __init__(self, root: str = "data/jukebox"):
+        self.root = root
+        self.lock = threading.Lock()
+        self.dir_mtimes: dict[str, int] = {}
+        self.last_check = 0.0
+        self.rescanning = False
+        self.snapshot = _Snapshot([], [])
+        self.rescan()
+
+    def _walk(self):
+        files, folders, mtimes = [], [], {}
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            mtimes[dirpath] = os.stat(dirpath).st_mtime_ns
+            folder = os.path.relpath(dirpath, self.root).replace('\\', '/')
+            folder = '' if folder == '.' else folder
+            folders += [f"{folder}/{d}".strip('/') for d in dirnames]
+            files += [f"{folder}/{f}".strip('/') for f in filenames]
+        return files, folders, mtimes
+
+    def rescan(self):
+        start = time.perf_counter()
+        files, folders, mtimes = self._walk()
+        snapshot = _Snapshot(files, folders)
+        with self.lock:
+            self.snapshot = snapshot
+            self.dir_mtimes = mtimes
+            self.last_check = time.monotonic()
+            self.rescanning = False
+        logger.debug("Jukebox index built: %d files in %.0fms", len(files), (time.perf_counter() - start) * 1000)
+
+    def _changed(self) -> bool:
+        for path, mtime in list(self.dir_mtimes.items()):
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def maybe_rescan(self):
+        """Cheap staleness check: stat the known folders at most every RESCAN_INTERVAL seconds."""
+        now = time.monotonic()
+        with self.lock:
+            if self.rescanning or now - self.last_check < RESCAN_INTERVAL:
+                return
+            self.last_check = now
+        if self._changed():
+            with self.lock:
+                self.rescanning = True
+            threading.Thread(target=self.rescan, name="jukebox-rescan", daemon=True).start()
+
+    def add(self, path: str):
+        """Add a file written by /createjb without waiting for a rescan."""
+        rel = os.path.relpath(path, self.root).replace('\\', '/')
+        with self.lock:
+            if rel in self.snapshot:
+                return
+            self.snapshot.insert(rel)
+            # Our own write changed the folder mtime, record it so we don't rebuild again
+            folder = os.path.dirname(path) or self.root
+            try:
+                self.dir_mtimes[folder] = os.stat(folder).st_mtime_ns
+            except OSError:
+                pass
+
+    def _prefix(self, pairs: list[tuple[str, str]], query: str):
+        i = bisect_left(pairs, (query,))
+        while i < len(pairs) and pairs[i][0].startswith(query):
+            yield pairs[i][1]
+            i += 1
+
+    def search(self, query: str, limit: int = MAX_RESULTS) -> list[tuple[str, str]]:
+        """Return up to limit (name, value) pairs, best matches first."""
+        self.maybe_rescan()
+        snapshot = self.snapshot
+        query = query.lower()
+
+        if not query:
+            results = [(f + '/', f) for f in snapshot.folders]
+            results += [(f[:-5], f) for f in snapshot.top_level]
+            return results[:limit]
+
+        seen = set()
+        results = []
+        def take(name, value):
+            if value not in seen and len(results) < limit:
+                seen.add(value)
+                results.append((name, value))
+
+        for f in self._prefix(snapshot.by_name, query):
+            take(f[:-5], f)
+            if len(results) >= limit:
+                return results
+
+        for folder in snapshot.folders:
+            if query in folder.lower():
+                take(folder + '/', folder)
+
+        for f in self._prefix(snapshot.tokens, query):
+            take(f[:-5], f)
+            if len(results) >= limit:
+                return results
+
+        # Fall back to ranked fuzzy matching on shared trigrams. Candidates come from the
+        # rarest trigrams first so common ones ("the", "mix") don't blow up the work.
+        postings = sorted((snapshot.grams.get(gram, set()) for gram in trigrams(query)), key=len)
+        candidates = set()
+        for posting in postings:
+            for f in posting:
+                if len(candidates) >= FUZZY_CANDIDATES:
+                    break
+                candidates.add(f)
+            if len(candidates) >= FUZZY_CANDIDATES:
+                break
+
+        threshold = max(1, len(postings) // 2)
+        scored = []
+        for f in candidates:
+            score = sum(f in posting for posting in postings)
+            if score >= threshold:
+                scored.append((-score, len(f), f))
+        for _, _, f in sorted(scored):
+            if len(results) >= limit:
+                break
+            take(f[:-5], f)
+        return results
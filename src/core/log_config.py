@@ -1,22 +1,23 @@
 # log_config.py
 import logging
+import logging.handlers
 import os
 import time
+import queue
+import atexit
 import shutil
 from pathlib import Path
 from colorama import init, Fore, Style
 
+# Level for the bot's own logger (DEBUG, INFO, WARNING, ...)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Log files are rotated at this size, keeping LOG_BACKUPS old files
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_MB", "5")) * 1024 * 1024
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "3"))
+
 # Ensure logs directory exists
 Path("logs").mkdir(parents=True, exist_ok=True)
 
-# Clear custom log file
-with open("logs/output.log", "w", encoding="utf-8") as f:
-    f.truncate(0)
-
-# Clear Discord log file
-with open("logs/discordoutput.log", "w", encoding="utf-8") as f:
-    f.truncate(0)
-
 # Colorama setup
 init(strip=False, convert=False, autoreset=True)
 
@@ -32,49 +33,80 @@ class ColorFormatter(logging.Formatter):
 
     ANSI_RESET = Style.RESET_ALL + "\033[0m"
 
+    def __init__(self, fmt: str):
+        super().__init__(fmt)
+        # One formatter per level with the colour baked into the format string,
+        # so records are never modified and nothing is rebuilt per call
+        self.by_level = {
+            level: logging.Formatter(fmt.replace("%(levelname)s", color + "%(levelname)s" + self.ANSI_RESET))
+            for level, color in self.COLORS.items()
+        }
+
     def format(self, record):
-        message_only = getattr(record, "no_level", False)
         suffix = self.ANSI_RESET + "\n"
 
-        if message_only:
+        if getattr(record, "no_level", False):
             return record.getMessage().rstrip() + suffix
 
-        level_color = self.COLORS.get(record.levelno, Fore.WHITE)
-        record.levelname = level_color + record.levelname + self.ANSI_RESET
-
-        base_message = super().format(record)
+        formatter = self.by_level.get(record.levelno)
+        base_message = formatter.format(record) if formatter else super().format(record)
         return base_message.rstrip() + suffix
 
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread untouched. The stock QueueHandler formats the
+    message before queueing it, which would put the formatting back on the calling thread.
+    """
+    def prepare(self, record):
+        return record
+
+def rotating_handler(path: str, formatter: logging.Formatter) -> logging.Handler:
+    handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8", delay=True
+    )
+    # Start each run with a fresh file, keeping the previous runs as backups
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        handler.doRollover()
+    handler.setFormatter(formatter)
+    return handler
+
 # Formatter instance
 logFormatter = ColorFormatter("[%(levelname)s] :: %(message)s")
 
-# Create and configure main bot logger
-logger = logging.getLogger("bot")
-logger.setLevel(logging.DEBUG)
-
-# Console handler
+# Console and custom log file, bot records only
 consoleHandler = logging.StreamHandler()
-consoleHandler.setLevel(logging.DEBUG)
 consoleHandler.setFormatter(logFormatter)
-logger.addHandler(consoleHandler)
+consoleHandler.addFilter(logging.Filter("bot"))
 
-# File handler for custom logs
-fileHandler = logging.FileHandler("logs/output.log", encoding="utf-8")
-fileHandler.setLevel(logging.DEBUG)
-fileHandler.setFormatter(logFormatter)
-logger.addHandler(fileHandler)
+fileHandler = rotating_handler("logs/output.log", logFormatter)
+fileHandler.addFilter(logging.Filter("bot"))
 
 # File handler for Discord logs only (no color formatter)
-discordFileHandler = logging.FileHandler("logs/discordoutput.log", encoding="utf-8")
-discordFileHandler.setLevel(logging.DEBUG)
-discordFileHandler.setFormatter(logging.Formatter("[%(levelname)s] :: %(message)s"))
+discordFileHandler = rotating_handler("logs/discordoutput.log", logging.Formatter("[%(levelname)s] :: %(message)s"))
+discordFileHandler.addFilter(logging.Filter("discord"))
+
+# Callers only pay for putting a record on the queue, the handlers run on the listener thread
+log_queue = queue.SimpleQueue()
+queueHandler = LazyQueueHandler(log_queue)
+listener = logging.handlers.QueueListener(
+    log_queue, consoleHandler, fileHandler, discordFileHandler, respect_handler_level=True
+)
+listener.start()
+atexit.register(listener.stop)
+
+# Create and configure main bot logger
+logger = logging.getLogger("bot")
+logger.setLevel(LOG_LEVEL)
+logger.addHandler(queueHandler)
+logger.propagate = False
 
 # Hook Discord's loggers separately (file only)
 for name in ("discord", "discord.client", "discord.gateway", "discord.voice_state"):
     discord_logger = logging.getLogger(name)
     discord_logger.setLevel(logging.INFO)
     discord_logger.handlers.clear()
-    discord_logger.addHandler(discordFileHandler)
+    discord_logger.propagate = False
+    discord_logger.addHandler(queueHandler)
 
 # Shortcut functions for special tags
 OK_STATUS = f"[{Fore.GREEN}OK{Style.RESET_ALL}]"
@@ -0,0 +1,42 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+# How long resolved yt-dlp info stays usable; stream URLs inside it expire after a few hours
+METADATA_TTL = int(os.getenv("METADATA_TTL", "1800"))
+METADATA_CACHE_SIZE = 512
+
+class MetadataCache:
+    """
+    Small TTL + LRU cache of sanitized yt-dlp info dicts keyed by (service, id),
+    so re-adding an evicted track can skip the metadata round trip.
+    """
+    def __init__(self, ttl: int = METADATA_TTL, max_entries: int = METADATA_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries: OrderedDict[tuple[str, str], tuple[float, dict]] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: tuple[str, str]) -> dict | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, info = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return info
+
+    def put(self, key: tuple[str, str], info: dict):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, info)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, key: tuple[str, str]):
+        with self.lock:
+            self.entries.pop(key, None)
@@ -0,0 +1,239 @@
+import os
+import time
+import functools
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from aiohttp import web
+from core.log_config import logger, log_ok, log_failed
+
+# Local port serving Prometheus text on /metrics, 0 to disable
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+GAP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+def _labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.lock = threading.Lock()
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in self.values.items():
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Histogram:
+    """Fixed-bucket histogram. observe() is a bisect and a few additions under an uncontended lock."""
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def summary(self, *labels) -> dict | None:
+        """Count, mean and bucket-interpolated p50/p95 for one series, for /stats."""
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                return None
+            counts, total, count = list(series[0]), series[1], series[2]
+
+        def quantile(q):
+            rank = q * count
+            seen = 0
+            for i, c in enumerate(counts):
+                if seen + c >= rank and c:
+                    lower = self.buckets[i - 1] if i > 0 else 0.0
+                    upper = self.buckets[i] if i < len(self.buckets) else lower
+                    return lower + (upper - lower) * (rank - seen) / c
+                seen += c
+            return 0.0
+
+        return {'count': count, 'mean': total / count, 'p50': quantile(0.5), 'p95': quantile(0.95)}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            series = [(labels, list(s[0]), s[1], s[2]) for labels, s in self.series.items()]
+        for labels, counts, total, count in series:
+            names = self.labelnames + ("le",)
+            cumulative = 0
+            for bound, c in zip(self.buckets + ("+Inf",), counts):
+                cumulative += c
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class Collected:
+    """A metric read from the bot's own state at scrape time, so keeping it current costs nothing."""
+    def __init__(self, name: str, help: str, kind: str, fn, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.fn = fn
+        self.labelnames = labelnames
+
+    def collect(self) -> dict[tuple, float]:
+        value = self.fn()
+        return value if isinstance(value, dict) else {(): value}
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.collect().items():
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.started_at = time.time()
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, fn, labelnames: tuple[str, ...] = (), kind: str = "gauge") -> Collected:
+        metric = Collected(name, help, kind, fn, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            try:
+                lines += metric.render()
+            except Exception as e:
+                logger.debug("Metric %s failed to collect: %s", metric.name, e)
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+command_latency = registry.histogram(
+    "bot_command_seconds", "Time spent handling each slash command", ("command",))
+command_errors = registry.counter(
+    "bot_command_errors_total", "Slash commands that raised", ("command",))
+download_stage = registry.histogram(
+    "bot_download_stage_seconds", "Time spent in each download stage (extract, download, transcode)", ("stage",))
+track_gap = registry.histogram(
+    "bot_track_gap_seconds", "Silence between the end of a track and the start of the next", buckets=GAP_BUCKETS)
+ffmpeg_spawned = registry.counter(
+    "bot_ffmpeg_spawned_total", "ffmpeg processes started", ("kind",))
+streamed_tracks = registry.counter(
+    "bot_streamed_tracks_total", "Tracks started from their remote URL while the cached copy downloads")
+stream_refetch_bytes = registry.counter(
+    "bot_stream_refetch_bytes_total", "Bytes downloaded for tracks that were also streamed, so fetched twice")
+
+def instrument_command(command):
+    """Wrap a registered app command's callback so every invocation is timed."""
+    callback = command._callback
+    name = command.qualified_name
+
+    @functools.wraps(callback)
+    async def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await callback(*args, **kwargs)
+        except Exception:
+            command_errors.inc(name)
+            raise
+        finally:
+            command_latency.observe(time.perf_counter() - start, name)
+
+    command._callback = timed
+
+def register_bot(client, player, downloader):
+    """Expose the bot's live state (voice connections, queues, cache, ffmpeg) as scrape-time metrics."""
+    registry.gauge("bot_voice_connections", "Connected voice clients", lambda: len(client.voice_clients))
+    registry.gauge(
+        "bot_queue_depth", "Tracks queued per guild, including the current one",
+        lambda: {(guild_id,): len(queue) for guild_id, queue in list(player.queues.items())}, ("guild",))
+    registry.gauge(
+        "bot_track_gap_last_ms", "Most recent inter-track gap per guild",
+        lambda: {(guild_id,): gap for guild_id, gap in list(player.last_gap_ms.items())}, ("guild",))
+    registry.gauge(
+        "bot_toc_lookups_total", "Audio cache lookups by result",
+        lambda: {("hit",): downloader.toc.hits, ("miss",): downloader.toc.misses}, ("result",), kind="counter")
+    registry.gauge(
+        "bot_toc_bytes_saved_total", "Bytes of audio served from the cache instead of downloaded again",
+        lambda: downloader.toc.bytes_saved, kind="counter")
+    registry.gauge("bot_toc_bytes", "Bytes of audio in the cache", lambda: downloader.toc.total_bytes)
+    registry.gauge("bot_toc_entries", "Files in the audio cache", lambda: len(downloader.toc))
+    registry.gauge(
+        "bot_ffmpeg_processes", "ffmpeg processes currently running",
+        lambda: {(kind,): count for kind, count in player.ffmpeg_processes().items()}, ("kind",))
+    registry.gauge(
+        "bot_download_waiting", "Download jobs waiting for an executor slot, by priority",
+        lambda: {(name,): s['waiting'] for name, s in downloader.executor.queue_stats().items()}, ("priority",))
+    registry.gauge(
+        "bot_download_wait_avg_seconds", "Average time download jobs waited for an executor slot, by priority",
+        lambda: {(name,): s['avg_wait'] for name, s in downloader.executor.queue_stats().items()}, ("priority",))
+    registry.gauge(
+        "bot_download_wait_max_seconds", "Longest time a download job waited for an executor slot, by priority",
+        lambda: {(name,): s['max_wait'] for name, s in downloader.executor.queue_stats().items()}, ("priority",))
+    registry.gauge("bot_uptime_seconds", "Seconds since the bot started", lambda: time.time() - registry.started_at)
+
+async def start_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """Serve /metrics on the event loop. Rendering only happens when something scrapes."""
+    if not port:
+        return None
+
+    async def handle(request):
+        return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        log_failed(f"Could not start metrics server on {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    log_ok(f"Metrics served on http://{host}:{port}/metrics")
+    return runner
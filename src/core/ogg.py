@@ -0,0 +1,163 @@
+import mmap
+import struct
+import discord
+
+# Discord expects 48 kHz Opus packets of 20 ms each (960 samples)
+DISCORD_FRAME_SAMPLES = 960
+# Number of audio packets checked before trusting a file for passthrough
+PROBE_PACKETS = 50
+
+PAGE_HEADER = struct.Struct("<4sBBqIIIB")
+
+class OggError(Exception): pass
+
+def iter_pages(buf, offset: int = 0):
+    """Yield (page_offset, header_type, granule, segment_table, data_start) for each Ogg page in buf."""
+    size = len(buf)
+    while offset + PAGE_HEADER.size <= size:
+        capture, version, header_type, granule, _, _, _, n_segs = PAGE_HEADER.unpack_from(buf, offset)
+        if capture != b"OggS" or version != 0:
+            raise OggError(f"Invalid Ogg page at byte {offset}")
+        data_start = offset + PAGE_HEADER.size + n_segs
+        table = buf[offset + PAGE_HEADER.size:data_start]
+        yield offset, header_type, granule, table, data_start
+        offset = data_start + sum(table)
+
+def iter_packets(buf, offset: int = 0):
+    """Yield complete packets from buf, joining packets that span several pages."""
+    partial = []
+    for _, header_type, _, table, pos in iter_pages(buf, offset):
+        if not header_type & 0x01:
+            # Not a continuation page, anything left over belonged to a broken packet
+            partial = []
+        seg_start = pos
+        for lacing in table:
+            pos += lacing
+            if lacing < 255:
+                partial.append(buf[seg_start:pos])
+                yield b"".join(partial)
+                partial = []
+                seg_start = pos
+        if seg_start < pos:
+            partial.append(buf[seg_start:pos])
+
+def packet_samples(packet: bytes) -> int:
+    """Number of 48 kHz samples in an Opus packet, read from its TOC byte (RFC 6716 section 3.1)."""
+    toc = packet[0]
+    config = toc >> 3
+    if config < 12:
+        frame = (480, 960, 1920, 2880)[config % 4]
+    elif config < 16:
+        frame = (480, 960)[config % 2]
+    else:
+        frame = (120, 240, 480, 960)[config % 4]
+
+    code = toc & 0x03
+    if code == 0:
+        frames = 1
+    elif code in (1, 2):
+        frames = 2
+    else:
+        frames = packet[1] & 0x3F if len(packet) > 1 else 0
+    return frame * frames
+
+def read_opus_head(packet: bytes) -> dict:
+    if packet[:8] != b"OpusHead" or len(packet) < 19:
+        raise OggError("Missing OpusHead header")
+    version, channels, pre_skip, sample_rate, gain, mapping = struct.unpack_from("<BBHIhB", packet, 8)
+    return {
+        'channels': channels,
+        'pre_skip': pre_skip,
+        'sample_rate': sample_rate,
+        'output_gain': gain,
+        'mapping_family': mapping,
+    }
+
+class OggOpusSource(discord.AudioSource):
+    """
+    In-process audio source for .opus files that hands the Ogg-contained Opus packets
+    straight to discord.py, so no ffmpeg process is needed.
+    Raises OggError if the file cannot be sent as-is (wrong framing or channel layout).
+    start skips that many packets, for resuming part way through a track. page is an optional
+    (byte offset, first packet number) from the page index to jump to instead of reading up to start.
+    """
+    def __init__(self, path: str, start: int = 0, page: tuple[int, int] = None):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.head = self._probe()
+        except (OggError, ValueError, IndexError, struct.error) as e:
+            self.cleanup()
+            raise OggError(f"{path} is not passthrough compatible: {e}") from e
+
+        self.packets_read = 0
+        if page is not None and 0 < page[1] <= start:
+            self._packets = iter_packets(self._mmap, page[0])
+            self.packets_read = page[1]
+        else:
+            self._packets = iter_packets(self._mmap)
+            next(self._packets) # OpusHead
+            next(self._packets) # OpusTags
+        if start > self.packets_read:
+            self.skip(start - self.packets_read)
+
+    def skip(self, count: int) -> int:
+        """Drop the next count audio packets without returning them. Returns how many were skipped."""
+        skipped = 0
+        while skipped < count and self.read():
+            skipped += 1
+        return skipped
+
+    def _probe(self) -> dict:
+        packets = iter_packets(self._mmap)
+        head = read_opus_head(next(packets))
+        if head['channels'] not in (1, 2) or head['mapping_family'] != 0:
+            raise OggError(f"unsupported channel layout ({head['channels']} channels)")
+        if next(packets)[:8] != b"OpusTags":
+            raise OggError("missing OpusTags header")
+
+        for i, packet in enumerate(packets):
+            if i >= PROBE_PACKETS:
+                break
+            if packet and packet_samples(packet) != DISCORD_FRAME_SAMPLES:
+                raise OggError("packets are not 20 ms frames")
+        return head
+
+    def read(self) -> bytes:
+        try:
+            for packet in self._packets:
+                # Zero-length packets are legal in Ogg but b"" would end playback
+                if packet:
+                    self.packets_read += 1
+                    return packet
+        except OggError:
+            pass
+        return b""
+
+    def is_opus(self) -> bool:
+        return True
+
+    def cleanup(self):
+        mm = getattr(self, "_mmap", None)
+        if mm is not None:
+            self._packets = iter(())
+            self._mmap = None
+            mm.close()
+        if not self._file.closed:
+            self._file.close()
+
+def opus_duration(path: str) -> float:
+    """Track length in seconds from the granule position of the last Ogg page, without decoding."""
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        head = read_opus_head(next(iter_packets(buf)))
+        last = buf.rfind(b"OggS")
+        while last >= 0:
+            try:
+                _, _, _, granule, _, _, _, _ = PAGE_HEADER.unpack_from(buf, last)
+            except struct.error:
+                granule = -1
+            if granule >= 0:
+                return max(0.0, (granule - head['pre_skip']) / 48000)
+            last = buf.rfind(b"OggS", 0, last)
+    raise OggError(f"No granule position found in {path}")
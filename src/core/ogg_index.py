@@ -0,0 +1,102 @@
+import os
+import mmap
+import struct
+import hashlib
+from bisect import bisect_right
+from core.ogg import iter_pages, OggError, DISCORD_FRAME_SAMPLES
+from core.log_config import logger
+
+INDEX_DIR = "data/index"
+INDEX_VERSION = 1
+
+# magic, version, audio file size, audio file mtime_ns, granule at the start of the audio, entry count
+INDEX_HEADER = struct.Struct("<4sBqqqI")
+# granule position at the start of the page, byte offset of the page
+INDEX_ENTRY = struct.Struct("<qQ")
+
+class PageIndex:
+    """Seek table for one Ogg Opus file: the pages that start on a packet boundary, by granule."""
+    def __init__(self, granules: list[int], offsets: list[int], base: int = 0):
+        self.granules = granules
+        self.offsets = offsets
+        self.base = base
+
+    def __len__(self):
+        return len(self.granules)
+
+    def find(self, packet: int) -> tuple[int, int] | None:
+        """(byte offset, number of its first packet) of the last page starting at or before packet."""
+        i = bisect_right(self.granules, self.base + packet * DISCORD_FRAME_SAMPLES) - 1
+        if i < 0:
+            return None
+        return self.offsets[i], (self.granules[i] - self.base) // DISCORD_FRAME_SAMPLES
+
+def index_path(path: str) -> str:
+    """Sidecar location for an audio file, keyed by a hash of its path."""
+    digest = hashlib.sha1(path.replace("\\", "/").encode("utf-8")).hexdigest()
+    return os.path.join(INDEX_DIR, digest[:2], digest + ".idx")
+
+def scan(path: str) -> PageIndex:
+    """Walk the page headers of an Ogg Opus file (no decoding) and collect the seekable pages."""
+    granules, offsets = [], []
+    base = None
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        headers_left = 2 # OpusHead and OpusTags
+        last_granule = 0
+        for offset, header_type, granule, table, _ in iter_pages(buf):
+            ended = sum(1 for lacing in table if lacing < 255)
+            if headers_left:
+                headers_left = max(0, headers_left - ended)
+                continue
+            if base is None and granule != -1:
+                # Streams don't have to start at granule 0, work back from the first page's packets
+                base = last_granule = granule - ended * DISCORD_FRAME_SAMPLES
+                granules.append(base)
+                offsets.append(offset)
+            elif not header_type & 0x01 and base is not None:
+                granules.append(last_granule)
+                offsets.append(offset)
+            if granule != -1:
+                last_granule = granule
+    return PageIndex(granules, offsets, base or 0)
+
+def build(path: str) -> PageIndex | None:
+    """Build and write the sidecar index for a file. Returns None if the file can't be indexed."""
+    try:
+        stat = os.stat(path)
+        index = scan(path)
+    except (OSError, ValueError, OggError) as e:
+        logger.debug("Could not index %s: %s", path, e)
+        return None
+
+    target = index_path(path)
+    tmp_path = target + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(tmp_path, "wb") as f:
+            f.write(INDEX_HEADER.pack(b"OGIX", INDEX_VERSION, stat.st_size, stat.st_mtime_ns, index.base, len(index)))
+            f.write(b"".join(INDEX_ENTRY.pack(g, o) for g, o in zip(index.granules, index.offsets)))
+        os.replace(tmp_path, target)
+    except OSError as e:
+        logger.debug("Could not write index for %s: %s", path, e)
+    return index
+
+def load(path: str) -> PageIndex | None:
+    """Read a file's sidecar index, rebuilding it when it is missing or the file has changed since."""
+    try:
+        stat = os.stat(path)
+        with open(index_path(path), "rb") as f:
+            data = f.read()
+        magic, version, size, mtime_ns, base, count = INDEX_HEADER.unpack_from(data)
+        if magic != b"OGIX" or version != INDEX_VERSION or size != stat.st_size or mtime_ns != stat.st_mtime_ns:
+            raise ValueError("stale index")
+        entries = list(INDEX_ENTRY.iter_unpack(data[INDEX_HEADER.size:INDEX_HEADER.size + count * INDEX_ENTRY.size]))
+    except (OSError, ValueError, struct.error):
+        return build(path)
+    return PageIndex([g for g, _ in entries], [o for _, o in entries], base)
+
+def remove(path: str):
+    try:
+        os.remove(index_path(path))
+    except OSError:
+        pass
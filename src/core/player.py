@@ -1,89 +1,404 @@
+import time
+import asyncio
+import weakref
+import threading
 import discord
-from core import utils
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor
+from core import utils, ingest, metrics, ogg_index
+from core.ogg import OggOpusSource, OggError, DISCORD_FRAME_SAMPLES
+from core.guild_queue import GuildQueue
+from core.status_updater import StatusUpdater
 from core.log_config import logger, log_failed
 
+# Packets decoded ahead of time for the next track (20ms each)
+PREFETCH_PACKETS = 5
+FRAME_SECONDS = DISCORD_FRAME_SAMPLES / 48000
+
+class BufferedSource(discord.AudioSource):
+    """
+    Wraps an audio source, reading its first packets ahead of time so the track can start
+    without waiting on file opening or ffmpeg start-up. Also reports when audio actually starts
+    and how far into the track playback is.
+    """
+    def __init__(self, source: discord.AudioSource, packets: int = 0, on_start=None, start: float = 0):
+        self.source = source
+        self.buffer = deque()
+        self.on_start = on_start
+        self.start = start
+        self.played = 0
+        for _ in range(packets):
+            packet = source.read()
+            if not packet:
+                break
+            self.buffer.append(packet)
+
+    def read(self) -> bytes:
+        if self.on_start:
+            self.on_start()
+            self.on_start = None
+        packet = self.buffer.popleft() if self.buffer else self.source.read()
+        if packet:
+            self.played += 1
+        return packet
+
+    @property
+    def position(self) -> float:
+        """Seconds into the track, counting the packets handed to the voice client."""
+        return self.start + self.played * FRAME_SECONDS
+
+    def is_opus(self) -> bool:
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.buffer.clear()
+        self.source.cleanup()
+
 class PlayerHandler:
     def __init__(self, client: discord.Client):
-        self.queues = {}
+        self.queues: dict[int, GuildQueue] = {}
         self.client = client
+        # Next track's source per guild, prepared while the current one plays
+        self.prefetched: dict[int, tuple[dict, BufferedSource]] = {}
+        self.prefetch_lock = threading.Lock()
+        self.prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+        # Silence between the end of one track and the start of the next, per guild
+        self.last_gap_ms: dict[int, float] = {}
+        # Set by DownloaderHandler, used to fetch queue entries that are still downloading
+        self.downloader = None
+        self.status = StatusUpdater(client)
+        # Playback sources backed by an ffmpeg process, counted for metrics
+        self.ffmpeg_sources = weakref.WeakSet()
+        # Each source handed to a voice client gets a token, so an after callback that fires
+        # after something else has already started playing can tell it is stale
+        self.play_lock = threading.RLock()
+        self.play_tokens: dict[int, int] = {}
 
-    async def play_audio_file(self, conn, filename, service=None, folder="music", message=None, queuer=None):
-        path = f"data/{folder}/{service + '/' if service else ''}{filename}"
-        logger.debug(f"Attempting to play file: {path}")
-        try:
-            conn.play(
-                discord.FFmpegOpusAudio(path),
-                after=lambda error=None, conn=conn: self.after_track(error, conn)
-            )
-        except Exception as e:
-            log_failed(f"Playback error: {e}")
-            return None
-        else:
-            embed = utils.create_embed(
-                title="Now Playing",
-                description=message or filename,
-                color=0x1DB954,
-                queue_list="\n".join([s['title'] for s in self.queues[conn.guild.id]['queue'][1:]]) if conn.guild.id in self.queues else None,
-                song_queuer=str(queuer) if queuer else "Unknown"
-            )
-            logger.info(f"Now playing: {filename} queued by {queuer}")
-            return embed
-
-    def after_track(self, error, conn):
+    def create_source(self, metadata: dict, start: float = 0) -> discord.AudioSource:
+        """
+        Build the audio source for a queue entry, streaming it remotely if the file is still downloading.
+        start is a position in seconds to begin playback from.
+        """
+        seek = f"-ss {start:.2f} " if start > 0 else ""
+        stream_url = metadata.get('stream_url')
+        if stream_url:
+            headers = "".join(f"{k}: {v}\r\n" for k, v in metadata.get('http_headers', {}).items())
+            before_options = seek + "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5"
+            if headers:
+                before_options += f' -headers "{headers}"'
+            return self._ffmpeg_source(stream_url, before_options=before_options)
+
+        # Cached .opus files are sent packet by packet without spawning ffmpeg
+        if metadata['file'].endswith(".opus"):
+            packet = round(start / FRAME_SECONDS)
+            page = None
+            if packet:
+                # Jump straight to the page holding the start position instead of reading up to it
+                index = ogg_index.load(metadata['file'])
+                page = index.find(packet) if index else None
+            try:
+                return OggOpusSource(metadata['file'], start=packet, page=page)
+            except (OggError, OSError) as e:
+                logger.debug("Falling back to ffmpeg: %s", e)
+        if seek:
+            return self._ffmpeg_source(metadata['file'], before_options=seek.strip())
+        return self._ffmpeg_source(metadata['file'])
+
+    def _ffmpeg_source(self, *args, **kwargs) -> discord.FFmpegOpusAudio:
+        source = discord.FFmpegOpusAudio(*args, **kwargs)
+        self.ffmpeg_sources.add(source)
+        metrics.ffmpeg_spawned.inc("playback")
+        return source
+
+    def ffmpeg_processes(self) -> dict[str, int]:
+        """Running ffmpeg processes by purpose."""
+        playback = 0
+        for source in list(self.ffmpeg_sources):
+            process = getattr(source, '_process', None)
+            if process is not None and process.poll() is None:
+                playback += 1
+        return {'playback': playback, 'ingest': ingest.running_encodes()}
+
+    def play_source(self, conn: discord.VoiceClient, source: discord.AudioSource):
+        """Start a source on the voice client with after_track as its callback."""
+        if not isinstance(source, BufferedSource):
+            # Unbuffered, only there to track the playback position
+            source = BufferedSource(source)
+        with self.play_lock:
+            token = self.play_tokens.get(conn.guild.id, 0) + 1
+            self.play_tokens[conn.guild.id] = token
+            conn.play(source, after=lambda err=None, conn=conn, token=token: self.after_track(err, conn, token))
+
+    def after_track(self, error, conn, token: int = None):
+        ended_at = time.perf_counter()
+        with self.play_lock:
+            if token is not None and token != self.play_tokens.get(conn.guild.id):
+                # A newer track was started from the event loop before this callback ran
+                logger.debug("Ignoring stale track end on guild %s", conn.guild.id)
+                return
+            picked = self._advance(error, conn)
+            token = self.play_tokens.get(conn.guild.id, 0)
+        # The next source is opened outside the lock, so commands and other guilds' callbacks
+        # don't wait on file reads or an ffmpeg spawn. start_track checks the token again
+        if picked is not None:
+            entry, start = picked
+            self.start_track(conn, entry, ended_at, start, token=token)
+
+    def _advance(self, error, conn) -> tuple[dict, float] | None:
+        """
+        Move the queue on after a track ended, under play_lock.
+        Returns the entry to start and where to start it, or None if there is nothing to start now.
+        """
         server_id = conn.guild.id
         if error:
             log_failed(f"Error during playback: {error}")
         else:
-            logger.debug(f"Track finished on guild {server_id}")
+            logger.debug("Track finished on guild %s", server_id)
 
-        try:
-            if not self.queues[server_id]['loop']:
-                self.queues[server_id]['queue'].pop(0)
-        except KeyError:
+        queue = self.queues.get(server_id)
+        if queue is None:
             logger.debug("Queue already cleared or disconnected.")
+            self.discard_prefetched(server_id)
             return
 
-        try:
-            next_file = self.queues[server_id]['queue'][0]
-            logger.debug(f"Playing next track: {next_file['title']} ({next_file['file']})")
-
-            conn.play(
-                discord.FFmpegOpusAudio(next_file['file']),
-                after=lambda err=None, conn=conn: self.after_track(err, conn)
-            )
-
-            self.client.loop.create_task(
-                conn.channel.edit(status=f"🎶 {next_file['service']}: {next_file['title']}")
-            )
-        except IndexError:
-            logger.debug(f"No more tracks in queue for guild {server_id}")
+        previous = queue.current
+        next_file = queue.advance()
+        if next_file is None:
+            logger.debug("No more tracks in queue for guild %s", server_id)
             self.queues.pop(server_id, None)
+            self.discard_prefetched(server_id)
+            return
+        self.queue_changed(server_id)
 
-    def add_to_queue(self, metadata: dict, conn: discord.VoiceClient, invoker: discord.User = None, pos: int = -1, skip: bool = False):
+        if next_file.get('pending'):
+            # Still downloading: wait for it on the event loop instead of blocking the audio thread
+            logger.debug("Next track not downloaded yet, waiting: %s", next_file['title'])
+            asyncio.run_coroutine_threadsafe(self.play_when_ready(conn, next_file), self.client.loop)
+            return None
+        start = queue.loop_start if queue.loop and next_file is previous else 0
+        return next_file, start
+
+    def start_track(self, conn: discord.VoiceClient, next_file: dict, ended_at: float = None, start: float = 0, token: int = None):
+        """
+        Open next_file's source and play it. Given the play token read when the entry was picked,
+        the track is dropped if another one was started or skipped to since, or the queue moved on.
+        """
+        server_id = conn.guild.id
+        try:
+            logger.debug("Playing next track: %s (%s)", next_file['title'], next_file['file'])
+
+            source = self.take_prefetched(server_id, next_file)
+            if source is not None and source.start != start:
+                source.cleanup()
+                source = None
+            if source is None:
+                source = BufferedSource(self.create_source(next_file, start), start=start)
+
+            if ended_at is not None:
+                def record_gap():
+                    gap = (time.perf_counter() - ended_at) * 1000
+                    self.last_gap_ms[server_id] = gap
+                    metrics.track_gap.observe(gap / 1000)
+                    logger.debug("Inter-track gap on guild %s: %.1fms", server_id, gap)
+                source.on_start = record_gap
+
+            with self.play_lock:
+                queue = self.queues.get(server_id)
+                if token is not None and (
+                    token != self.play_tokens.get(server_id, 0) or queue is None or queue.current is not next_file
+                ):
+                    logger.debug("Not starting %s, guild %s moved on while it was opened", next_file['title'], server_id)
+                    source.cleanup()
+                    return
+                self.play_source(conn, source)
+            self.schedule_prefetch(conn)
+
+            self.status.update(conn.channel, self.status.track_status(next_file))
+        except Exception as e:
+            log_failed(f"Could not start next track {next_file['file']}: {e}")
+
+    async def play_when_ready(self, conn: discord.VoiceClient, entry: dict):
+        """Wait for a pending queue entry to finish downloading, then play it if it is still current."""
+        server_id = conn.guild.id
+        try:
+            await self.downloader.wait_ready(entry, server_id)
+        except Exception as e:
+            log_failed(f"Could not download queued track {entry['title']}: {e}")
+            queue = self.queues.get(server_id)
+            if queue is not None and queue.current is entry:
+                queue.skip()
+                self.after_track(None, conn)
+            return
+
+        with self.play_lock:
+            queue = self.queues.get(server_id)
+            # Skipped or replaced while it downloaded
+            if queue is None or queue.current is not entry or queue.skip_pending:
+                return
+            if conn.is_playing() or conn.is_paused():
+                return
+            token = self.play_tokens.get(server_id, 0)
+        self.start_track(conn, entry, token=token)
+
+    def skip(self, conn: discord.VoiceClient, n: int) -> int | None:
+        """
+        Skip n tracks, or the whole queue when n is 0 or covers it.
+        Returns how many tracks were skipped, or None when the guild has no queue.
+        """
+        picked = None
+        with self.play_lock:
+            queue = self.queues.get(conn.guild.id)
+            if queue is None:
+                return None
+            if n <= 0 or n >= len(queue):
+                n = len(queue)
+                queue.clear()
+            else:
+                queue.skip(n)
+
+            if conn.is_playing() or conn.is_paused():
+                # after_track moves the queue on once the player has stopped
+                conn.stop()
+            else:
+                # The current track is still downloading or has just ended, so no after callback
+                # will move the queue on: advance here, and make a callback already on its way stale
+                token = self.play_tokens[conn.guild.id] = self.play_tokens.get(conn.guild.id, 0) + 1
+                picked = self._advance(None, conn)
+        if picked is not None:
+            entry, start = picked
+            self.start_track(conn, entry, None, start, token=token)
+        return n
+
+    def seek(self, conn: discord.VoiceClient, start: float) -> dict | None:
+        """Restart the current track at start seconds without moving the queue. Returns the entry."""
+        with self.play_lock:
+            queue = self.queues.get(conn.guild.id)
+            entry = queue.current if queue else None
+            if entry is None or entry.get('pending'):
+                return None
+            source = BufferedSource(self.create_source(entry, start), start=start)
+            paused = conn.is_paused()
+            # The stopped track's after callback is made stale by the new play token
+            conn.stop()
+            self.play_source(conn, source)
+            if paused:
+                conn.pause()
+        logger.debug("Seeked to %.1fs in %s on guild %s", start, entry['title'], conn.guild.id)
+        return entry
+
+    @staticmethod
+    def position(conn: discord.VoiceClient) -> float:
+        """Seconds into the track playing on a voice client, 0 when it isn't known."""
+        return getattr(conn.source, 'position', 0.0) if conn else 0.0
+
+    def queue_changed(self, server_id: int):
+        """Let the downloader look ahead at upcoming entries. Safe to call from any thread."""
+        if self.downloader is not None:
+            self.client.loop.call_soon_threadsafe(self.downloader.ensure_lookahead, server_id)
+
+    def next_entry(self, server_id: int) -> dict | None:
+        """The entry that will play when the current track ends."""
+        queue = self.queues.get(server_id)
+        return queue.peek_next() if queue else None
+
+    def schedule_prefetch(self, conn: discord.VoiceClient):
+        if conn is None:
+            return
+        self.prefetch_pool.submit(self.prefetch_next, conn.guild.id)
+
+    def prefetch_next(self, server_id: int):
+        """Open the next track's source and buffer its first packets. Runs on the prefetch pool."""
+        entry = self.next_entry(server_id)
+        with self.prefetch_lock:
+            current = self.prefetched.get(server_id)
+            if entry is None or (current and current[0] is entry):
+                return
+        # Remote streams are left alone so their URLs are not opened twice
+        if entry.get('stream_url') or entry.get('pending'):
+            return
+
+        queue = self.queues.get(server_id)
+        start = queue.loop_start if queue and queue.loop and entry is queue.current else 0
         try:
-            if pos < 0:
-                self.queues[conn.guild.id]['queue'].append(metadata)
+            source = BufferedSource(self.create_source(entry, start), packets=PREFETCH_PACKETS, start=start)
+        except Exception as e:
+            logger.debug("Prefetch failed for %s: %s", entry['file'], e)
+            return
+
+        with self.prefetch_lock:
+            stale = self.prefetched.get(server_id)
+            self.prefetched[server_id] = (entry, source)
+        if stale:
+            stale[1].cleanup()
+        logger.debug("Prefetched next track for guild %s: %s", server_id, entry['title'])
+
+    def take_prefetched(self, server_id: int, entry: dict) -> BufferedSource | None:
+        """Hand over the prefetched source if it was prepared for this exact queue entry."""
+        with self.prefetch_lock:
+            prefetched = self.prefetched.pop(server_id, None)
+        if prefetched is None:
+            return None
+        if prefetched[0] is entry:
+            return prefetched[1]
+        # Queue changed (skip, loop toggle, insert) since the prefetch, so it is stale
+        prefetched[1].cleanup()
+        return None
+
+    def discard_prefetched(self, server_id: int):
+        with self.prefetch_lock:
+            prefetched = self.prefetched.pop(server_id, None)
+        if prefetched:
+            prefetched[1].cleanup()
+
+    def add_to_queue(self, metadata: dict, conn: discord.VoiceClient, invoker: discord.User = None, pos: int = -1, skip: bool = False):
+        # Held so a track ending on the audio thread can't advance the queue at the same time
+        with self.play_lock:
+            return self._add_to_queue(metadata, conn, invoker, pos, skip)
+
+    def _add_to_queue(self, metadata: dict, conn: discord.VoiceClient, invoker: discord.User, pos: int, skip: bool):
+        queue = self.queues.get(conn.guild.id)
+        # An emptied queue (everything skipped) is replaced like a missing one, so the track plays
+        if queue:
+            if skip:
+                # Play now: put the track straight after the current one and let after_track move onto it
+                queue.insert(1, metadata)
+                queue.skip()
+                logger.info("Track queued to play now: %s by %s", metadata['title'], invoker)
+                if conn.is_playing() or conn.is_paused():
+                    conn.stop()
+                    return utils.create_embed(
+                        title="Now Playing",
+                        description=metadata['title'],
+                        color=0x1DB954,
+                        queue_list=[],
+                        song_queuer=invoker
+                    )
+                queue.advance()
             else:
-                self.queues[conn.guild.id]['queue'].insert(pos, metadata)
-            logger.info(f"Track queued: {metadata['title']} (pos={pos}) by {invoker}")
-            
-            if not skip:
-                embed = utils.create_embed(
-                    title=f"Added to queue ({len(self.queues[conn.guild.id]['queue'])-1})",
+                if pos < 0:
+                    queue.append(metadata)
+                else:
+                    queue.insert(pos, metadata)
+                logger.info("Track queued: %s (pos=%d) by %s", metadata['title'], pos, invoker)
+                self.schedule_prefetch(conn)
+                self.queue_changed(conn.guild.id)
+                return utils.create_embed(
+                    title=f"Added to queue ({len(queue)-1})",
                     description=metadata['title'],
                     color=0x1DB954,
                     queue_list=[],
                     song_queuer=invoker
                 )
-                return embed
-        except KeyError:
-            self.queues[conn.guild.id] = {'queue': [metadata], 'loop': False}
-            logger.info(f"New queue created and track added: {metadata['title']}")
-
-        conn.play(
-            discord.FFmpegOpusAudio(metadata['file']),
-            after=lambda err=None, conn=conn: self.after_track(err, conn)
-        )
+        else:
+            self.queues[conn.guild.id] = GuildQueue([metadata])
+            logger.info("New queue created and track added: %s", metadata['title'])
+
+        if metadata.get('pending'):
+            asyncio.get_running_loop().create_task(self.play_when_ready(conn, metadata))
+        else:
+            self.play_source(conn, self.create_source(metadata))
+            self.schedule_prefetch(conn)
+        self.queue_changed(conn.guild.id)
 
         embed = utils.create_embed(
             title="Now Playing",
@@ -94,6 +409,20 @@ class PlayerHandler:
         )
         return embed
 
+    def pinned_files(self) -> set[str]:
+        """Files currently queued in any guild, which must not be evicted from the cache."""
+        pinned = set()
+        for queue in list(self.queues.values()):
+            pinned |= queue.files()
+        return pinned
+
+    def pin_counts(self) -> Counter:
+        """Queue entries per file across all guilds, shared with other processes as cache pins."""
+        counts = Counter()
+        for queue in list(self.queues.values()):
+            counts.update(queue.file_counts())
+        return counts
+
     async def connect_and_prepare(self, interaction: discord.Interaction) -> discord.VoiceClient | None:
         conn = interaction.guild.voice_client
 
@@ -105,11 +434,11 @@ class PlayerHandler:
                 return None
 
             conn = await channel.connect()
-            logger.info(f"Connected to voice channel: {channel.name} in guild {interaction.guild.name}")
+            logger.info("Connected to voice channel: %s in guild %s", channel.name, interaction.guild.name)
 
         return conn
 
     async def safe_disconnect(self, conn: discord.VoiceClient):
         if not conn.is_playing():
             await conn.disconnect()
-            logger.info(f"Disconnected from voice channel in guild {conn.guild.name}")
+            logger.info("Disconnected from voice channel in guild %s", conn.guild.name)
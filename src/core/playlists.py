@@ -0,0 +1,140 @@
+import os
+import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from core import ogg_index
+from core.ogg import opus_duration, OggError
+from core.log_config import logger
+
+MANIFEST_DIR = "data/cache/playlists"
+
+class PlaylistLibrary:
+    """
+    Cached manifests of the playlist folders in data/playlists.
+    Each manifest lists the folder's .opus tracks with their titles, sizes and durations
+    (read from Ogg granule positions) and is rebuilt when the folder's mtime changes.
+    """
+    def __init__(self, root: str = "data/playlists", manifest_dir: str = MANIFEST_DIR, workers: int = 2):
+        self.root = root
+        self.manifest_dir = manifest_dir
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="playlist")
+        self.lock = threading.Lock()
+        self.manifests: dict[str, dict] = {}
+        # Rebuilds queued or running on the pool, so each folder is only scanned once at a time
+        self.building: dict[str, Future] = {}
+        self._folders: list[str] = []
+        self._root_mtime = None
+        os.makedirs(manifest_dir, exist_ok=True)
+
+    def folders(self) -> list[str]:
+        """Playlist folder names, re-listed only when data/playlists itself changes."""
+        mtime = os.stat(self.root).st_mtime_ns
+        if mtime != self._root_mtime:
+            self._folders = sorted(
+                item for item in os.listdir(self.root)
+                if os.path.isdir(os.path.join(self.root, item))
+            )
+            self._root_mtime = mtime
+        return self._folders
+
+    def _folder_mtime(self, name: str) -> int | None:
+        try:
+            return os.stat(os.path.join(self.root, name)).st_mtime_ns
+        except OSError:
+            return None
+
+    def cached(self, name: str) -> dict | None:
+        """
+        The manifest for a playlist if it is still valid, without touching the disk contents.
+        A stale or missing manifest is rebuilt in the background.
+        """
+        manifest = self.manifests.get(name)
+        if manifest is None:
+            manifest = self._read_manifest(name)
+        mtime = self._folder_mtime(name)
+        if manifest is not None and manifest['mtime'] == mtime:
+            return manifest
+        if mtime is not None:
+            self.schedule(name)
+        return None
+
+    def schedule(self, name: str) -> Future:
+        """Queue a rebuild of a playlist's manifest on the pool, or return the one already queued."""
+        with self.lock:
+            future = self.building.get(name)
+            if future is None:
+                future = self.pool.submit(self.build, name)
+                self.building[name] = future
+                future.add_done_callback(lambda f: self._built(name, f))
+            return future
+
+    def _built(self, name: str, future: Future):
+        with self.lock:
+            if self.building.get(name) is future:
+                del self.building[name]
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning("Playlist manifest build failed: %s (%s)", name, future.exception())
+
+    def _manifest_path(self, name: str) -> str:
+        return os.path.join(self.manifest_dir, f"{name}.json")
+
+    def _read_manifest(self, name: str) -> dict | None:
+        try:
+            with open(self._manifest_path(name), "r") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        with self.lock:
+            self.manifests[name] = manifest
+        return manifest
+
+    def build(self, name: str) -> dict:
+        """Scan a playlist folder and write its manifest (blocking, runs on the pool)."""
+        folder_path = os.path.join(self.root, name)
+        mtime = self._folder_mtime(name)
+        tracks = []
+        for file in sorted(os.listdir(folder_path)):
+            full_path = os.path.join(folder_path, file)
+            if not file.endswith(".opus") or not os.path.isfile(full_path):
+                continue
+            try:
+                duration = round(opus_duration(full_path))
+            except (OggError, OSError, ValueError):
+                duration = 0
+            # Rebuilt only if the file changed since it was last indexed
+            ogg_index.load(full_path.replace("\\", "/"))
+            tracks.append({
+                'title': file[:-5],
+                'file': full_path.replace("\\", "/"),
+                'duration': duration,
+                'size': os.path.getsize(full_path),
+            })
+
+        manifest = {
+            'name': name,
+            'mtime': mtime,
+            'tracks': tracks,
+            'total_duration': sum(t['duration'] for t in tracks),
+        }
+        tmp_path = self._manifest_path(name) + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._manifest_path(name))
+
+        with self.lock:
+            self.manifests[name] = manifest
+        logger.debug("Playlist manifest built: %s (%d tracks)", name, len(tracks))
+        return manifest
+
+    async def load(self, name: str) -> dict:
+        """Return a valid manifest, rebuilding it on the worker pool if the folder changed."""
+        manifest = self.cached(name)
+        if manifest is not None:
+            return manifest
+        return await asyncio.wrap_future(self.schedule(name))
+
+    def refresh_all(self):
+        """Queue background rebuilds for every playlist whose manifest is missing or stale."""
+        for name in self.folders():
+            self.cached(name)
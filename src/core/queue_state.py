@@ -0,0 +1,233 @@
+# Allow core.player to be used for type hints without actually importing the file
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from core.player import PlayerHandler
+
+import os
+import json
+import time
+import asyncio
+import discord
+from core.guild_queue import GuildQueue
+from core.downloader import BYTES_PER_SECOND
+from core.log_config import logger, log_ok, log_failed
+
+STATE_DIR = "data/state"
+# Seconds between snapshots of the guilds whose queue or playback position changed
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "10"))
+# Snapshots older than this are discarded on startup instead of resumed
+RESUME_MAX_AGE = float(os.getenv("RESUME_MAX_AGE", str(6 * 3600)))
+FORMAT_VERSION = 1
+
+class QueueSnapshots:
+    """
+    Periodic per-guild snapshots of the player state in data/state/{guild}.json, so a restart
+    can rejoin voice and carry on from where it left off.
+
+    Each file holds two JSON lines: a small header (voice channel, loop and shuffle flags,
+    position in the current track) and the queue as compact track refs. The track list is only
+    re-serialized when GuildQueue.version changes, and only guilds whose state changed are
+    rewritten, each through a temp file and os.replace so a crash never leaves half a snapshot.
+    """
+    def __init__(self, client: discord.Client, player: PlayerHandler, state_dir: str = STATE_DIR, interval: float = SNAPSHOT_INTERVAL):
+        self.client = client
+        self.player = player
+        self.state_dir = state_dir
+        self.interval = interval
+        # guild id -> (queue version, serialized track list)
+        self.tracks_cache: dict[int, tuple[int, str]] = {}
+        # guild id -> header last written, to skip unchanged guilds
+        self.written: dict[int, dict] = {}
+        self.task = None
+        os.makedirs(state_dir, exist_ok=True)
+
+    def start(self):
+        """Resume saved queues in the background, then start snapshotting. Safe to call on every on_ready."""
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        try:
+            await self.restore_all()
+        except Exception as e:
+            log_failed(f"Could not restore saved queues: {e}")
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save_all()
+            except Exception as e:
+                log_failed(f"Queue snapshot failed: {e}")
+
+    def path(self, guild_id: int) -> str:
+        return os.path.join(self.state_dir, f"{guild_id}.json")
+
+    # --- Saving ----------------------------------------------------------------------------
+
+    @staticmethod
+    def track_ref(entry: dict) -> list:
+        """[file, title, service, id, duration, link], enough to find or re-download the track."""
+        return [entry['file'], entry.get('title'), entry.get('service'), entry.get('id'), entry.get('duration'), entry.get('link')]
+
+    def _serialize_tracks(self, guild_id: int, queue: GuildQueue) -> str:
+        version = queue.version
+        cached = self.tracks_cache.get(guild_id)
+        if cached and cached[0] == version:
+            return cached[1]
+        tracks = json.dumps([self.track_ref(entry) for entry in queue.snapshot()], separators=(",", ":"))
+        self.tracks_cache[guild_id] = (version, tracks)
+        return tracks
+
+    async def save_all(self):
+        """Write snapshots for every guild whose state changed and drop those whose queue is gone."""
+        if self.client.is_closed():
+            # Voice clients are being torn down, the last snapshots are the ones to resume from
+            return
+        writes = []
+        for guild_id, queue in list(self.player.queues.items()):
+            guild = self.client.get_guild(guild_id)
+            conn = guild.voice_client if guild else None
+            if conn is None or not queue:
+                continue
+            header = {
+                'v': FORMAT_VERSION,
+                'channel': conn.channel.id,
+                'loop': queue.loop,
+                'shuffle': queue.shuffle,
+                'loop_start': queue.loop_start,
+                'paused': conn.is_paused(),
+                'position': round(self.player.position(conn), 2),
+                'version': queue.version,
+            }
+            if self.written.get(guild_id) == header:
+                continue
+            tracks = self._serialize_tracks(guild_id, queue)
+            self.written[guild_id] = header
+            writes.append((guild_id, json.dumps({**header, 'saved': round(time.time())}, separators=(",", ":")) + "\n" + tracks + "\n"))
+
+        gone = [guild_id for guild_id in self.written if guild_id not in self.player.queues]
+        for guild_id in gone:
+            self.written.pop(guild_id, None)
+            self.tracks_cache.pop(guild_id, None)
+
+        if writes or gone:
+            for guild_id in await asyncio.to_thread(self._flush, writes, gone):
+                # Try again next round
+                self.written.pop(guild_id, None)
+
+    def _flush(self, writes: list[tuple[int, str]], gone: list[int]) -> list[int]:
+        """Write and remove snapshot files (blocking). Returns the guilds whose write failed."""
+        failed = []
+        for guild_id, data in writes:
+            tmp_path = self.path(guild_id) + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path(guild_id))
+            except OSError as e:
+                log_failed(f"Could not write queue snapshot for guild {guild_id}: {e}")
+                failed.append(guild_id)
+        for guild_id in gone:
+            self.discard(guild_id)
+        logger.debug("Queue snapshots: %d written, %d removed", len(writes) - len(failed), len(gone))
+        return failed
+
+    def discard(self, guild_id: int):
+        try:
+            os.remove(self.path(guild_id))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.debug("Could not remove queue snapshot for guild %s: %s", guild_id, e)
+
+    # --- Restoring -------------------------------------------------------------------------
+
+    def read(self, guild_id: int) -> tuple[dict, list[list]] | None:
+        """Load one snapshot (blocking). Returns None if it is missing, unreadable or too old."""
+        try:
+            with open(self.path(guild_id), "r", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                if header.get('v') != FORMAT_VERSION or time.time() - header.get('saved', 0) > RESUME_MAX_AGE:
+                    return None
+                tracks = json.loads(f.readline())
+        except (OSError, ValueError) as e:
+            logger.debug("Ignoring queue snapshot for guild %s: %s", guild_id, e)
+            return None
+        return header, tracks
+
+    def saved_guilds(self) -> list[int]:
+        return [int(name[:-5]) for name in os.listdir(self.state_dir) if name.endswith(".json") and name[:-5].isdigit()]
+
+    def entry_from_ref(self, ref: list) -> dict | None:
+        """Rebuild a queue entry, from the track store when the file is cached or as a pending download."""
+        file, title, service, track_id, duration, link = ref
+        record = self.player.downloader.toc.get(file)
+        if record is not None:
+            return dict(record)
+        if os.path.isfile(file):
+            # Jukebox and playlist tracks live outside the track store
+            return {'title': title, 'id': track_id, 'file': file, 'service': service, 'duration': duration, 'timestamp': 0}
+        if link:
+            return {
+                'title': title, 'id': track_id, 'file': file, 'service': service, 'duration': duration,
+                'timestamp': round(time.time()), 'link': link, 'pending': True,
+                'size_estimate': (duration or 0) * BYTES_PER_SECOND,
+            }
+        return None
+
+    async def restore_all(self):
+        """Rejoin voice and resume every guild with a recent snapshot. Runs after login, off the startup path."""
+        guild_ids = await asyncio.to_thread(self.saved_guilds)
+        for guild_id in guild_ids:
+            if self.client.get_guild(guild_id) is None:
+                # Another bot process sharing the state directory may serve this guild, so its
+                # snapshot is left alone. Only snapshots of guilds we can see are ours to discard
+                continue
+            snapshot = await asyncio.to_thread(self.read, guild_id)
+            restored = False
+            if snapshot is not None:
+                try:
+                    restored = await self.restore(guild_id, *snapshot)
+                except Exception as e:
+                    log_failed(f"Could not resume queue in guild {guild_id}: {e}")
+            if not restored:
+                await asyncio.to_thread(self.discard, guild_id)
+
+    async def restore(self, guild_id: int, header: dict, refs: list[list]) -> bool:
+        guild = self.client.get_guild(guild_id)
+        channel = guild.get_channel(header['channel']) if guild else None
+        if not isinstance(channel, discord.VoiceChannel) or guild_id in self.player.queues:
+            return False
+        if not any(not member.bot for member in channel.members):
+            logger.info("Not resuming queue in guild %s: nobody is listening", guild.name)
+            return False
+
+        entries = [entry for entry in map(self.entry_from_ref, refs) if entry is not None]
+        if not entries:
+            return False
+        # The current track may have been dropped, its position only applies if it is still first
+        same_track = entries[0]['file'] == refs[0][0]
+        position = header.get('position', 0) if same_track else 0
+
+        conn = guild.voice_client or await channel.connect()
+        queue = GuildQueue(entries, loop=header.get('loop', False), shuffle=header.get('shuffle', False))
+        if same_track:
+            queue.loop_start = header.get('loop_start', 0.0)
+        with self.player.play_lock:
+            if guild_id in self.player.queues:
+                return False
+            self.player.queues[guild_id] = queue
+            current = queue.current
+            if current.get('pending'):
+                asyncio.get_running_loop().create_task(self.player.play_when_ready(conn, current))
+            else:
+                self.player.start_track(conn, current, start=position)
+                if header.get('paused') and conn.is_playing():
+                    conn.pause()
+        self.player.queue_changed(guild_id)
+        # Tracked like a written snapshot, so the file goes away if the queue ends before the next save
+        self.written[guild_id] = {}
+        log_ok(f"Resumed queue in {guild.name}: {len(entries)} tracks, {current['title']} at {position:.0f}s")
+        return True
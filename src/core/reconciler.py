@@ -0,0 +1,96 @@
+import os
+import time
+import shutil
+from core import ogg_index
+from core.track_store import TrackStore
+from core.log_config import logger, log_ok
+
+MUSIC_DIR = "data/music"
+# Downloads are written here and renamed into MUSIC_DIR once complete (same filesystem)
+STAGING_DIR = "data/staging"
+# Staging entries older than this belong to a download that died with its process
+STAGING_MAX_AGE = 3600
+
+def disk_files(root: str = MUSIC_DIR) -> set[str]:
+    files = set()
+    for folder, _, names in os.walk(root):
+        for name in names:
+            files.add(os.path.join(folder, name).replace("\\", "/"))
+    return files
+
+def clear_staging(root: str = STAGING_DIR, max_age: float = STAGING_MAX_AGE) -> int:
+    """Remove abandoned download directories. Returns how many were removed."""
+    removed = 0
+    cutoff = time.time() - max_age
+    try:
+        entries = list(os.scandir(root))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.stat().st_mtime > cutoff:
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
+            removed += 1
+        except OSError as e:
+            logger.debug("Could not remove staging entry %s: %s", entry.path, e)
+    return removed
+
+def reconcile(toc: TrackStore, root: str = MUSIC_DIR, staging: str = STAGING_DIR) -> dict:
+    """
+    Bring data/music and the TOC back in line after a crash (blocking, run it off the event loop).
+
+    Both sides are compared as sets: files on disk with no TOC record are deleted and TOC records
+    whose file is gone are dropped. Every orphan is checked again against the database inside a
+    write transaction, which TrackStore.publish() also holds while it renames a download into
+    place and records it, so a download finishing during the scan (in any process sharing the
+    cache) is never mistaken for an orphan.
+    """
+    started = time.perf_counter()
+    on_disk = disk_files(root)
+    toc.sync()
+    with toc.lock:
+        known = set(toc.by_file)
+
+    orphans = 0
+    for file in on_disk - known:
+        try:
+            if not toc.discard_orphan(file):
+                continue
+        except OSError as e:
+            logger.debug("Could not remove orphaned file %s: %s", file, e)
+            continue
+        ogg_index.remove(file)
+        orphans += 1
+        logger.debug("Removed orphaned file: %s", file)
+
+    missing = 0
+    # Only records under the scanned root can be judged by the walk
+    prefix = root.rstrip("/") + "/"
+    for file in known - on_disk:
+        if not file.startswith(prefix):
+            continue
+        if toc.drop_missing(file) is None:
+            continue
+        ogg_index.remove(file)
+        missing += 1
+        logger.debug("Dropped TOC entry with no file: %s", file)
+
+    result = {
+        'files': len(on_disk),
+        'entries': len(known),
+        'orphans_removed': orphans,
+        'missing_dropped': missing,
+        'staging_removed': clear_staging(staging),
+        'seconds': round(time.perf_counter() - started, 3),
+    }
+    if orphans or missing or result['staging_removed']:
+        log_ok(
+            f"Cache reconciled: {orphans} orphaned files removed, {missing} missing entries dropped, "
+            f"{result['staging_removed']} abandoned downloads cleared"
+        )
+    logger.debug("Reconcile finished: %s", result)
+    return result
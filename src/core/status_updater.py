@@ -0,0 +1,106 @@
+import os
+import time
+import asyncio
+import discord
+from core.log_config import logger, log_failed
+
+# Changes arriving within this window are merged into a single edit
+STATUS_DEBOUNCE = float(os.getenv("STATUS_DEBOUNCE", "1.0"))
+# Minimum seconds between two status edits on the same channel
+STATUS_MIN_INTERVAL = float(os.getenv("STATUS_MIN_INTERVAL", "5.0"))
+
+class StatusUpdater:
+    """
+    Coalesces voice channel status edits so track changes don't turn into bursts of REST calls.
+
+    Each channel has one pending slot holding the latest requested status and at most one worker
+    task. The worker waits out the debounce window and the channel's rate-limit spacing, then
+    applies whatever is in the slot, skipping the edit when it matches what is already shown.
+    update() is safe to call from discord.py's audio thread.
+    """
+    def __init__(self, client: discord.Client):
+        self.client = client
+        self.pending: dict[int, tuple[discord.abc.GuildChannel, str | None]] = {}
+        self.applied: dict[int, str | None] = {}
+        self.next_allowed: dict[int, float] = {}
+        self.workers: dict[int, asyncio.Task] = {}
+        self.edits = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def track_status(metadata: dict) -> str:
+        return f"🎶 {metadata['service']}: {metadata['title']}"
+
+    def update(self, channel, status: str | None):
+        """Request a status change. Only the latest request within the debounce window is sent."""
+        loop = self.client.loop
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self._schedule(channel, status)
+        else:
+            loop.call_soon_threadsafe(self._schedule, channel, status)
+
+    def _schedule(self, channel, status: str | None):
+        if channel.id in self.pending:
+            self.coalesced += 1
+        self.pending[channel.id] = (channel, status)
+        if channel.id not in self.workers:
+            self.workers[channel.id] = self.client.loop.create_task(self._run(channel.id))
+
+    async def set_now(self, channel, status: str | None):
+        """Apply a status immediately, dropping anything pending (e.g. before disconnecting)."""
+        self.pending.pop(channel.id, None)
+        worker = self.workers.pop(channel.id, None)
+        if worker is not None:
+            worker.cancel()
+        await self._apply(channel, status)
+
+    def forget(self, channel_id: int):
+        """Drop all state for a channel the bot has left."""
+        self.pending.pop(channel_id, None)
+        self.applied.pop(channel_id, None)
+        self.next_allowed.pop(channel_id, None)
+        worker = self.workers.pop(channel_id, None)
+        if worker is not None:
+            worker.cancel()
+
+    async def _run(self, channel_id: int):
+        try:
+            while channel_id in self.pending:
+                delay = max(STATUS_DEBOUNCE, self.next_allowed.get(channel_id, 0) - time.monotonic())
+                await asyncio.sleep(delay)
+                channel, status = self.pending.pop(channel_id)
+                await self._apply(channel, status)
+        finally:
+            if self.workers.get(channel_id) is asyncio.current_task():
+                del self.workers[channel_id]
+
+    async def _apply(self, channel, status: str | None):
+        if self.applied.get(channel.id, ...) == status:
+            logger.debug("Status unchanged on channel %s, edit skipped", channel.id)
+            return
+        try:
+            await channel.edit(status=status)
+        except discord.RateLimited as e:
+            self._retry_later(channel, status, e.retry_after)
+            return
+        except discord.HTTPException as e:
+            if e.status == 429:
+                self._retry_later(channel, status, getattr(e, 'retry_after', STATUS_MIN_INTERVAL))
+            else:
+                log_failed(f"Could not set status on channel {channel.id}: {e}")
+            return
+        self.applied[channel.id] = status
+        self.next_allowed[channel.id] = time.monotonic() + STATUS_MIN_INTERVAL
+        self.edits += 1
+
+    def _retry_later(self, channel, status: str | None, retry_after: float):
+        logger.debug("Status edit rate limited on channel %s, retrying in %.1fs", channel.id, retry_after)
+        self.next_allowed[channel.id] = time.monotonic() + retry_after
+        # A newer request that arrived meanwhile wins over the one that was limited
+        self.pending.setdefault(channel.id, (channel, status))
+        if channel.id not in self.workers:
+            self.workers[channel.id] = self.client.loop.create_task(self._run(channel.id))
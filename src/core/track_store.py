@@ -0,0 +1,396 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from core.log_config import logger
+
+COLUMNS = ('file', 'service', 'id', 'title', 'duration', 'timestamp')
+# Pins of a process that hasn't refreshed them for this many seconds are treated as gone
+PIN_TTL = 60
+# Rows kept in the change log; a process further behind than this reloads everything
+CHANGE_LOG_SIZE = 10000
+# Seconds a track stays pinned after touch() or publish() pinned it, long enough for it to be
+# queued and picked up by the next heartbeat
+PIN_LEASE = 30
+
+class TrackStore:
+    """
+    Table of Contents for downloaded music, kept in memory for O(1) lookups and
+    persisted row by row to SQLite (WAL mode) so a cache hit only touches one record.
+    Records are ordered least-recently-used first.
+
+    Several bot processes can share one store. Every write also appends to a change log, and
+    sync() replays the log into memory when PRAGMA data_version says another connection has
+    committed. Each process publishes the files its queues hold as reference-counted pins,
+    which eviction in every process respects for as long as that process keeps heartbeating.
+    A cache hit or a finished download can also be pinned in the same write, so it is protected
+    before the heartbeat sees it in a queue.
+    """
+    def __init__(self, path: str = "data/toc.db", legacy_path: str = "data/toc.json"):
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        # Other processes hold the write lock briefly, wait for them instead of failing
+        self.db.execute("PRAGMA busy_timeout=10000")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            "file TEXT PRIMARY KEY, service TEXT, id TEXT, title TEXT, "
+            "duration INTEGER, timestamp INTEGER, extra TEXT)"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, file TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS owners (owner TEXT PRIMARY KEY, pid INTEGER, heartbeat REAL)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pins ("
+            "file TEXT, owner TEXT, count INTEGER, PRIMARY KEY (file, owner))"
+        )
+
+        self.by_file: OrderedDict[str, dict] = OrderedDict()
+        self.by_key: dict[tuple[str, str], dict] = {}
+        # Running totals so eviction and stats never have to rescan the catalogue
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+        # This process's identity in the pins table, and the pins it last wrote
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.pins_written: dict[str, int] = {}
+        # Files pinned by touch() or publish(), with when the pin lapses unless a queue holds them
+        self.leases: dict[str, float] = {}
+        self.seq = 0
+        self.data_version = None
+        self.reload()
+
+        if not self.by_file and os.path.isfile(legacy_path):
+            self.migrate(legacy_path)
+
+        logger.debug("Track store loaded with %d entries from %s", len(self.by_file), path)
+
+    @staticmethod
+    def key_for(record: dict) -> tuple[str, str]:
+        """(service, id) key matching the filename built from match_service_and_id."""
+        return record.get('service'), os.path.basename(record['file']).rsplit('.', 1)[0]
+
+    @staticmethod
+    def _record(row: tuple) -> dict:
+        record = dict(zip(COLUMNS, row[:-1]))
+        if row[-1]:
+            record.update(json.loads(row[-1]))
+        return record
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction that takes SQLite's write lock up front, shared by every process."""
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+            self.db.execute("COMMIT")
+
+    def reload(self):
+        """Rebuild the in-memory index from the database."""
+        with self.lock:
+            self.by_file.clear()
+            self.by_key.clear()
+            self.total_bytes = 0
+            # One read transaction, so the records and the change log position match
+            # (or the caller's write transaction, when syncing inside one)
+            own = not self.db.in_transaction
+            if own:
+                self.db.execute("BEGIN")
+            try:
+                for row in self.db.execute(f"SELECT {', '.join(COLUMNS)}, extra FROM tracks ORDER BY timestamp"):
+                    self._index(self._record(row))
+                self.seq = self.db.execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+            finally:
+                if own:
+                    self.db.execute("COMMIT")
+            self.data_version = self.db.execute("PRAGMA data_version").fetchone()[0]
+
+    def sync(self) -> int:
+        """Apply changes other processes committed since the last call. Returns how many files changed."""
+        with self.lock:
+            version = self.db.execute("PRAGMA data_version").fetchone()[0]
+            if version == self.data_version:
+                return 0
+            self.data_version = version
+            rows = self.db.execute("SELECT seq, file FROM changes WHERE seq > ? ORDER BY seq", (self.seq,)).fetchall()
+            if not rows:
+                return 0
+            if rows[0][0] > self.seq + 1 and self.seq:
+                # The log was trimmed past our position, some changes are gone
+                logger.debug("Track store fell behind the change log, reloading")
+                self.reload()
+                return len(self.by_file)
+            self.seq = rows[-1][0]
+            files = list(dict.fromkeys(file for _, file in rows))
+            for file in files:
+                row = self.db.execute(
+                    f"SELECT {', '.join(COLUMNS)}, extra FROM tracks WHERE file = ?", (file,)
+                ).fetchone()
+                if row is None:
+                    self._forget(file)
+                else:
+                    self._index(self._record(row))
+            return len(files)
+
+    def _index(self, record: dict):
+        if 'size' not in record:
+            try:
+                record['size'] = os.path.getsize(record['file'])
+            except OSError:
+                record['size'] = 0
+        previous = self.by_file.get(record['file'])
+        if previous is not None:
+            self.total_bytes -= previous['size']
+        self.total_bytes += record['size']
+        self.by_file[record['file']] = record
+        self.by_file.move_to_end(record['file'])
+        self.by_key[self.key_for(record)] = record
+
+    def _forget(self, file: str) -> dict | None:
+        record = self.by_file.pop(file, None)
+        if record is None:
+            return None
+        self.by_key.pop(self.key_for(record), None)
+        self.total_bytes -= record['size']
+        return record
+
+    def _changed(self, file: str):
+        self.db.execute("INSERT INTO changes (file) VALUES (?)", (file,))
+
+    def _write(self, record: dict):
+        extra = {k: v for k, v in record.items() if k not in COLUMNS}
+        self.db.execute(
+            f"INSERT OR REPLACE INTO tracks ({', '.join(COLUMNS)}, extra) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            tuple(record.get(c) for c in COLUMNS) + (json.dumps(extra) if extra else None,)
+        )
+        self._changed(record['file'])
+
+    def migrate(self, legacy_path: str):
+        """Import entries from an old list-based toc.json file."""
+        try:
+            with open(legacy_path, "r") as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not migrate %s: %s", legacy_path, e)
+            return
+
+        entries = [e for e in entries if isinstance(e, dict) and 'file' in e]
+        entries.sort(key=lambda e: e.get('timestamp', 0))
+        with self.transaction():
+            for record in entries:
+                self._write(record)
+                self._index(record)
+
+        os.replace(legacy_path, legacy_path + ".migrated")
+        logger.info("Migrated %d entries from %s to %s", len(entries), legacy_path, self.path)
+
+    def get(self, file: str) -> dict | None:
+        return self.by_file.get(file)
+
+    def get_by_id(self, service: str, track_id: str) -> dict | None:
+        return self.by_key.get((service, track_id))
+
+    def add(self, record: dict):
+        with self.transaction():
+            self._write(record)
+            self._index(record)
+
+    def publish(self, staged: str, record: dict, pin: bool = False):
+        """
+        Rename a finished download into place and record it. Both happen inside one write
+        transaction, so no reconciler (in this process or another) sees the file without its record.
+        """
+        with self.transaction():
+            os.makedirs(os.path.dirname(record['file']), exist_ok=True)
+            os.replace(staged, record['file'])
+            self._write(record)
+            self._index(record)
+            if pin:
+                self._pin(record['file'])
+
+    def touch(self, file: str, timestamp: int, pin: bool = False) -> dict | None:
+        """
+        Mark a track as recently used, moving it to the back of the LRU order, and optionally pin it.
+        Blocking: it waits for the write lock when another process holds it.
+        """
+        self.sync()
+        if file not in self.by_file:
+            return None
+        with self.transaction():
+            # Again under the write lock, in case another process evicted it meanwhile
+            self.sync()
+            record = self.by_file.get(file)
+            if record is None:
+                return None
+            self.db.execute("UPDATE tracks SET timestamp = ? WHERE file = ?", (timestamp, file))
+            self._changed(file)
+            if pin:
+                self._pin(file)
+            record['timestamp'] = timestamp
+            self.by_file.move_to_end(file)
+            return record
+
+    def _pin(self, file: str):
+        """Pin a file for PIN_LEASE seconds, inside the caller's transaction."""
+        now = time.time()
+        self.leases[file] = now + PIN_LEASE
+        self.db.execute(
+            "INSERT OR REPLACE INTO owners (owner, pid, heartbeat) VALUES (?, ?, ?)", (self.owner, os.getpid(), now)
+        )
+        if not self.pins_written.get(file):
+            self.db.execute("INSERT OR REPLACE INTO pins (file, owner, count) VALUES (?, ?, 1)", (file, self.owner))
+            self.pins_written[file] = 1
+
+    def _leased(self, now: float) -> set[str]:
+        """Files still pinned by touch() or publish(), dropping lapsed leases."""
+        for file, expires in list(self.leases.items()):
+            if expires < now:
+                del self.leases[file]
+        return set(self.leases)
+
+    def remove(self, file: str) -> dict | None:
+        with self.lock:
+            record = self._forget(file)
+            if record is None:
+                return None
+            with self.transaction():
+                self.db.execute("DELETE FROM tracks WHERE file = ?", (file,))
+                self._changed(file)
+            return record
+
+    def discard_orphan(self, file: str) -> bool:
+        """Delete a file that has no record. Checked against the database under the write lock."""
+        with self.transaction():
+            if self.db.execute("SELECT 1 FROM tracks WHERE file = ?", (file,)).fetchone():
+                return False
+            os.remove(file)
+            return True
+
+    def drop_missing(self, file: str) -> dict | None:
+        """Remove the record of a file that no longer exists on disk."""
+        with self.lock:
+            if os.path.exists(file):
+                return None
+            return self.remove(file)
+
+    def record_hit(self, record: dict):
+        self.hits += 1
+        self.bytes_saved += record.get('size', 0)
+
+    def record_miss(self):
+        self.misses += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.by_file),
+            'bytes': self.total_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'bytes_saved': self.bytes_saved,
+        }
+
+    def heartbeat(self, pins: dict[str, int]):
+        """
+        Mark this process alive and publish its pins (file -> number of queue entries holding it).
+        Only the difference from the last call is written, and files with a live lease stay pinned.
+        Also trims the change log and the pins of processes that stopped heartbeating.
+        """
+        now = time.time()
+        with self.transaction():
+            pins = dict(pins)
+            for file in self._leased(now):
+                pins.setdefault(file, 1)
+            self.db.execute(
+                "INSERT OR REPLACE INTO owners (owner, pid, heartbeat) VALUES (?, ?, ?)",
+                (self.owner, os.getpid(), now)
+            )
+            for file, count in pins.items():
+                if self.pins_written.get(file) != count:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO pins (file, owner, count) VALUES (?, ?, ?)", (file, self.owner, count)
+                    )
+            for file in self.pins_written.keys() - pins.keys():
+                self.db.execute("DELETE FROM pins WHERE file = ? AND owner = ?", (file, self.owner))
+
+            self.db.execute("DELETE FROM owners WHERE heartbeat < ?", (now - PIN_TTL,))
+            self.db.execute("DELETE FROM pins WHERE owner NOT IN (SELECT owner FROM owners)")
+            self.db.execute("DELETE FROM changes WHERE seq <= (SELECT MAX(seq) FROM changes) - ?", (CHANGE_LOG_SIZE,))
+            self.pins_written = pins
+
+    def foreign_pins(self) -> set[str]:
+        """Files pinned by other live processes."""
+        rows = self.db.execute(
+            "SELECT DISTINCT pins.file FROM pins JOIN owners ON pins.owner = owners.owner "
+            "WHERE pins.owner != ? AND owners.heartbeat >= ? AND pins.count > 0",
+            (self.owner, time.time() - PIN_TTL)
+        )
+        return {file for (file,) in rows}
+
+    def evict(self, max_bytes: int, pinned: set = frozenset()) -> list[dict]:
+        """
+        Remove least recently used records until the cache fits in max_bytes.
+        Pinned files (e.g. tracks sitting in a queue, here or in another process) are never removed.
+        Pins are read and records removed in one write transaction, so a pin committed by another
+        process either comes first and is respected, or sees the record already gone.
+        Returns the removed records so the caller can delete the files.
+        """
+        self.sync()
+        if self.total_bytes <= max_bytes:
+            return []
+        with self.transaction():
+            self.sync()
+            excess = self.total_bytes - max_bytes
+            if excess <= 0:
+                return []
+            pinned = pinned | self.foreign_pins() | self._leased(time.time())
+            victims = []
+            # Walk from the LRU end only as far as needed to free the excess
+            for file, record in self.by_file.items():
+                if excess <= 0:
+                    break
+                if file in pinned:
+                    continue
+                victims.append(file)
+                excess -= record['size']
+            removed = []
+            for file in victims:
+                removed.append(self._forget(file))
+                self.db.execute("DELETE FROM tracks WHERE file = ?", (file,))
+                self._changed(file)
+            return removed
+
+    def oldest(self) -> dict | None:
+        """Least recently used record, or None when empty."""
+        return next(iter(self.by_file.values()), None)
+
+    def __len__(self):
+        return len(self.by_file)
+
+    def __iter__(self):
+        return iter(list(self.by_file.values()))
+
+    def __contains__(self, file: str):
+        return file in self.by_file
+
+    def close(self):
+        """Withdraw this process's pins and close the database."""
+        try:
+            with self.transaction():
+                self.db.execute("DELETE FROM pins WHERE owner = ?", (self.owner,))
+                self.db.execute("DELETE FROM owners WHERE owner = ?", (self.owner,))
+        except sqlite3.Error as e:
+            logger.debug("Could not withdraw pins: %s", e)
+        self.db.close()
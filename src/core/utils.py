@@ -29,13 +29,23 @@ def create_embed(title, description, color, queue_list=[], song_queuer=None, son
 
     return embed
 
-def cleanup_orphaned_files(toc):
-    import os
-    tocfiles = [entry['file'] for entry in toc]
+def parse_duration(text: str) -> float | None:
+    """Seconds from "90", "1:30" or "1:02:03", or None if text isn't a time."""
+    try:
+        parts = [float(part) for part in text.strip().split(":")]
+    except ValueError:
+        return None
+    if not 1 <= len(parts) <= 3 or any(part < 0 for part in parts):
+        return None
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + part
+    return seconds
 
-    for folder, _, files in os.walk("data/music"):
-        for file in files:
-            full_path = os.path.join(folder, file).replace("\\", "/")
-            if full_path not in tocfiles:
-                print(f"Removing orphaned file: {full_path}")
-                os.remove(full_path)
+def format_duration(seconds):
+    seconds = int(seconds or 0)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02}:{seconds:02}"
+    return f"{minutes}:{seconds:02}"
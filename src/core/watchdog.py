@@ -0,0 +1,184 @@
+import os
+import sys
+import time
+import atexit
+import asyncio
+import logging
+import threading
+import traceback
+from core import metrics
+from core.log_config import logger
+
+# A callback holding the loop for longer than this gets its stack captured
+LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "200")) / 1000
+HEARTBEAT_INTERVAL = 0.1
+# Run the loop in asyncio debug mode and collect its slow-callback warnings as well
+LOOP_DEBUG = os.getenv("LOOP_DEBUG", "0").lower() in ("1", "true", "t")
+REPORT_PATH = "logs/loop_report.txt"
+# Seconds between rewrites of the report while new offenders are coming in
+REPORT_INTERVAL = 300
+REPORT_SIZE = 20
+
+SRC_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+loop_lag = metrics.registry.histogram(
+    "bot_loop_lag_seconds", "How late the event loop heartbeat woke up", buckets=metrics.GAP_BUCKETS)
+loop_stalls = metrics.registry.counter(
+    "bot_loop_stalls_total", "Times the event loop was blocked for longer than the lag threshold")
+
+class _SlowCallbackHandler(logging.Handler):
+    """Feeds asyncio's 'Executing <Handle> took N seconds' debug warnings into the watchdog."""
+    def __init__(self, watchdog: "LoopWatchdog"):
+        super().__init__(logging.WARNING)
+        self.watchdog = watchdog
+
+    def emit(self, record):
+        if record.msg.startswith("Executing") and len(record.args or ()) == 2:
+            handle, duration = record.args
+            self.watchdog.record(f"callback {str(handle)[:300]}", duration, None)
+
+class LoopWatchdog:
+    """
+    Measures event loop lag with a heartbeat task and catches callbacks that block it.
+
+    A watchdog thread checks the time since the last heartbeat. Once that passes LAG_THRESHOLD
+    it grabs the loop thread's current stack with sys._current_frames(), so the report points at
+    the code that is blocking while it is still blocking. Offenders are aggregated by the
+    innermost frame in the bot's own source and written to REPORT_PATH, worst first.
+    """
+    def __init__(self, threshold: float = LAG_THRESHOLD, interval: float = HEARTBEAT_INTERVAL,
+                 report_path: str = REPORT_PATH):
+        self.threshold = threshold
+        self.interval = interval
+        self.report_path = report_path
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        # key -> {'count', 'total', 'max', 'stack'}
+        self.offenders: dict[str, dict] = {}
+        self.last_beat = time.monotonic()
+        self.max_lag = 0.0
+        self._stall_beat = None
+        self._stall_key = None
+        self._dirty = False
+        self.loop = None
+        self.loop_thread = None
+        self.task = None
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """Start monitoring. Must be called from the event loop's thread."""
+        if self.task is not None:
+            return
+        self.loop = loop or asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.task = self.loop.create_task(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+        if LOOP_DEBUG:
+            self.loop.set_debug(True)
+            self.loop.slow_callback_duration = self.threshold
+            logging.getLogger("asyncio").addHandler(_SlowCallbackHandler(self))
+        atexit.register(self.stop)
+        logger.debug("Loop watchdog started (threshold %.0fms, debug %s)", self.threshold * 1000, LOOP_DEBUG)
+
+    def stop(self):
+        self.stopped.set()
+        if self.task is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.task.cancel)
+        if self._dirty:
+            self.write_report()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            loop_lag.observe(lag)
+            self.max_lag = max(self.max_lag, lag)
+            with self.lock:
+                if self._stall_key is not None and self._stall_beat == self.last_beat:
+                    # The stall we caught has ended, now we know how long it really was
+                    self._add_duration(self._stall_key, now - self.last_beat - self.interval)
+                    self._stall_key = None
+                self.last_beat = now
+
+    def _watch(self):
+        last_report = time.monotonic()
+        while not self.stopped.wait(self.interval / 2):
+            now = time.monotonic()
+            beat = self.last_beat
+            if now - beat - self.interval >= self.threshold and self._stall_beat != beat:
+                self._capture(beat, now - beat - self.interval)
+            if self._dirty and now - last_report >= REPORT_INTERVAL:
+                self.write_report()
+                last_report = now
+
+    def _capture(self, beat: float, blocked: float):
+        frame = sys._current_frames().get(self.loop_thread)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        key = self._offender_key(stack)
+        loop_stalls.inc()
+        with self.lock:
+            self._stall_beat = beat
+            self._stall_key = key
+            entry = self.offenders.setdefault(key, {'count': 0, 'total': 0.0, 'max': 0.0, 'stack': None})
+            entry['count'] += 1
+            entry['stack'] = "".join(stack.format())
+            self._dirty = True
+        logger.warning(
+            "Event loop blocked for %.0fms+ in %s\n%s",
+            blocked * 1000, key, "".join(traceback.format_list(stack[-8:])).rstrip()
+        )
+
+    def _add_duration(self, key: str, duration: float):
+        entry = self.offenders[key]
+        entry['total'] += duration
+        entry['max'] = max(entry['max'], duration)
+
+    @staticmethod
+    def _offender_key(stack: traceback.StackSummary) -> str:
+        """Innermost frame in the bot's own code, falling back to the innermost frame overall."""
+        for frame in reversed(stack):
+            if frame.filename.startswith(SRC_ROOT):
+                return f"{os.path.relpath(frame.filename, SRC_ROOT)}:{frame.lineno} in {frame.name}"
+        frame = stack[-1]
+        return f"{frame.filename}:{frame.lineno} in {frame.name}"
+
+    def record(self, key: str, duration: float, stack: str | None):
+        """Add a blocking event reported from elsewhere (asyncio's slow-callback warnings)."""
+        with self.lock:
+            entry = self.offenders.setdefault(key, {'count': 0, 'total': 0.0, 'max': 0.0, 'stack': stack})
+            entry['count'] += 1
+            self._add_duration(key, duration)
+            self._dirty = True
+
+    def worst(self, n: int = REPORT_SIZE) -> list[tuple[str, dict]]:
+        with self.lock:
+            items = [(key, dict(entry)) for key, entry in self.offenders.items()]
+        return sorted(items, key=lambda item: (-item[1]['total'], -item[1]['count']))[:n]
+
+    def write_report(self):
+        lines = [
+            f"Event loop report, {time.strftime('%Y-%m-%d %H:%M:%S')}",
+            f"Threshold {self.threshold * 1000:.0f}ms, worst heartbeat lag {self.max_lag * 1000:.0f}ms",
+            "",
+        ]
+        for key, entry in self.worst():
+            lines.append(
+                f"{entry['total'] * 1000:8.0f}ms total  {entry['max'] * 1000:6.0f}ms max  "
+                f"{entry['count']:4d}x  {key}"
+            )
+            if entry['stack']:
+                lines += ["    " + line for line in entry['stack'].rstrip().splitlines()[-12:]]
+            lines.append("")
+        tmp_path = self.report_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines))
+            os.replace(tmp_path, self.report_path)
+            self._dirty = False
+        except OSError as e:
+            logger.debug("Could not write loop report: %s", e)
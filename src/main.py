@@ -1,6 +1,6 @@
 import os
 import sys
-import time
+import asyncio
 import discord
 from discord import app_commands
 from dotenv import load_dotenv
@@ -13,11 +13,14 @@ from commands.music import MusicCommands
 from core.player import PlayerHandler
 from core.downloader import DownloaderHandler
 from core.log_config import logger, log_ok, log_failed, log_ready, logtest, soft_clear_terminal
-from core import utils
+from core import metrics, reconciler
+from core.watchdog import LoopWatchdog
+from core.queue_state import QueueSnapshots
 
 # Load environment variables
 load_dotenv()
 TOKEN = os.getenv("BOT_TOKEN")
+# One guild ID, or several separated by commas
 GUILD_ID = os.getenv("GUILD_ID")
 
 if not TOKEN or not GUILD_ID:
@@ -27,29 +30,53 @@ intents = discord.Intents.default()
 intents.message_content = True
 client = discord.Client(intents=intents)
 tree = app_commands.CommandTree(client)
-guilds = [discord.Object(id=int(GUILD_ID))]
+guilds = [discord.Object(id=int(guild_id)) for guild_id in GUILD_ID.split(",") if guild_id.strip()]
 player = PlayerHandler(client)
 downloader = DownloaderHandler(client, player)
 musichandler = MusicCommands(tree, guilds, downloader)
+metrics.register_bot(client, player, downloader)
+metrics_server = None
+reconciled = False
+watchdog = LoopWatchdog()
+snapshots = QueueSnapshots(client, player)
 
 @client.event
 async def on_ready():
+    watchdog.start()
     logger.info("========================================")
     logger.info("Starting up...")
-    time.sleep(0.5)
+    await asyncio.sleep(0.5)
     soft_clear_terminal()
 
     # logtest()
-    time.sleep(0.5)
+    await asyncio.sleep(0.5)
 
     log_ok(f"Logged in as {client.user}")
-    await tree.sync(guild=guilds[0])
-    log_ok(f"Slash commands synced to {GUILD_ID}")
-    time.sleep(0.5)
+    for guild in guilds:
+        await tree.sync(guild=guild)
+    log_ok(f"Slash commands synced to {', '.join(str(guild.id) for guild in guilds)}")
+    # Share cache pins with other bot processes using the same data directory
+    downloader.start()
+    # Saved queues are read and resumed in the background once we're connected
+    snapshots.start()
+    global reconciled
+    if not reconciled:
+        reconciled = True
+        asyncio.create_task(reconcile_cache())
+    global metrics_server
+    if metrics_server is None:
+        metrics_server = await metrics.start_server()
+    await asyncio.sleep(0.5)
     log_failed("Ban Scienceboy from the server :(")
-    time.sleep(0.2)
+    await asyncio.sleep(0.2)
     log_ready("Server is ready.")
 
+async def reconcile_cache():
+    try:
+        await asyncio.to_thread(reconciler.reconcile, downloader.toc)
+    except Exception as e:
+        logger.error("Failed to reconcile the audio cache: %s", e)
+
 @client.event
 async def on_voice_state_update(member, before, after):
     if member.id == client.user.id:
@@ -67,18 +94,14 @@ async def on_voice_state_update(member, before, after):
                 am_i_here = True
 
         if user_count == 0 and am_i_here:
-            await player.disconnect(force=False)
+            # Drop the queue first so the after callback fired by the disconnect has nothing to advance
             player.queues.pop(before.channel.guild.id, None)
+            player.discard_prefetched(before.channel.guild.id)
+            if vc_conn is not None:
+                await vc_conn.disconnect(force=False)
+            player.status.forget(before.channel.id)
 
 def main():
-    try:
-        from json import load
-        with open("data/toc.json", "r") as f:
-            toc = load(f)
-        utils.cleanup_orphaned_files(toc)
-    except Exception as e:
-        logger.error(f"Failed to clean up orphaned files: {e}")
-
     client.run(TOKEN)
     
 
@@ -88,4 +111,4 @@ if __name__ == "__main__":
     except Exception as e:
         if os.getenv("PRINT_STACK_TRACE", "1").lower() in ("1", "true", "t"):
             raise
-        logger.error(f"Unhandled Exception: {e}")
+        logger.error("Unhandled Exception: %s", e)
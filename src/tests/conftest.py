@@ -0,0 +1,35 @@
+"""
+Shared setup for the tests. They drive the real handlers through the fake guilds, voice clients
+and stub yt-dlp backend from tests.fakes, so nothing talks to Discord or YouTube.
+
+Run from the repository root or src/:
+    python -m pytest -q
+"""
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from core import ingest
+from bench import loadtest
+
+@pytest.fixture
+def harness(request, tmp_path, monkeypatch):
+    """
+    Build a loadtest Harness named after the test, running in its tmp_path, with short tracks and
+    latencies. Keyword arguments override the command line options of bench.loadtest.
+    """
+    monkeypatch.chdir(tmp_path)
+    # Loudness analysis needs ffmpeg and only slows the tests down
+    monkeypatch.setattr(ingest, "NORMALISE_AUDIO", False)
+
+    def make(**overrides) -> loadtest.Harness:
+        args = loadtest.parse_args([])
+        args.guilds = 2
+        args.track_seconds = 1.0
+        args.extract_ms = 10.0
+        args.download_ms = 20.0
+        for name, value in overrides.items():
+            setattr(args, name, value)
+        return loadtest.Harness(request.node.name, args, str(tmp_path))
+    return make
@@ -0,0 +1,247 @@
+"""
+Fake Discord objects and a stub yt-dlp backend, shared by the tests and bench.loadtest.
+
+Importing this module has no side effects: it doesn't change directory, create files or touch
+the environment, and it doesn't import anything from core.
+"""
+# Allow the harness to be used for type hints without importing bench.loadtest
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from bench.loadtest import Harness
+
+import os
+import time
+import shutil
+import asyncio
+import threading
+from types import SimpleNamespace
+import discord
+from bench.common import FRAME_SECONDS
+
+HAS_FFMPEG = shutil.which("ffmpeg") is not None
+
+def link(video_id: str) -> str:
+    return f"https://youtu.be/{video_id}"
+
+# --- Stub yt-dlp -------------------------------------------------------------------------
+
+class StubYoutubeDL:
+    """Stand-in for yt_dlp.YoutubeDL that serves the generated media file with configurable latency."""
+    media_path = None
+    extract_delay = 0.05
+    download_delay = 0.2
+    duration = 10
+    lock = threading.Lock()
+    extractions = 0
+    downloads = 0
+
+    def __init__(self, opts: dict = None):
+        self.opts = opts or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, link: str, download: bool = False) -> dict:
+        time.sleep(self.extract_delay)
+        with StubYoutubeDL.lock:
+            StubYoutubeDL.extractions += 1
+        video_id = link.rstrip("/")[-11:]
+        info = {
+            'id': video_id,
+            'title': f"Track {video_id}",
+            'duration': self.duration,
+            'http_headers': {},
+        }
+        if HAS_FFMPEG:
+            # Lets the streaming path spawn ffmpeg on the local file like it would on a CDN URL
+            info['url'] = self.media_path
+        if download:
+            self.process_ie_result(info, download=True)
+        return info
+
+    @staticmethod
+    def sanitize_info(info: dict) -> dict:
+        return dict(info)
+
+    def process_ie_result(self, info: dict, download: bool = True) -> dict:
+        time.sleep(self.download_delay)
+        with StubYoutubeDL.lock:
+            StubYoutubeDL.downloads += 1
+        target = self.opts['outtmpl'].replace("%(ext)s", "opus")
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(self.media_path, target)
+        return info
+
+# --- Fake Discord objects ----------------------------------------------------------------
+
+class FakeVoiceClient:
+    """
+    Plays sources on a thread the way discord.py's AudioPlayer does: one read() per frame,
+    paced in real time divided by the speed factor, then after(error) when the source ends.
+    """
+    def __init__(self, harness: Harness, guild, channel):
+        self.harness = harness
+        self.guild = guild
+        self.channel = channel
+        self.source = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._resumed = threading.Event()
+        self._resumed.set()
+        self._ended_at = None
+
+    def play(self, source, *, after=None):
+        if self.is_playing() or self.is_paused():
+            raise discord.ClientException("Already playing audio.")
+        self.source = source
+        self._stop = threading.Event()
+        self._resumed.set()
+        self._thread = threading.Thread(target=self._run, args=(source, after, self._stop), daemon=True)
+        self._thread.start()
+
+    def _run(self, source, after, stop: threading.Event):
+        frame = FRAME_SECONDS / self.harness.speed
+        deadline = time.perf_counter()
+        first = True
+        error = None
+        try:
+            while not stop.is_set():
+                if not self._resumed.is_set():
+                    self._resumed.wait()
+                    deadline = time.perf_counter()
+                packet = source.read()
+                if not packet:
+                    # Like discord.py, the client stops counting as playing before after() runs
+                    stop.set()
+                    break
+                now = time.perf_counter()
+                if first:
+                    first = False
+                    self.harness.tracks_started += 1
+                    if self._ended_at is not None:
+                        self.harness.gaps.append(now - self._ended_at)
+                elif now > deadline + frame:
+                    # Packet arrived more than a frame late, Discord would hear a stutter
+                    self.harness.underruns += 1
+                    deadline = now
+                deadline += frame
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        except Exception as e:
+            error = e
+        finally:
+            source.cleanup()
+            self._ended_at = time.perf_counter()
+            if self.source is source:
+                self.source = None
+            if after is not None:
+                after(error)
+
+    def is_playing(self) -> bool:
+        return self._thread is not None and self._resumed.is_set() and not self._stop.is_set()
+
+    def is_paused(self) -> bool:
+        return self._thread is not None and not self._resumed.is_set() and not self._stop.is_set()
+
+    def stop(self):
+        self._stop.set()
+        self._resumed.set()
+
+    def pause(self):
+        self._resumed.clear()
+
+    def resume(self):
+        self._resumed.set()
+
+    async def disconnect(self, force: bool = False):
+        self.stop()
+        self.guild.voice_client = None
+        if self in self.harness.client.voice_clients:
+            self.harness.client.voice_clients.remove(self)
+
+class FakeChannel(discord.VoiceChannel):
+    """A voice channel as far as isinstance checks go. None of discord.VoiceChannel's state is set up."""
+    # Shadows the property, which would read the member list from the guild's voice states
+    members = None
+
+    def __init__(self, harness: Harness, guild):
+        self.harness = harness
+        self.guild = guild
+        self.id = guild.id * 10
+        self.name = f"voice-{guild.id}"
+        self.members = []
+        self.status = None
+
+    async def edit(self, status=None):
+        self.harness.status_edits += 1
+        self.status = status
+
+    async def connect(self):
+        conn = FakeVoiceClient(self.harness, self.guild, self)
+        self.guild.voice_client = conn
+        self.harness.client.voice_clients.append(conn)
+        return conn
+
+class FakeGuild:
+    def __init__(self, harness: Harness, guild_id: int):
+        self.id = guild_id
+        self.name = f"guild-{guild_id}"
+        self.voice_client = None
+        self.channel = FakeChannel(harness, self)
+
+    def get_channel(self, channel_id: int):
+        return self.channel if channel_id == self.channel.id else None
+
+class FakeMessage:
+    async def edit(self, **kwargs):
+        pass
+
+class FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    def _respond(self):
+        if self._done:
+            raise discord.InteractionResponded(self.interaction)
+        self._done = True
+        self.interaction.responded_at = time.perf_counter()
+
+    async def send_message(self, *args, **kwargs):
+        self._respond()
+
+    async def defer(self, *args, **kwargs):
+        self._respond()
+
+class FakeFollowup:
+    async def send(self, *args, **kwargs):
+        return FakeMessage()
+
+class FakeInteraction:
+    def __init__(self, guild: FakeGuild, user_id: int):
+        self.guild = guild
+        self.user = SimpleNamespace(id=user_id, name=f"user-{user_id}", voice=SimpleNamespace(channel=guild.channel))
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup()
+        self.responded_at = None
+
+class LoadClient:
+    """The parts of discord.Client the handlers use."""
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.voice_clients = []
+        self.guilds = []
+
+    def get_guild(self, guild_id: int):
+        return next((guild for guild in self.guilds if guild.id == guild_id), None)
+
+    def is_closed(self) -> bool:
+        return False
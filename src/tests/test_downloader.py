@@ -0,0 +1,200 @@
+import os
+import time
+import asyncio
+import yt_dlp
+from tests.fakes import StubYoutubeDL, FakeMessage, link
+from core import downloader as downloader_module
+from core.executor import Priority
+
+def test_slow_download_keeps_loop_serving_other_guilds(harness, monkeypatch):
+    # Without streaming, /play holds its interaction for the whole extract + download
+    monkeypatch.setattr(downloader_module, "STREAMING_PLAYBACK", False)
+
+    async def scenario():
+        async with harness(extract_ms=500, download_ms=500, workers=1) as h:
+            slow, other = h.guilds
+            play = asyncio.create_task(h.invoke("play", slow, link=link("slowtrack01")))
+            while not h.downloader.executor.active and not play.done():
+                await asyncio.sleep(0.005)
+
+            latencies = []
+            while not play.done():
+                start = time.perf_counter()
+                await h.invoke("nextup", other)
+                latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+            await h.settle()
+            return h, latencies
+
+    h, latencies = asyncio.run(scenario())
+    assert h.errors == 0
+    assert h.tracks_started == 1
+    # The other guild kept getting answers for the full second the download took
+    assert len(latencies) >= 20
+    assert max(latencies) < 0.1
+    assert max(h.lags) < 0.1
+
+def test_concurrent_plays_of_one_track_extract_and_download_once(harness):
+    async def scenario():
+        async with harness(guilds=8, extract_ms=100, download_ms=200) as h:
+            await asyncio.gather(*(h.invoke("play", guild, link=link("sharedtrack")) for guild in h.guilds))
+            await h.settle()
+            return h
+
+    h = asyncio.run(scenario())
+    assert h.errors == 0
+    assert StubYoutubeDL.extractions == 1
+    assert StubYoutubeDL.downloads == 1
+    assert h.tracks_started == len(h.guilds)
+
+def test_concurrent_fetches_share_one_download(harness):
+    async def scenario():
+        async with harness(extract_ms=50, download_ms=200) as h:
+            results = await asyncio.gather(*(
+                h.downloader.fetch_track("YouTube", f"stress{i % 4:05d}", link(f"stress{i % 4:05d}"))
+                for i in range(40)
+            ))
+            return h, results
+
+    h, results = asyncio.run(scenario())
+    # Four distinct tracks, each requested ten times at once
+    assert StubYoutubeDL.extractions == 4
+    assert StubYoutubeDL.downloads == 4
+    for i, metadata in enumerate(results):
+        assert metadata is results[i % 4]
+    assert len(h.downloader.toc) == 4
+
+def test_shared_download_runs_in_its_most_urgent_waiters_class(harness):
+    async def scenario():
+        async with harness(workers=1, extract_ms=10, download_ms=200) as h:
+            done = []
+            async def fetch(video_id, priority, guild_id):
+                await h.downloader.fetch_track("YouTube", video_id, link(video_id), priority, guild_id)
+                done.append((video_id, priority))
+
+            busy = asyncio.ensure_future(fetch("busy0000001", Priority.ADD, 1))
+            await asyncio.sleep(0.05)
+            tasks = [
+                asyncio.ensure_future(fetch("lookahead01", Priority.PREFETCH, 1)),
+                asyncio.ensure_future(fetch("otheradd001", Priority.ADD, 2)),
+            ]
+            await asyncio.sleep(0.01)
+            # /play of the track the lookahead is already fetching joins its download
+            tasks.append(asyncio.ensure_future(fetch("lookahead01", Priority.PLAY, 1)))
+            await asyncio.gather(busy, *tasks)
+            return done
+
+    done = asyncio.run(scenario())
+    order = [video_id for video_id, _ in done]
+    # Queued behind the other guild's /add, but the /play waiting on it lifts it ahead
+    assert order.index("lookahead01") < order.index("otheradd001")
+    assert order.count("lookahead01") == 2
+    assert StubYoutubeDL.downloads == 3
+
+def evict(h, metadata: dict):
+    h.downloader.toc.remove(metadata['file'])
+    os.remove(metadata['file'])
+
+def test_download_reuses_extracted_info_and_readd_skips_extraction(harness):
+    async def scenario():
+        async with harness() as h:
+            first = await h.downloader.resolve_track("YouTube", "reuse000001", link("reuse000001"))
+            # The download stage got the info dict from the extraction instead of resolving again
+            assert (StubYoutubeDL.extractions, StubYoutubeDL.downloads) == (1, 1)
+
+            evict(h, first)
+            again = await h.downloader.resolve_track("YouTube", "reuse000001", link("reuse000001"))
+            # Re-adding the evicted track downloads it again from the cached metadata
+            assert (StubYoutubeDL.extractions, StubYoutubeDL.downloads) == (1, 2)
+            assert again['title'] == first['title'] and os.path.exists(again['file'])
+
+            h.downloader.metadata.ttl = 0.05
+            await h.downloader.resolve_track("YouTube", "reuse000002", link("reuse000002"))
+            await asyncio.sleep(0.1)
+            evict(h, h.downloader.toc.get("data/music/YouTube/reuse000002.opus"))
+            await h.downloader.resolve_track("YouTube", "reuse000002", link("reuse000002"))
+            # Expired metadata is resolved again
+            assert (StubYoutubeDL.extractions, StubYoutubeDL.downloads) == (3, 4)
+
+    asyncio.run(scenario())
+
+class ExpiredUrlYoutubeDL(StubYoutubeDL):
+    """Fails the first download of info that didn't come from a fresh extraction, like an expired stream URL."""
+    fresh = set()
+
+    def extract_info(self, link: str, download: bool = False) -> dict:
+        self.fresh.add(link.rstrip("/")[-11:])
+        return super().extract_info(link, download)
+
+    def process_ie_result(self, info: dict, download: bool = True) -> dict:
+        if info['id'] not in self.fresh:
+            raise yt_dlp.utils.DownloadError("HTTP Error 403: Forbidden")
+        return super().process_ie_result(info, download)
+
+def test_stale_cached_metadata_is_extracted_again(harness):
+    async def scenario():
+        async with harness() as h:
+            h.downloader.ydl_class = ExpiredUrlYoutubeDL
+            first = await h.downloader.resolve_track("YouTube", "stale000001", link("stale000001"))
+            evict(h, first)
+            ExpiredUrlYoutubeDL.fresh.clear()
+            again = await h.downloader.resolve_track("YouTube", "stale000001", link("stale000001"))
+            assert os.path.exists(again['file'])
+            # One extraction the first time, one more once the cached info failed to download
+            assert (StubYoutubeDL.extractions, StubYoutubeDL.downloads) == (2, 2)
+
+    asyncio.run(scenario())
+
+class PlaylistYoutubeDL(StubYoutubeDL):
+    """Lists a playlist whose earlier tracks take longest to fetch, so downloads finish out of order."""
+    tracks = [f"batch{i:06d}" for i in range(12)]
+
+    def extract_info(self, link: str, download: bool = False) -> dict:
+        if "list=" in link:
+            return {'entries': [{'url': f"https://youtu.be/{t}"} for t in self.tracks]}
+        position = self.tracks.index(link.rstrip("/")[-11:])
+        time.sleep((len(self.tracks) - position) * 0.02)
+        return super().extract_info(link, download)
+
+def test_addbatch_queues_in_playlist_order_with_coalesced_edits(harness, monkeypatch):
+    monkeypatch.setattr(downloader_module, "PROGRESS_EDIT_INTERVAL", 0.1)
+    edits = []
+    async def edit(message, **kwargs):
+        edits.append(kwargs['embed'].title)
+    monkeypatch.setattr(FakeMessage, "edit", edit)
+
+    async def scenario():
+        async with harness(track_seconds=30.0, workers=3) as h:
+            h.downloader.ydl_class = PlaylistYoutubeDL
+            guild = h.guilds[0]
+            await h.invoke("addbatch", guild, links="https://www.youtube.com/playlist?list=PLbatchtest")
+            await h.settle()
+            assert h.errors == 0
+            queued = [entry['id'] for entry in h.player.queues[guild.id]]
+            assert queued == PlaylistYoutubeDL.tracks
+
+    asyncio.run(scenario())
+    # The first tracks are the slowest, so the rest land in bursts that share an edit
+    assert len(edits) < len(PlaylistYoutubeDL.tracks) // 2
+    assert edits[-1] == "Batch added"
+
+def test_shuffle_lookahead_fetches_only_the_drawn_track(harness):
+    async def scenario():
+        async with harness(track_seconds=30.0, download_ms=300) as h:
+            guild = h.guilds[0]
+            await h.downloader.resolve_track("YouTube", "cached00001", link("cached00001"))
+            await h.invoke("add", guild, link=link("cached00001"))
+            await h.invoke("shuffle", guild)
+            for i in range(6):
+                await h.invoke("add", guild, link=link(f"pending{i:04d}"))
+            await asyncio.sleep(0.05)
+
+            queue = h.player.queues[guild.id]
+            drawn = queue.peek_next()
+            assert set(h.downloader.pending_tasks) == {drawn['file']}
+            await h.invoke("skip", guild)
+            await h.settle()
+            assert queue.current is drawn
+            assert StubYoutubeDL.downloads == 3
+
+    asyncio.run(scenario())
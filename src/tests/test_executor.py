@@ -0,0 +1,52 @@
+import asyncio
+import threading
+from core.executor import DownloadExecutor, Job, Priority
+
+async def started(executor: DownloadExecutor, order: list, name: str, **kwargs):
+    await executor.run(order.append, name, **kwargs)
+
+def test_promoted_job_overtakes_jobs_queued_before_it():
+    async def scenario():
+        executor = DownloadExecutor(max_workers=1)
+        release = threading.Event()
+        order = []
+        busy = asyncio.ensure_future(executor.run(release.wait, 5))
+        await asyncio.sleep(0.01)
+
+        job = Job(Priority.PREFETCH, guild_id=1)
+        tasks = [
+            asyncio.ensure_future(started(executor, order, "add", priority=Priority.ADD, guild_id=2)),
+            asyncio.ensure_future(started(executor, order, "lookahead", job=job)),
+        ]
+        await asyncio.sleep(0.01)
+        assert executor.queue_stats()['prefetch']['waiting'] == 1
+
+        executor.promote(job, Priority.PLAY)
+        stats = executor.queue_stats()
+        # The stale PREFETCH entry is still in the heap but no longer counts as waiting
+        assert (stats['play']['waiting'], stats['add']['waiting'], stats['prefetch']['waiting']) == (1, 1, 0)
+
+        release.set()
+        await asyncio.gather(busy, *tasks)
+        assert order == ["lookahead", "add"]
+        assert executor.wait_stats[Priority.PLAY]['jobs'] == 1
+        assert executor.active == executor.active_speculative == 0
+        executor.shutdown()
+
+    asyncio.run(scenario())
+
+def test_promotion_never_demotes_and_applies_to_later_runs():
+    async def scenario():
+        executor = DownloadExecutor(max_workers=2)
+        job = Job(Priority.ADD)
+        executor.promote(job, Priority.PREFETCH)
+        assert job.priority == Priority.ADD
+
+        await executor.run(lambda: None, job=job)
+        executor.promote(job, Priority.PLAY)
+        await executor.run(lambda: None, job=job)
+        assert executor.wait_stats[Priority.ADD]['jobs'] == 1
+        assert executor.wait_stats[Priority.PLAY]['jobs'] == 1
+        executor.shutdown()
+
+    asyncio.run(scenario())
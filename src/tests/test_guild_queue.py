@@ -0,0 +1,163 @@
+import random
+import threading
+from collections import Counter
+import pytest
+from core.guild_queue import GuildQueue
+
+def track(n: int, files: int = 20) -> dict:
+    # Several entries share a file, like the same link queued twice
+    return {'id': n, 'file': f"data/music/YouTube/t{n % files:03d}.opus", 'title': f"Track {n}"}
+
+def check_invariants(queue: GuildQueue):
+    items = queue.snapshot()
+    assert None not in items
+    assert len(queue) == len(items)
+    assert queue.file_counts() == Counter(t['file'] for t in items)
+    assert queue.files() == {t['file'] for t in items}
+    assert queue.current is (items[0] if items else None)
+    assert len({id(t) for t in items}) == len(items)
+
+def random_op(queue: GuildQueue, rng: random.Random, new_track) -> str:
+    """Apply one random mutation. Positions may be stale when other threads mutate too."""
+    op = rng.choice(("append", "insert", "extend", "remove", "move", "skip", "advance", "peek", "toggle"))
+    n = len(queue)
+    try:
+        if op == "append":
+            queue.append(new_track())
+        elif op == "insert":
+            queue.insert(rng.randrange(0, n + 2), new_track())
+        elif op == "extend":
+            queue.extend([new_track() for _ in range(rng.randrange(1, 4))], unique=rng.random() < 0.5)
+        elif op == "remove" and n:
+            queue.remove(rng.randrange(-n, n))
+        elif op == "move" and n:
+            queue.move(rng.randrange(n), rng.randrange(n + 1))
+        elif op == "skip" and n:
+            queue.skip(rng.randrange(1, n + 1))
+        elif op == "advance":
+            queue.advance()
+        elif op == "peek":
+            queue.peek_next()
+        elif op == "toggle":
+            if rng.random() < 0.5:
+                queue.shuffle = not queue.shuffle
+            else:
+                queue.loop = not queue.loop
+    except IndexError:
+        # Another thread shrank the queue between len() and the call
+        pass
+    return op
+
+@pytest.mark.parametrize("seed", range(25))
+def test_matches_list_model(seed):
+    """Without shuffle, the queue behaves exactly like a plain list with pop(0) on advance."""
+    rng = random.Random(seed)
+    queue, model = GuildQueue(), []
+    loop = skip_pending = False
+    counter = iter(range(10**9))
+
+    for _ in range(400):
+        op = rng.choice(("append", "insert", "extend", "remove", "move", "skip", "advance", "loop"))
+        n = len(model)
+        if op == "append":
+            t = track(next(counter))
+            queue.append(t)
+            model.append(t)
+        elif op == "insert":
+            t, pos = track(next(counter)), rng.randrange(0, n + 2)
+            queue.insert(pos, t)
+            model.insert(min(pos, n), t)
+        elif op == "extend":
+            tracks = [track(next(counter)) for _ in range(rng.randrange(1, 4))]
+            unique = rng.random() < 0.5
+            added = queue.extend(tracks, unique=unique)
+            before = len(model)
+            for t in tracks:
+                if not unique or t['file'] not in {m['file'] for m in model}:
+                    model.append(t)
+            assert added == len(model) - before
+        elif op == "remove" and n:
+            pos = rng.randrange(-n, n)
+            assert queue.remove(pos) is model.pop(pos)
+        elif op == "move" and n:
+            src, dst = rng.randrange(n), rng.randrange(n + 1)
+            queue.move(src, dst)
+            t = model.pop(src)
+            model.insert(min(dst, len(model)), t)
+        elif op == "skip" and n:
+            k = rng.randrange(1, n + 1)
+            assert queue.skip(k) == k
+            del model[1:k]
+            skip_pending = True
+        elif op == "advance":
+            current = queue.advance()
+            if model and (not loop or skip_pending):
+                model.pop(0)
+            skip_pending = False
+            assert current is (model[0] if model else None)
+        elif op == "loop":
+            loop = queue.loop = not loop
+
+        assert queue.snapshot() == model
+        check_invariants(queue)
+
+@pytest.mark.parametrize("seed", range(10))
+def test_shuffle_draws_every_track_once(seed):
+    random.seed(seed)
+    tracks = [track(n, files=1000) for n in range(300)]
+    queue = GuildQueue(tracks, shuffle=True)
+    played = [queue.current]
+    for i in range(100):
+        queue.append(track(1000 + i, files=10**6))
+    while queue.advance() is not None:
+        played.append(queue.current)
+        check_invariants(queue)
+    assert sorted(t['id'] for t in played) == list(range(300)) + list(range(1000, 1100))
+
+@pytest.mark.parametrize("seed", range(5))
+def test_concurrent_mutators_keep_membership_consistent(seed):
+    queue = GuildQueue([track(n) for n in range(50)])
+    ids = iter(range(1000, 10**9))
+    ids_lock = threading.Lock()
+    start = threading.Barrier(8)
+    errors = []
+
+    def new_track():
+        with ids_lock:
+            return track(next(ids))
+
+    def mutate(worker: int):
+        rng = random.Random(seed * 100 + worker)
+        start.wait()
+        try:
+            for _ in range(2000):
+                random_op(queue, rng, new_track)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=mutate, args=(w,)) for w in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert not errors
+    check_invariants(queue)
+    # Drains completely, leaving no stale membership behind
+    queue.loop = False
+    while queue.advance() is not None:
+        pass
+    assert len(queue) == 0 and not queue.file_counts() and queue.current is None
+
+def test_slices_match_the_live_tracks():
+    # Advance past the compaction threshold too, so both a dead prefix and a compacted list are covered
+    for advanced in (0, 3, 70):
+        queue = GuildQueue(track(n) for n in range(advanced + 8))
+        for _ in range(advanced):
+            queue.advance()
+        items = queue.snapshot()
+        bounds = (None, -20, -3, -1, 0, 1, 2, 5, 20)
+        for start in bounds:
+            for stop in bounds:
+                for step in (None, 1, 2, -1, -3):
+                    assert queue[start:stop:step] == items[start:stop:step]
@@ -0,0 +1,69 @@
+import os
+import json
+import subprocess
+import pytest
+from bench.common import write_ogg_opus
+from core import ingest, ogg_index
+
+class FakeFfmpeg:
+    """Stands in for ffmpeg: answers the loudnorm pass with fixed levels and 'encodes' by writing a tagged file."""
+    def __init__(self, loudness: str, peak: str, encode_fails: bool = False):
+        self.levels = {'input_i': loudness, 'input_tp': peak}
+        self.encode_fails = encode_fails
+        self.calls = []
+
+    def __call__(self, args: list[str]) -> subprocess.CompletedProcess:
+        self.calls.append(args)
+        if "null" in args:
+            return subprocess.CompletedProcess(args, 0, "", "[Parsed_loudnorm]\n" + json.dumps(self.levels))
+        target = args[-1]
+        if self.encode_fails:
+            with open(target, "wb") as f:
+                f.write(b"half written")
+            return subprocess.CompletedProcess(args, 1, "", "Error while encoding")
+        write_ogg_opus(target, 2.0, comments=[args[args.index("-metadata") + 1]])
+        return subprocess.CompletedProcess(args, 0, "", "")
+
+    def gain_filter(self) -> str:
+        encode = self.calls[-1]
+        return encode[encode.index("-af") + 1]
+
+@pytest.fixture
+def track(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(ingest, "NORMALISE_AUDIO", True)
+    write_ogg_opus("track.opus", 1.0)
+    return "track.opus"
+
+def test_gain_is_capped_by_true_peak_and_the_file_is_tagged(track, monkeypatch):
+    ffmpeg = FakeFfmpeg(loudness="-30.0", peak="-8.0")
+    monkeypatch.setattr(ingest, "_run_ffmpeg", ffmpeg)
+
+    # -16 LUFS would need +14 dB, but the peak only leaves room for +7
+    assert ingest.ingest(track) == {'loudness': -30.0, 'gain': 7.0, 'size': os.path.getsize(track)}
+    assert ffmpeg.gain_filter() == "volume=7.0dB"
+    assert ingest.is_normalised(track)
+    assert not os.path.exists(track + ".ingest.opus")
+    assert len(ogg_index.load(track)) == 2
+
+    # Already tagged, so a second ingest leaves ffmpeg alone
+    assert ingest.ingest(track) == {}
+    assert len(ffmpeg.calls) == 2
+
+def test_silence_gets_no_gain(track, monkeypatch):
+    ffmpeg = FakeFfmpeg(loudness="-inf", peak="-inf")
+    monkeypatch.setattr(ingest, "_run_ffmpeg", ffmpeg)
+    assert ingest.normalise(track)['gain'] == 0.0
+    assert ffmpeg.gain_filter() == "volume=0.0dB"
+
+def test_failed_encode_keeps_the_original_file(track, monkeypatch):
+    with open(track, "rb") as f:
+        original = f.read()
+    monkeypatch.setattr(ingest, "_run_ffmpeg", FakeFfmpeg(loudness="-20.0", peak="-3.0", encode_fails=True))
+
+    assert ingest.normalise(track) == {}
+    with open(track, "rb") as f:
+        assert f.read() == original
+    assert not os.path.exists(track + ".ingest.opus")
+    assert not ingest.is_normalised(track)
+    assert ingest.running_encodes() == 0
@@ -0,0 +1,111 @@
+import os
+import socket
+import asyncio
+from types import SimpleNamespace
+import pytest
+import aiohttp
+from tests import fakes
+from tests.fakes import link
+from core import metrics
+from core.ogg import OggOpusSource
+
+def test_bytes_saved_by_cache_hits_are_exported_and_shown(harness, monkeypatch):
+    monkeypatch.setattr(metrics, "registry", metrics.Registry())
+
+    async def scenario():
+        async with harness() as h:
+            metrics.register_bot(h.client, h.player, h.downloader)
+            track = await h.downloader.resolve_track("YouTube", "saved000001", link("saved000001"))
+            for _ in range(3):
+                await h.downloader.resolve_track("YouTube", "saved000001", link("saved000001"))
+
+            assert h.downloader.toc.bytes_saved == 3 * track['size'] > 0
+            assert f"bot_toc_bytes_saved_total {3 * track['size']}" in metrics.registry.render().splitlines()
+            cache = next(field for field in h.music.stats_embed(h.guilds[0].id).fields if field.name == "Cache")
+            assert f"Downloads saved: {3 * track['size'] / 1048576:.1f} MiB" in cache.value
+
+    asyncio.run(scenario())
+
+def test_streamed_tracks_count_the_bytes_fetched_twice(harness, monkeypatch):
+    monkeypatch.setattr(metrics, "streamed_tracks", metrics.Counter("streamed", ""))
+    monkeypatch.setattr(metrics, "stream_refetch_bytes", metrics.Counter("refetch", ""))
+    # Hand out the local file as the stream URL and read it without ffmpeg, like the CDN stream would be
+    monkeypatch.setattr(fakes, "HAS_FFMPEG", True)
+
+    async def scenario():
+        async with harness(track_seconds=5.0, download_ms=200) as h:
+            monkeypatch.setattr(h.player, "_ffmpeg_source", lambda url, **kwargs: OggOpusSource(url))
+            guild = h.guilds[0]
+            await h.invoke("play", guild, link=link("stream00001"))
+            entry = h.player.queues[guild.id].current
+            assert entry['file'] == "data/music/YouTube/stream00001.opus"
+            await h.settle()
+            assert 'stream_url' not in entry
+            assert metrics.streamed_tracks.values == {(): 1}
+            assert metrics.stream_refetch_bytes.values == {(): entry['size']}
+            assert entry['size'] == os.path.getsize(h.media_path)
+
+    asyncio.run(scenario())
+
+def test_histogram_renders_cumulative_buckets_and_summarises():
+    histogram = metrics.Histogram("latency", "", ("command",), buckets=(0.1, 1, 10))
+    for value in (0.05, 0.05, 0.5, 5, 50):
+        histogram.observe(value, "play")
+
+    assert histogram.render()[2:] == [
+        'latency_bucket{command="play",le="0.1"} 2',
+        'latency_bucket{command="play",le="1"} 3',
+        'latency_bucket{command="play",le="10"} 4',
+        'latency_bucket{command="play",le="+Inf"} 5',
+        'latency_sum{command="play"} 55.6',
+        'latency_count{command="play"} 5',
+    ]
+    summary = histogram.summary("play")
+    assert summary['count'] == 5 and summary['mean'] == pytest.approx(11.12)
+    # The third of five values falls in the (0.1, 1] bucket, half way into it
+    assert summary['p50'] == pytest.approx(0.55)
+    assert histogram.summary("skip") is None
+
+def test_instrumented_command_is_timed_and_counts_errors(monkeypatch):
+    monkeypatch.setattr(metrics, "command_latency", metrics.Histogram("latency", ""))
+    monkeypatch.setattr(metrics, "command_errors", metrics.Counter("errors", ""))
+
+    async def callback(interaction, fail=False):
+        if fail:
+            raise RuntimeError("boom")
+        return interaction
+    command = SimpleNamespace(_callback=callback, qualified_name="play")
+    metrics.instrument_command(command)
+
+    assert asyncio.run(command._callback("interaction")) == "interaction"
+    with pytest.raises(RuntimeError):
+        asyncio.run(command._callback("interaction", fail=True))
+    assert metrics.command_latency.summary("play")['count'] == 2
+    assert metrics.command_errors.values == {("play",): 1}
+
+def test_metrics_endpoint_serves_the_registry_and_skips_broken_gauges(monkeypatch):
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, "registry", registry)
+    registry.counter("bot_plays_total", "Plays").inc(amount=3)
+    registry.gauge("bot_broken", "Raises on scrape", lambda: 1 / 0)
+    registry.gauge("bot_queue_depth", "Queued", lambda: {("1",): 4}, ("guild",))
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    async def scrape():
+        runner = await metrics.start_server(port, "127.0.0.1")
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                    return response.status, await response.text()
+        finally:
+            await runner.cleanup()
+
+    status, text = asyncio.run(scrape())
+    lines = text.splitlines()
+    assert status == 200
+    assert "bot_plays_total 3" in lines
+    assert 'bot_queue_depth{guild="1"} 4' in lines
+    assert not any(line.startswith("bot_broken") for line in lines)
+    assert asyncio.run(metrics.start_server(0)) is None
@@ -0,0 +1,34 @@
+import pytest
+from bench.common import write_ogg_opus
+from core.ogg import opus_duration, packet_samples, OggError
+
+def test_duration_comes_from_the_last_granule_minus_pre_skip(tmp_path):
+    path = tmp_path / "track.opus"
+    for seconds in (0.02, 1.0, 61.5):
+        write_ogg_opus(path, seconds)
+        assert opus_duration(path) == pytest.approx(seconds)
+
+def test_duration_of_a_cut_off_file_uses_the_last_complete_page(tmp_path):
+    path = tmp_path / "track.opus"
+    write_ogg_opus(path, 3.0)
+    data = path.read_bytes()
+    last_page = data.rfind(b"OggS")
+    # Cut inside the last page's header, like a download that stopped early
+    path.write_bytes(data[:last_page + 10])
+    # Pages hold 50 packets of 20 ms, so the previous page ends a second earlier
+    assert opus_duration(path) == pytest.approx(2.0)
+
+def test_duration_without_opus_head_raises(tmp_path):
+    path = tmp_path / "track.opus"
+    write_ogg_opus(path, 1.0)
+    data = bytearray(path.read_bytes())
+    data[data.find(b"OpusHead")] ^= 0xFF
+    path.write_bytes(bytes(data))
+    with pytest.raises(OggError):
+        opus_duration(path)
+
+def test_packet_samples_reads_frame_size_and_count_from_the_toc():
+    assert packet_samples(bytes([0xFC])) == 960 # CELT 20 ms, one frame
+    assert packet_samples(bytes([0xFD])) == 1920 # two frames
+    assert packet_samples(bytes([0x1B, 0x03])) == 3 * 2880 # SILK 60 ms, code 3 with three frames
+    assert packet_samples(bytes([0x60])) == 480 # Hybrid 10 ms
@@ -0,0 +1,95 @@
+import os
+import asyncio
+from tests.fakes import link
+from bench.common import write_ogg_opus, PACKETS_PER_PAGE
+from core import ogg_index
+from core.ogg import OggOpusSource, iter_pages, DISCORD_FRAME_SAMPLES
+
+PRE_SKIP = 312
+
+def make_track(tmp_path, monkeypatch, seconds: float = 10.0) -> str:
+    monkeypatch.chdir(tmp_path)
+    write_ogg_opus("track.opus", seconds)
+    return "track.opus"
+
+def audio_pages(path: str) -> list[int]:
+    with open(path, "rb") as f:
+        return [offset for offset, *_ in iter_pages(f.read())][2:]
+
+def test_index_holds_every_audio_page_by_its_first_granule(tmp_path, monkeypatch):
+    path = make_track(tmp_path, monkeypatch, seconds=10.0)
+    index = ogg_index.scan(path)
+
+    offsets = audio_pages(path)
+    assert index.offsets == offsets
+    assert index.base == PRE_SKIP
+    assert index.granules == [PRE_SKIP + i * PACKETS_PER_PAGE * DISCORD_FRAME_SAMPLES for i in range(len(offsets))]
+
+def test_find_returns_the_page_at_or_before_the_packet(tmp_path, monkeypatch):
+    path = make_track(tmp_path, monkeypatch, seconds=10.0)
+    index = ogg_index.scan(path)
+    offsets = index.offsets
+
+    assert index.find(0) == (offsets[0], 0)
+    assert index.find(PACKETS_PER_PAGE - 1) == (offsets[0], 0)
+    assert index.find(PACKETS_PER_PAGE) == (offsets[1], PACKETS_PER_PAGE)
+    assert index.find(3 * PACKETS_PER_PAGE + 7) == (offsets[3], 3 * PACKETS_PER_PAGE)
+    # Past the end, the last page is still the closest one to start from
+    assert index.find(10**6) == (offsets[-1], (len(offsets) - 1) * PACKETS_PER_PAGE)
+    assert ogg_index.PageIndex([], []).find(5) is None
+
+def test_seeking_through_a_page_matches_skipping_packets(tmp_path, monkeypatch):
+    path = make_track(tmp_path, monkeypatch, seconds=10.0)
+    index = ogg_index.scan(path)
+    start = 2 * PACKETS_PER_PAGE + 13
+
+    def remaining(source):
+        count = 0
+        while source.read():
+            count += 1
+        source.cleanup()
+        return count
+
+    seeked = OggOpusSource(path, start=start, page=index.find(start))
+    skipped = OggOpusSource(path, start=start)
+    assert seeked.packets_read == skipped.packets_read == start
+    assert remaining(seeked) == remaining(skipped) == 500 - start
+
+def test_load_reads_the_sidecar_and_rebuilds_it_when_the_file_changes(tmp_path, monkeypatch):
+    path = make_track(tmp_path, monkeypatch, seconds=5.0)
+    built = ogg_index.build(path)
+    assert os.path.exists(ogg_index.index_path(path))
+
+    loaded = ogg_index.load(path)
+    assert (loaded.granules, loaded.offsets, loaded.base) == (built.granules, built.offsets, built.base)
+
+    write_ogg_opus(path, 8.0)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert len(ogg_index.load(path)) == len(audio_pages(path)) > len(built)
+
+    ogg_index.remove(path)
+    assert not os.path.exists(ogg_index.index_path(path))
+    assert ogg_index.load("missing.opus") is None
+
+def test_seek_starts_from_the_indexed_page(harness, monkeypatch):
+    skipped = []
+    skip = OggOpusSource.skip
+    def counted_skip(self, count):
+        skipped.append(count)
+        return skip(self, count)
+    monkeypatch.setattr(OggOpusSource, "skip", counted_skip)
+
+    async def scenario():
+        async with harness(track_seconds=30.0) as h:
+            guild = h.guilds[0]
+            await h.downloader.resolve_track("YouTube", "seek0000001", link("seek0000001"))
+            await h.invoke("play", guild, link=link("seek0000001"))
+            entry = h.player.seek(guild.voice_client, 20.5)
+            assert entry is h.player.queues[guild.id].current
+            assert h.player.position(guild.voice_client) >= 20.5
+            await h.invoke("stop", guild)
+
+    asyncio.run(scenario())
+    # The index found the page 20 s in, only the packets inside that page were read past
+    assert skipped == [1025 % PACKETS_PER_PAGE]
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+from tests.fakes import link
+from core.executor import Priority
+
+async def wait_for(condition, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+async def prefetch_idle(h):
+    """Wait until the prefetch pool has finished everything submitted so far."""
+    workers = h.player.prefetch_pool._max_workers
+    barrier = threading.Barrier(workers + 1)
+    for _ in range(workers):
+        h.player.prefetch_pool.submit(barrier.wait, 5)
+    await asyncio.to_thread(barrier.wait, 5)
+
+async def playing_with_pending(h, guild, *pending):
+    """Start a cached track on guild and queue the pending links behind it."""
+    await h.downloader.resolve_track("YouTube", "cached00001", link("cached00001"))
+    await h.invoke("add", guild, link=link("cached00001"))
+    for video_id in pending:
+        await h.invoke("add", guild, link=link(video_id))
+    queue = h.player.queues[guild.id]
+    assert [entry['id'] for entry in queue] == ["cached00001", *pending]
+    assert all(entry.get('pending') for entry in queue[1:])
+    return queue
+
+def test_skip_past_a_downloading_track_plays_the_next_one(harness):
+    async def scenario():
+        async with harness(track_seconds=30.0, download_ms=300) as h:
+            guild = h.guilds[0]
+            queue = await playing_with_pending(h, guild, "pending0001", "pending0002")
+
+            await h.invoke("skip", guild)
+            await wait_for(lambda: queue.current['id'] == "pending0001")
+            # Nothing is playing while it downloads, so this skip has to move the queue itself
+            await h.invoke("skip", guild)
+            assert queue.current['id'] == "pending0002"
+
+            await h.settle()
+            await wait_for(lambda: h.tracks_started == 2)
+            assert guild.voice_client.source is not None
+            assert queue.current['id'] == "pending0002" and not queue.current.get('pending')
+            assert h.errors == 0
+
+    asyncio.run(scenario())
+
+def test_skip_all_while_downloading_lets_the_next_add_play(harness):
+    async def scenario():
+        async with harness(track_seconds=30.0, download_ms=300) as h:
+            guild = h.guilds[0]
+            queue = await playing_with_pending(h, guild, "pending0001", "pending0002")
+
+            await h.invoke("skip", guild)
+            await wait_for(lambda: queue.current['id'] == "pending0001")
+            await h.invoke("skip", guild, n_skips=0)
+            assert guild.id not in h.player.queues
+
+            await h.invoke("add", guild, link=link("cached00001"))
+            await h.settle()
+            await wait_for(lambda: h.tracks_started == 2)
+            assert h.player.queues[guild.id].current['id'] == "cached00001"
+            assert h.errors == 0
+
+    asyncio.run(scenario())
+
+def test_prefetch_follows_the_shuffle_draw(harness):
+    async def scenario():
+        async with harness(track_seconds=30.0) as h:
+            guild = h.guilds[0]
+            ids = [f"cached{i:05d}" for i in range(20)]
+            for video_id in ids:
+                await h.downloader.resolve_track("YouTube", video_id, link(video_id))
+                await h.invoke("add", guild, link=link(video_id))
+            queue = h.player.queues[guild.id]
+            await prefetch_idle(h)
+            assert h.player.prefetched[guild.id][0] is queue[1]
+
+            await h.invoke("shuffle", guild)
+            drawn = queue.peek_next()
+            await wait_for(lambda: h.player.prefetched.get(guild.id, (None,))[0] is drawn)
+
+            await h.invoke("skip", guild)
+            await wait_for(lambda: queue.current is drawn)
+            assert h.errors == 0
+
+    asyncio.run(scenario())
+
+def test_lookahead_download_is_promoted_when_its_entry_comes_up(harness):
+    async def scenario():
+        async with harness(track_seconds=30.0, download_ms=300, workers=1) as h:
+            guild = h.guilds[0]
+            queue = await playing_with_pending(h, guild, "pending0001", "pending0002")
+            await wait_for(lambda: len(h.downloader.pending_jobs) == 2)
+            jobs = [h.downloader.pending_jobs[entry['file']] for entry in queue[1:]]
+            assert [job.priority for job in jobs] == [Priority.ADD, Priority.PREFETCH]
+
+            await h.invoke("skip", guild)
+            await wait_for(lambda: queue.current['id'] == "pending0001")
+            await h.invoke("skip", guild)
+            assert queue.current['id'] == "pending0002"
+            await wait_for(lambda: jobs[1].priority == Priority.PLAY)
+            assert h.downloader.executor.queue_stats()['prefetch']['waiting'] == 0
+
+            await h.settle()
+            await wait_for(lambda: h.tracks_started == 2)
+            assert h.errors == 0
+
+    asyncio.run(scenario())
+
+def test_next_source_is_opened_outside_the_play_lock(harness, monkeypatch):
+    async def scenario():
+        async with harness(track_seconds=1.0) as h:
+            guild = h.guilds[0]
+            ids = ["cached00001", "cached00002", "cached00003"]
+            for video_id in ids:
+                await h.downloader.resolve_track("YouTube", video_id, link(video_id))
+            # Without prefetching, the audio thread opens each next track itself
+            monkeypatch.setattr(h.player, "schedule_prefetch", lambda conn: None)
+            opening, release = threading.Event(), threading.Event()
+            create_source = h.player.create_source
+            def slow_create_source(entry, start=0):
+                if entry['id'] == ids[1]:
+                    opening.set()
+                    release.wait(5)
+                return create_source(entry, start)
+            monkeypatch.setattr(h.player, "create_source", slow_create_source)
+
+            for video_id in ids:
+                await h.invoke("add", guild, link=link(video_id))
+            queue = h.player.queues[guild.id]
+            await asyncio.to_thread(opening.wait, 5)
+            assert queue.current['id'] == ids[1]
+
+            def lock_is_free():
+                if not h.player.play_lock.acquire(timeout=1):
+                    return False
+                h.player.play_lock.release()
+                return True
+            assert await asyncio.to_thread(lock_is_free)
+
+            # Skipped while it was being opened: the third track starts and the second is dropped
+            assert h.player.skip(guild.voice_client, 1) == 1
+            assert queue.current['id'] == ids[2]
+            release.set()
+            await wait_for(lambda: h.tracks_started == 2)
+            await asyncio.sleep(0.1)
+            assert queue.current['id'] == ids[2]
+            assert guild.voice_client.is_playing()
+            assert h.errors == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,49 @@
+import os
+import threading
+from bench.common import write_ogg_opus
+from core.playlists import PlaylistLibrary
+
+def make_library(tmp_path, monkeypatch, tracks=1) -> PlaylistLibrary:
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data/playlists/mix")
+    for i in range(tracks):
+        write_ogg_opus(f"data/playlists/mix/track {i}.opus", 1.0)
+    return PlaylistLibrary()
+
+def test_stale_manifest_is_rebuilt_in_the_background(tmp_path, monkeypatch):
+    library = make_library(tmp_path, monkeypatch)
+    library.schedule("mix").result()
+    assert len(library.cached("mix")['tracks']) == 1
+
+    write_ogg_opus("data/playlists/mix/track 1.opus", 1.0)
+    mtime = os.stat("data/playlists/mix").st_mtime_ns
+    os.utime("data/playlists/mix", ns=(mtime + 10**9, mtime + 10**9))
+
+    # Blocks the rebuild so the lookups below all see it in flight
+    release = threading.Event()
+    builds = []
+    build = library.build
+    def slow_build(name):
+        builds.append(name)
+        release.wait(5)
+        return build(name)
+    monkeypatch.setattr(library, "build", slow_build)
+
+    assert library.cached("mix") is None
+    pending = library.building["mix"]
+    for _ in range(10):
+        assert library.cached("mix") is None
+    assert library.schedule("mix") is pending
+
+    release.set()
+    pending.result(5)
+    assert builds == ["mix"]
+    assert len(library.cached("mix")['tracks']) == 2
+    assert "mix" not in library.building
+    library.pool.shutdown()
+
+def test_missing_folder_is_not_rebuilt(tmp_path, monkeypatch):
+    library = make_library(tmp_path, monkeypatch)
+    assert library.cached("gone") is None
+    assert not library.building
+    library.pool.shutdown()
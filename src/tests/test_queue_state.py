@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import asyncio
+from types import SimpleNamespace
+from core.queue_state import QueueSnapshots, RESUME_MAX_AGE
+from tests.fakes import FakeGuild, LoadClient, link
+
+STATE_DIR = "data/state"
+
+def listening(guild):
+    guild.channel.members = [SimpleNamespace(bot=False)]
+
+async def queue_tracks(h, guild, *ids):
+    for video_id in ids:
+        await h.downloader.resolve_track("YouTube", video_id, link(video_id))
+        await h.invoke("add", guild, link=link(video_id))
+
+async def stop_all(h, *guilds):
+    """What a restart leaves behind: no queues and no voice connections, only the snapshots."""
+    for guild in guilds:
+        h.player.queues.pop(guild.id, None)
+        conn = guild.voice_client
+        if conn is not None:
+            await conn.disconnect()
+            await asyncio.to_thread(conn._thread.join, 5)
+
+def test_restore_leaves_snapshots_of_guilds_served_by_another_process(harness):
+    async def scenario():
+        async with harness(track_seconds=30.0) as h:
+            ours = h.guilds[0]
+            # A second bot process with its own client, sharing the player code and the state dir
+            other_client = LoadClient(h.client.loop)
+            theirs = FakeGuild(h, 5000)
+            other_client.guilds.append(theirs)
+            for guild in (ours, theirs):
+                listening(guild)
+            await queue_tracks(h, ours, "ours0000001", "ours0000002")
+            await queue_tracks(h, theirs, "theirs00001")
+
+            await QueueSnapshots(h.client, h.player, STATE_DIR).save_all()
+            await QueueSnapshots(other_client, h.player, STATE_DIR).save_all()
+            assert sorted(os.listdir(STATE_DIR)) == [f"{ours.id}.json", f"{theirs.id}.json"]
+            await stop_all(h, ours, theirs)
+
+            await snapshots_of(h).restore_all()
+            assert [entry['id'] for entry in h.player.queues[ours.id]] == ["ours0000001", "ours0000002"]
+            assert theirs.id not in h.player.queues
+            assert os.path.exists(os.path.join(STATE_DIR, f"{theirs.id}.json"))
+
+            await QueueSnapshots(other_client, h.player, STATE_DIR).restore_all()
+            assert [entry['id'] for entry in h.player.queues[theirs.id]] == ["theirs00001"]
+            await stop_all(h, theirs)
+
+    asyncio.run(scenario())
+
+def snapshots_of(h) -> QueueSnapshots:
+    return QueueSnapshots(h.client, h.player, STATE_DIR)
+
+def test_snapshot_round_trips_through_the_two_line_format(harness):
+    async def scenario():
+        async with harness(track_seconds=30.0) as h:
+            guild = h.guilds[0]
+            await queue_tracks(h, guild, "track000001", "track000002", "track000003")
+            queue = h.player.queues[guild.id]
+            queue.loop, queue.loop_start = True, 4.5
+            snapshots = snapshots_of(h)
+            await snapshots.save_all()
+
+            with open(snapshots.path(guild.id), encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            assert len(lines) == 2
+            header, refs = snapshots.read(guild.id)
+            assert header['channel'] == guild.channel.id
+            assert (header['loop'], header['shuffle'], header['loop_start']) == (True, False, 4.5)
+            assert refs == [QueueSnapshots.track_ref(entry) for entry in queue]
+            assert [snapshots.entry_from_ref(ref) for ref in refs] == queue.snapshot()
+
+            # Nothing changed, so nothing is rewritten
+            mtime = os.stat(snapshots.path(guild.id)).st_mtime_ns
+            await snapshots.save_all()
+            assert os.stat(snapshots.path(guild.id)).st_mtime_ns == mtime
+
+    asyncio.run(scenario())
+
+def test_failed_write_keeps_the_previous_snapshot_and_retries(harness, monkeypatch):
+    async def scenario():
+        async with harness(track_seconds=30.0) as h:
+            guild = h.guilds[0]
+            await queue_tracks(h, guild, "track000001", "track000002")
+            snapshots = snapshots_of(h)
+            await snapshots.save_all()
+            before = snapshots.read(guild.id)
+
+            def crash(src, dst):
+                raise OSError("disk full")
+            await queue_tracks(h, guild, "track000003")
+            with monkeypatch.context() as patch:
+                patch.setattr(os, "replace", crash)
+                await snapshots.save_all()
+            assert snapshots.read(guild.id) == before
+            assert guild.id not in snapshots.written
+
+            await snapshots.save_all()
+            assert [ref[3] for ref in snapshots.read(guild.id)[1]] == ["track000001", "track000002", "track000003"]
+            assert os.listdir(STATE_DIR) == [f"{guild.id}.json"]
+
+    asyncio.run(scenario())
+
+def test_expired_and_corrupt_snapshots_are_discarded(harness, monkeypatch):
+    async def scenario():
+        async with harness(guilds=3, track_seconds=30.0) as h:
+            for guild in h.guilds:
+                listening(guild)
+                await queue_tracks(h, guild, f"track{guild.id:06d}")
+            snapshots = snapshots_of(h)
+            await snapshots.save_all()
+            await stop_all(h, *h.guilds)
+            fresh, expired, corrupt = h.guilds
+
+            with open(snapshots.path(expired.id), encoding="utf-8") as f:
+                header, tracks = f.read().splitlines()
+            header = {**json.loads(header), 'saved': time.time() - RESUME_MAX_AGE - 60}
+            with open(snapshots.path(expired.id), "w", encoding="utf-8") as f:
+                f.write(json.dumps(header) + "\n" + tracks + "\n")
+            # Cut off in the middle of the track list, like a write that never finished
+            with open(snapshots.path(corrupt.id), "r+", encoding="utf-8") as f:
+                f.truncate(len(f.readline()) + 5)
+            assert snapshots.read(expired.id) is None
+            assert snapshots.read(corrupt.id) is None
+
+            await snapshots_of(h).restore_all()
+            assert list(h.player.queues) == [fresh.id]
+            assert os.listdir(STATE_DIR) == [f"{fresh.id}.json"]
+
+    asyncio.run(scenario())
+
+def test_restore_keeps_queue_order_position_and_flags(harness):
+    async def scenario():
+        async with harness(track_seconds=30.0) as h:
+            guild = h.guilds[0]
+            listening(guild)
+            ids = ["track000001", "track000002", "track000003", "track000004"]
+            await queue_tracks(h, guild, *ids)
+            queue = h.player.queues[guild.id]
+            queue.loop = True
+            await asyncio.sleep(0.3)
+            snapshots = snapshots_of(h)
+            await snapshots.save_all()
+            position = snapshots.read(guild.id)[0]['position']
+            assert position > 0
+            await stop_all(h, guild)
+
+            # One track was evicted while the bot was down. Cached entries carry no link to fetch it
+            # again, so it is dropped and the rest keep their order
+            evicted = h.downloader.toc.get(f"data/music/YouTube/{ids[2]}.opus")
+            h.downloader.toc.remove(evicted['file'])
+            os.remove(evicted['file'])
+
+            await snapshots_of(h).restore_all()
+            restored = h.player.queues[guild.id]
+            assert [entry['id'] for entry in restored] == ids[:2] + ids[3:]
+            assert restored.loop and not restored.shuffle
+            assert h.player.position(guild.voice_client) >= position
+            await stop_all(h, guild)
+
+    asyncio.run(scenario())
@@ -0,0 +1,75 @@
+import os
+import time
+import asyncio
+import pytest
+import yt_dlp
+from tests.fakes import StubYoutubeDL, link
+from core.reconciler import reconcile, clear_staging, disk_files, STAGING_DIR, STAGING_MAX_AGE
+from core.track_store import TrackStore
+
+def record(n: int) -> dict:
+    file = f"data/music/YouTube/track{n:06d}.opus"
+    with open(file, "wb") as f:
+        f.write(bytes(1000))
+    return {'title': f"Track {n}", 'id': f"track{n:06d}", 'file': file, 'service': "YouTube", 'duration': 1, 'timestamp': n}
+
+def age(path: str, seconds: float):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+def test_orphans_on_disk_and_in_the_store_are_repaired(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data/music/YouTube")
+    toc = TrackStore()
+    kept, missing = record(1), record(2)
+    toc.add(kept)
+    toc.add(missing)
+    os.remove(missing['file'])
+    orphan = record(3)['file']
+
+    result = reconcile(toc)
+    assert (result['orphans_removed'], result['missing_dropped']) == (1, 1)
+    assert disk_files() == {kept['file']}
+    assert set(toc.by_file) == {kept['file']}
+    assert not os.path.exists(orphan)
+
+    # A second pass has nothing left to repair
+    result = reconcile(toc)
+    assert (result['orphans_removed'], result['missing_dropped']) == (0, 0)
+    toc.close()
+
+def test_stale_staging_entries_are_cleared(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name in ("YouTube-dead-1", "YouTube-live-2"):
+        os.makedirs(os.path.join(STAGING_DIR, name))
+        with open(os.path.join(STAGING_DIR, name, "track.opus"), "wb") as f:
+            f.write(bytes(100))
+    with open(os.path.join(STAGING_DIR, "stray.part"), "wb") as f:
+        f.write(bytes(100))
+    age(os.path.join(STAGING_DIR, "YouTube-dead-1"), STAGING_MAX_AGE + 60)
+    age(os.path.join(STAGING_DIR, "stray.part"), STAGING_MAX_AGE + 60)
+
+    assert clear_staging() == 2
+    assert os.listdir(STAGING_DIR) == ["YouTube-live-2"]
+    assert clear_staging("data/no-such-dir") == 0
+
+def test_failed_download_leaves_nothing_visible(harness, monkeypatch):
+    def partial_download(self, info, download=True):
+        # Writes half a file into the staging directory, then fails like a dropped connection
+        target = self.opts['outtmpl'].replace("%(ext)s", "opus")
+        with open(target, "wb") as f:
+            f.write(bytes(500))
+        raise yt_dlp.utils.DownloadError("connection reset")
+    monkeypatch.setattr(StubYoutubeDL, "process_ie_result", partial_download)
+
+    async def scenario():
+        async with harness() as h:
+            with pytest.raises(yt_dlp.utils.DownloadError):
+                await h.downloader.fetch_track("YouTube", "broken00001", link("broken00001"))
+            assert len(h.downloader.toc) == 0
+            assert not h.downloader.inflight
+
+    asyncio.run(scenario())
+    assert disk_files() == set()
+    assert os.listdir(STAGING_DIR) == []
+    assert os.listdir("data/locks") == []
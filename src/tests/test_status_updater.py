@@ -0,0 +1,139 @@
+import time
+import asyncio
+import threading
+from types import SimpleNamespace
+import discord
+import pytest
+from tests.fakes import link
+from core import status_updater
+from core.status_updater import StatusUpdater
+
+DEBOUNCE = 0.05
+MIN_INTERVAL = 0.2
+
+@pytest.fixture(autouse=True)
+def short_windows(monkeypatch):
+    monkeypatch.setattr(status_updater, "STATUS_DEBOUNCE", DEBOUNCE)
+    monkeypatch.setattr(status_updater, "STATUS_MIN_INTERVAL", MIN_INTERVAL)
+
+class CountingChannel:
+    def __init__(self, channel_id: int = 10, rate_limited: int = 0):
+        self.id = channel_id
+        self.status = None
+        self.edits = []
+        self.rate_limited = rate_limited
+
+    async def edit(self, status=None):
+        if self.rate_limited:
+            self.rate_limited -= 1
+            raise discord.RateLimited(MIN_INTERVAL)
+        self.edits.append((time.monotonic(), status))
+        self.status = status
+
+def updater() -> StatusUpdater:
+    return StatusUpdater(SimpleNamespace(loop=asyncio.get_running_loop()))
+
+async def drain(status: StatusUpdater):
+    while status.workers:
+        await asyncio.sleep(0.01)
+
+def test_skip_storm_from_the_audio_thread_is_coalesced():
+    async def scenario():
+        status = updater()
+        channel = CountingChannel()
+
+        def storm():
+            # Track changes arrive on the audio thread, one every 10 ms for half a second
+            for i in range(50):
+                status.update(channel, f"track {i}")
+                time.sleep(0.01)
+
+        start = time.monotonic()
+        await asyncio.to_thread(storm)
+        await drain(status)
+        elapsed = time.monotonic() - start
+
+        assert channel.status == "track 49"
+        assert len(channel.edits) <= elapsed / MIN_INTERVAL + 2
+        assert status.edits == len(channel.edits)
+        assert status.coalesced >= 50 - 2 * len(channel.edits)
+        gaps = [b[0] - a[0] for a, b in zip(channel.edits, channel.edits[1:])]
+        assert all(gap >= MIN_INTERVAL * 0.9 for gap in gaps)
+
+    asyncio.run(scenario())
+
+def test_unchanged_status_is_not_sent_again():
+    async def scenario():
+        status = updater()
+        channel = CountingChannel()
+        status.update(channel, "same")
+        await drain(status)
+        for _ in range(3):
+            status.update(channel, "same")
+            await drain(status)
+        assert len(channel.edits) == 1
+
+        # A change that is reverted within the debounce window is never shown
+        status.update(channel, "other")
+        status.update(channel, "same")
+        await drain(status)
+        assert len(channel.edits) == 1
+
+    asyncio.run(scenario())
+
+def test_rate_limited_edit_is_retried_with_the_latest_status():
+    async def scenario():
+        status = updater()
+        channel = CountingChannel(rate_limited=1)
+        status.update(channel, "first")
+        await asyncio.sleep(DEBOUNCE * 2)
+        status.update(channel, "second")
+        await drain(status)
+        assert [s for _, s in channel.edits] == ["second"]
+
+    asyncio.run(scenario())
+
+def test_guild_skip_storm_sends_few_status_edits(harness):
+    async def scenario():
+        async with harness(track_seconds=30.0) as h:
+            guild = h.guilds[0]
+            ids = [f"status{i:05d}" for i in range(30)]
+            for video_id in ids:
+                await h.downloader.fetch_track("YouTube", video_id, link(video_id))
+            await h.invoke("play", guild, link=link(ids[0]))
+            for video_id in ids[1:]:
+                await h.invoke("add", guild, link=link(video_id))
+            await h.settle()
+
+            edits_before = h.status_edits
+            start = time.monotonic()
+            for _ in ids[1:]:
+                await h.invoke("skip", guild)
+                await asyncio.sleep(0.01)
+            await h.settle()
+            elapsed = time.monotonic() - start
+
+            current = h.player.queues[guild.id].current
+            assert guild.channel.status == StatusUpdater.track_status(current)
+            assert h.status_edits - edits_before <= elapsed / MIN_INTERVAL + 2
+            assert h.errors == 0
+
+    asyncio.run(scenario())
+
+def test_updates_from_several_threads_keep_one_worker_per_channel():
+    async def scenario():
+        status = updater()
+        channels = [CountingChannel(channel_id) for channel_id in range(4)]
+        start = threading.Barrier(4)
+
+        def hammer(channel):
+            start.wait()
+            for i in range(20):
+                status.update(channel, f"{channel.id}:{i}")
+
+        await asyncio.gather(*(asyncio.to_thread(hammer, channel) for channel in channels))
+        assert len(status.workers) <= len(channels)
+        await drain(status)
+        assert [channel.status for channel in channels] == [f"{c.id}:19" for c in channels]
+
+    asyncio.run(scenario())
@@ -0,0 +1,94 @@
+import os
+import time
+import sqlite3
+import asyncio
+import pytest
+from tests.fakes import link
+from core.file_lock import FileLock, fcntl
+from core.track_store import TrackStore
+
+def record(n: int) -> dict:
+    file = f"data/music/YouTube/track{n:06d}.opus"
+    with open(file, "wb") as f:
+        f.write(bytes(1000))
+    return {'title': f"Track {n}", 'id': f"track{n:06d}", 'file': file, 'service': "YouTube", 'duration': 1, 'timestamp': n}
+
+def two_stores(tmp_path, monkeypatch, tracks: int) -> tuple[TrackStore, TrackStore]:
+    """Two stores on one database, standing in for two bot processes."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data/music/YouTube")
+    first = TrackStore()
+    for n in range(tracks):
+        first.add(record(n))
+    return first, TrackStore()
+
+def test_touch_pins_before_another_process_evicts(tmp_path, monkeypatch):
+    first, second = two_stores(tmp_path, monkeypatch, 4)
+    oldest = "data/music/YouTube/track000000.opus"
+    # No heartbeat yet, the touch alone has to protect it
+    assert first.touch(oldest, int(time.time()), pin=True) is not None
+    # Touching moved it to the back of the LRU order, so evict everything that way
+    removed = second.evict(0)
+    assert oldest not in {r['file'] for r in removed}
+    assert len(removed) == 3
+
+    # Once the lease lapses and a heartbeat finds it in no queue, it is evictable again
+    first.leases[oldest] = 0
+    first.heartbeat({})
+    assert [r['file'] for r in second.evict(0)] == [oldest]
+    # And the first process sees it gone instead of returning a stale record
+    assert first.touch(oldest, int(time.time()), pin=True) is None
+    first.close()
+    second.close()
+
+def test_heartbeat_keeps_leased_files_pinned(tmp_path, monkeypatch):
+    first, second = two_stores(tmp_path, monkeypatch, 3)
+    queued, leased = "data/music/YouTube/track000001.opus", "data/music/YouTube/track000002.opus"
+    first.touch(leased, 10**10, pin=True)
+    first.heartbeat({queued: 1})
+    assert first.pins_written == {queued: 1, leased: 1}
+    assert second.foreign_pins() == {queued, leased}
+    first.close()
+    assert second.foreign_pins() == set()
+    second.close()
+
+def test_cache_hit_waits_for_the_write_lock_off_the_loop(harness):
+    async def scenario():
+        async with harness() as h:
+            await h.downloader.resolve_track("YouTube", "locked00001", link("locked00001"))
+            # Another process holding SQLite's write lock
+            other = sqlite3.connect("data/toc.db", isolation_level=None)
+            other.execute("BEGIN IMMEDIATE")
+            hit = asyncio.create_task(h.downloader.resolve_track("YouTube", "locked00001", link("locked00001")))
+
+            lags = []
+            for _ in range(30):
+                start = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lags.append(time.perf_counter() - start - 0.01)
+            assert not hit.done()
+            other.execute("COMMIT")
+            other.close()
+            assert (await hit)['id'] == "locked00001"
+            assert max(lags) < 0.1
+
+    asyncio.run(scenario())
+
+@pytest.mark.skipif(fcntl is None, reason="lock files are only deleted where flock is available")
+def test_lock_file_is_removed_and_stale_handles_retry(tmp_path):
+    path = str(tmp_path / "locks" / "YouTube-abc.lock")
+    holder, waiter = FileLock(path), FileLock(path)
+    assert holder.try_acquire()
+    assert not waiter.try_acquire()
+    # Opened just before the holder releases and deletes it, then locked afterwards
+    fd = os.open(path, os.O_RDWR)
+    holder.release()
+    assert not os.path.exists(path)
+    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    assert not waiter._is_current(fd)
+    os.close(fd)
+
+    assert waiter.try_acquire()
+    assert not FileLock(path).try_acquire()
+    waiter.release()
+    assert os.listdir(tmp_path / "locks") == []
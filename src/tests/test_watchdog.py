@@ -0,0 +1,44 @@
+import time
+import asyncio
+import logging
+from core import watchdog
+from core.watchdog import LoopWatchdog
+
+def block_the_loop(seconds: float):
+    time.sleep(seconds)
+
+def test_blocking_call_is_caught_with_its_stack_and_reported(tmp_path):
+    report = tmp_path / "loop_report.txt"
+    dog = LoopWatchdog(threshold=0.05, interval=0.01, report_path=str(report))
+    stalls = watchdog.loop_stalls.values.get((), 0)
+
+    async def scenario():
+        dog.start()
+        await asyncio.sleep(0.05)
+        block_the_loop(0.3)
+        # Let the heartbeat see the stall end and record how long it was
+        await asyncio.sleep(0.05)
+        dog.stop()
+    asyncio.run(scenario())
+
+    [(key, entry)] = dog.worst()
+    assert key.startswith("tests/test_watchdog.py:") and key.endswith(" in block_the_loop")
+    assert entry['count'] == 1
+    assert 0.2 <= entry['total'] == entry['max'] < 1
+    assert "block_the_loop(0.3)" in entry['stack']
+    assert watchdog.loop_stalls.values[()] == stalls + 1
+    assert dog.max_lag >= 0.2
+    # stop() flushes the offenders that haven't been written yet
+    assert key in report.read_text(encoding="utf-8")
+
+def test_slow_callback_warnings_are_aggregated():
+    dog = LoopWatchdog(threshold=0.1)
+    handler = watchdog._SlowCallbackHandler(dog)
+    for duration in (0.2, 0.5):
+        handler.emit(logging.makeLogRecord({'msg': "Executing %s took %.3f seconds", 'args': ("<Handle cb()>", duration)}))
+    handler.emit(logging.makeLogRecord({'msg': "Unrelated warning", 'args': ()}))
+
+    [(key, entry)] = dog.worst()
+    assert key == "callback <Handle cb()>"
+    assert (entry['count'], entry['max']) == (2, 0.5)
+    assert abs(entry['total'] - 0.7) < 1e-9